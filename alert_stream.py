@@ -0,0 +1,157 @@
+"""
+In-process broker for the Server-Sent Events alert stream
+The monitor publishes an event whenever it inserts an alert; dashboard
+connections wait on the broker instead of polling the database. When the
+monitor runs in other processes, one AlertTail per web process polls the
+alert table and publishes what they insert.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+class AlertEventBroker:
+    """
+    Fan-out of new-alert events to SSE subscribers
+    Events are kept in a bounded ring buffer so reconnecting clients can
+    resume from their Last-Event-ID. Event ids have the form
+    "{epoch}-{seq}-{alert_id}": seq orders events within this process and
+    alert_id lets a client resume against a restarted process via the DB.
+    """
+
+    def __init__(self, buffer_size=500):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._evicted_seq = 0
+        self._cond = threading.Condition()
+        self._stats = {'published': 0, 'subscribers': 0, 'connections': 0, 'resumes': 0, 'backfills': 0}
+
+    def publish(self, alert):
+        """Publish a newly inserted alert (dict with alert_id and facility_id)"""
+        with self._cond:
+            self._seq += 1
+            if len(self._events) == self._events.maxlen:
+                self._evicted_seq = self._events[0]['seq']
+            self._events.append({'seq': self._seq, 'id': f"{self.epoch}-{self._seq}-{alert['alert_id']}", 'alert': alert})
+            self._stats['published'] += 1
+            self._cond.notify_all()
+
+    def current_seq(self):
+        """Sequence number of the latest event"""
+        with self._cond:
+            return self._seq
+
+    def parse_event_id(self, event_id):
+        """
+        Interpret a Last-Event-ID
+        Returns ('seq', n) when it can be replayed from the buffer, ('alert', alert_id)
+        when the caller must backfill from the database, or None if unusable
+        """
+        try:
+            epoch, seq, alert_id = event_id.split('-')
+            seq, alert_id = int(seq), int(alert_id)
+        except (AttributeError, ValueError):
+            return None
+        with self._cond:
+            if epoch == self.epoch and seq >= self._evicted_seq:
+                return ('seq', seq)
+        return ('alert', alert_id)
+
+    def wait_for_events(self, after_seq, timeout):
+        """Block until events newer than after_seq exist or timeout; returns the events"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._seq <= after_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            return [event for event in self._events if event['seq'] > after_seq]
+
+    def track(self, name, amount=1):
+        """Adjust a connection counter"""
+        with self._cond:
+            self._stats[name] += amount
+
+    def get_stats(self):
+        """Return publish and subscriber counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['buffered'] = len(self._events)
+        return stats
+
+class AlertTail:
+    """
+    Publish alerts inserted by other processes (standalone monitors)
+    A background thread, started on first use, reads alerts past the last
+    id seen. The newest overlap ids are read again and deduplicated, so an
+    alert whose transaction commits slightly out of id order is not missed.
+    """
+
+    def __init__(self, fetch_latest_id, fetch_after, publish, interval=2.0, overlap=50):
+        self.fetch_latest_id = fetch_latest_id
+        self.fetch_after = fetch_after
+        self.publish = publish
+        self.interval = interval
+        self.overlap = overlap
+        self._start_id = None
+        self._last_id = None
+        self._published = set()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'polls': 0, 'published': 0, 'errors': 0}
+
+    def ensure_started(self):
+        """Start the polling thread if it is not running"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='alert-tail', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"⚠ Alert tail error: {e}")
+                with self._lock:
+                    self._stats['errors'] += 1
+            time.sleep(self.interval)
+
+    def poll(self):
+        """Publish alerts not seen yet"""
+        if self._last_id is None:
+            # Start from the current tail; earlier alerts are already in the lists
+            self._start_id = self._last_id = self.fetch_latest_id()
+            return
+        alerts = self.fetch_after(max(self._last_id - self.overlap, self._start_id))
+        fresh = [alert for alert in alerts if alert['alert_id'] not in self._published]
+        for alert in fresh:
+            self.publish(alert)
+            self._published.add(alert['alert_id'])
+        if alerts:
+            self._last_id = max(self._last_id, alerts[-1]['alert_id'])
+        self._published = {alert_id for alert_id in self._published if alert_id > self._last_id - self.overlap}
+        with self._lock:
+            self._stats['polls'] += 1
+            self._stats['published'] += len(fresh)
+
+    def get_stats(self):
+        """Return poll counters and the last alert id seen"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        stats['last_alert_id'] = self._last_id
+        return stats
+
+def format_sse(data, event=None, event_id=None):
+    """Encode one Server-Sent Events message"""
+    message = ''
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    if event is not None:
+        message += f"event: {event}\n"
+    message += f"data: {json.dumps(data, default=str)}\n\n"
+    return message
@@ -0,0 +1,127 @@
+"""
+Answer cache for chatbot questions
+Answers are keyed on the normalized question text. Optionally, when there
+is no exact match, a token-set (Jaccard) comparison against recently cached
+questions can reuse the answer to a near-identical rewording, but only when
+the words that differ are all filler words: a changed drug, number or
+negation always gets its own answer. The whole cache is dropped whenever
+the knowledge base is re-ingested.
+"""
+import re
+import threading
+from collections import OrderedDict
+from cache import TTLCache, MemoryCacheBackend
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return ' '.join(re.findall(r'[a-z0-9]+', question.lower()))
+
+# Words a rewording may add or drop without changing the question
+STOP_WORDS = frozenset("""
+a an the this that these those is are was were be been being am do does did
+i me my we our you your he she it its they them their his her
+of to in on at for by with from about into as and or so if then than
+what which who whom whose when where how please can could would should will shall may might
+tell give show explain describe know let us patient patients s
+""".split())
+# Never ignored, even where they would otherwise count as filler
+NEGATIONS = frozenset("not no never nor none neither without cannot cant dont doesnt didnt isnt arent wasnt "
+                      "werent shouldnt wouldnt couldnt wont avoid stop t n".split())
+
+def is_filler_difference(tokens_a, tokens_b):
+    """True when the words in only one of the questions are all stop words (no negations or digits)"""
+    for token in tokens_a ^ tokens_b:
+        if token in NEGATIONS or any(char.isdigit() for char in token) or token not in STOP_WORDS:
+            return False
+    return True
+
+def token_similarity(tokens_a, tokens_b):
+    """Jaccard similarity of two token sets"""
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+class AnswerCache:
+    """
+    TTL/LRU answer cache with a similarity fallback
+    similarity_threshold of 0 (the default) disables the fallback (exact
+    matches only).
+    """
+
+    def __init__(self, max_entries=500, ttl=3600, similarity_threshold=0):
+        self.cache = TTLCache(MemoryCacheBackend(max_entries), ttl)
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._tokens = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'exact_hits': 0, 'similar_hits': 0, 'stale_puts': 0}
+
+    def generation(self):
+        """Current generation; pass it back to put() so answers computed before an invalidation are dropped"""
+        with self._lock:
+            return self._generation
+
+    def _find_similar(self, tokens):
+        """Most similar cached question at or above the threshold"""
+        best, best_score = None, self.similarity_threshold
+        with self._lock:
+            candidates = list(self._tokens.items())
+        for normalized, cached_tokens in candidates:
+            if not is_filler_difference(tokens, cached_tokens):
+                continue
+            score = token_similarity(tokens, cached_tokens)
+            if score >= best_score:
+                best, best_score = normalized, score
+        return best
+
+    def get(self, question):
+        """Return the cached answer for a question, or None"""
+        normalized = normalize_question(question)
+        answer = self.cache.get(normalized)
+        if answer is not None:
+            with self._lock:
+                self._stats['exact_hits'] += 1
+            return answer
+        if self.similarity_threshold <= 0:
+            return None
+
+        similar = self._find_similar(set(normalized.split()))
+        if similar is None:
+            return None
+        answer = self.cache.get(similar)
+        with self._lock:
+            if answer is None:
+                # Expired or evicted; stop comparing against it
+                self._tokens.pop(similar, None)
+            else:
+                self._stats['similar_hits'] += 1
+        return answer
+
+    def put(self, question, answer, generation):
+        """Cache an answer unless the knowledge base changed since generation"""
+        normalized = normalize_question(question)
+        with self._lock:
+            if generation != self._generation:
+                self._stats['stale_puts'] += 1
+                return
+            self._tokens[normalized] = set(normalized.split())
+            self._tokens.move_to_end(normalized)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+            self.cache.set(normalized, answer)
+
+    def invalidate(self):
+        """Drop every cached answer (knowledge base contents changed)"""
+        with self._lock:
+            self._generation += 1
+            self._tokens.clear()
+            self.cache.clear()
+
+    def get_stats(self):
+        """Return hit counters and cache size"""
+        stats = self.cache.get_stats()
+        with self._lock:
+            stats.update(self._stats)
+            stats['generation'] = self._generation
+        return stats
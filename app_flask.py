@@ -1,17 +1,32 @@
 """
 Care Co-Ordinator Dashboard - Flask Application
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
 import os
+import hmac
 import threading
 import time
-import boto3
 import json
 import pymysql
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from utils import get_admin_activities, log_admin_activity, get_recommendation_from_s3, send_email_ses
+from utils import (get_admin_activities, log_admin_activity, get_recommendation_from_s3, save_recommendation_to_s3,
+                   email_dispatcher, activity_queue, recommendation_cache)
+from clinical_rules import screen_patient_data, summarize_findings
+from cache import make_cache, content_key, TTLCache, MemoryCacheBackend
+from alert_stream import AlertEventBroker, AlertTail, format_sse
+from aws_clients import aws_clients, get_client
+from kb_ingestion import KnowledgeBaseIngestion, spool_upload
+from answer_cache import AnswerCache
+from chat_stream import make_answer_streamer
+from monitor_lease import ShardLeaseManager, shard_filter
+from eval_queue import EvaluationQueue
+from change_feed import ChangeFeed
+from clinical_ingest import ClinicalIngester, open_text_stream
+from job_status import JobStatusStore
 from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 
 load_dotenv()
 
@@ -19,13 +34,40 @@ app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-change-in-production')
 
 # Initialize AWS clients
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.getenv('AWS_REGION', 'us-east-1'))
-s3_client = boto3.client('s3', region_name=os.getenv('AWS_REGION', 'us-east-1'))
+bedrock_runtime = get_client('bedrock-runtime')
+s3_client = get_client('s3')
+
+# Skip Bedrock for patients whose vitals and labs are all within normal ranges
+RULES_PRESCREEN_ENABLED = os.getenv('RULES_PRESCREEN', 'true').lower() == 'true'
+
+# Cache for Bedrock analysis/recommendation results keyed on prompt + patient data
+bedrock_cache = make_cache(
+    os.getenv('BEDROCK_CACHE_BACKEND', 'memory'),
+    ttl=int(os.getenv('BEDROCK_CACHE_TTL', '86400')),
+    max_entries=int(os.getenv('BEDROCK_CACHE_MAX_ENTRIES', '1000')),
+    path=os.getenv('BEDROCK_CACHE_PATH', 'cache/bedrock_cache.sqlite3')
+)
+
+# Server-Sent Events alert stream
+alert_broker = AlertEventBroker(int(os.getenv('SSE_BUFFER_SIZE', '500')))
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', '5000'))
+# Each open stream holds a worker thread; streams end after this long and
+# EventSource reconnects with Last-Event-ID, so idle tabs release their thread
+SSE_MAX_STREAM_SECONDS = int(os.getenv('SSE_MAX_STREAM_SECONDS', '300'))
+# MONITOR_EMBEDDED=false: alerts are inserted by monitor.py processes, so each
+# web process tails the alert table to feed its stream and alert cache
+MONITOR_EMBEDDED = os.getenv('MONITOR_EMBEDDED', 'true').lower() == 'true'
+ALERT_TAIL_SECONDS = float(os.getenv('ALERT_TAIL_SECONDS', '2'))
 
 class DatabaseClient:
     """
     Database client for MySQL database operations
     Provides consistent database access across the application
+
+    Connections are kept in a bounded pool shared by the Flask request
+    threads and the background monitoring thread. Idle connections are
+    health-checked before reuse and evicted once they exceed the max idle time.
     """
     
     def __init__(self):
@@ -34,43 +76,237 @@ class DatabaseClient:
         self.user = os.getenv('RDS_USER')
         self.password = os.getenv('RDS_PASS')
         self.database = os.getenv('RDS_DB')
+        
+        # Pool configuration
+        self.pool_size = int(os.getenv('DB_POOL_SIZE', '10'))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+        self.pool_max_idle = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+        self.pool_ping_interval = float(os.getenv('DB_POOL_PING_INTERVAL', '30'))
+        
+        # Idle connections as (connection, last_used) pairs, most recently used last
+        self._idle = []
+        self._in_use = 0
+        self._lock = threading.Condition(threading.Lock())
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'evicted_idle': 0,
+            'failed_health_checks': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0
+        }
+    
+    def connect_dedicated(self):
+        """Open a connection outside the pool, for session state such as named locks"""
+        return self._connect()
+    
+    def _connect(self):
+        """Open a new database connection"""
+        # autocommit keeps pooled connections from holding a stale
+        # REPEATABLE READ snapshot between queries
+        conn = pymysql.connect(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            cursorclass=pymysql.cursors.DictCursor,
+            connect_timeout=10,
+            autocommit=True
+        )
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+    
+    def _close(self, conn):
+        """Close a connection, ignoring errors from already broken sockets"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._stats['closed'] += 1
+    
+    def _is_healthy(self, conn, last_used):
+        """Ping connections that have been idle long enough to have gone stale"""
+        if time.monotonic() - last_used < self.pool_ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._lock:
+                self._stats['failed_health_checks'] += 1
+            return False
+    
+    def _evict_idle(self):
+        """Drop idle connections past max idle time (caller holds the lock)"""
+        now = time.monotonic()
+        expired = [item for item in self._idle if now - item[1] > self.pool_max_idle]
+        if expired:
+            self._idle = [item for item in self._idle if now - item[1] <= self.pool_max_idle]
+            self._stats['evicted_idle'] += len(expired)
+        return [conn for conn, _ in expired]
+    
+    def acquire(self):
+        """
+        Check a connection out of the pool
+        Blocks up to DB_POOL_TIMEOUT seconds when the pool is exhausted
+        """
+        start = time.monotonic()
+        deadline = start + self.pool_timeout
+        waited = False
+        
+        while True:
+            with self._lock:
+                expired = self._evict_idle()
+                candidate = None
+                if self._idle:
+                    candidate = self._idle.pop()
+                    self._in_use += 1
+                elif self._in_use < self.pool_size:
+                    self._in_use += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise TimeoutError(f"Timed out waiting {self.pool_timeout}s for a database connection")
+                    waited = True
+                    self._lock.wait(remaining)
+                    continue
+            
+            for conn in expired:
+                self._close(conn)
+            
+            try:
+                if candidate:
+                    conn, last_used = candidate
+                    if not self._is_healthy(conn, last_used):
+                        self._close(conn)
+                        conn = self._connect()
+                else:
+                    conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+            
+            wait_ms = (time.monotonic() - start) * 1000
+            with self._lock:
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                self._stats['total_wait_ms'] += wait_ms
+                self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+            return conn
+    
+    def _release_slot(self):
+        """Free a checked-out slot without returning a connection"""
+        with self._lock:
+            self._in_use -= 1
+            self._lock.notify()
+    
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if it is no longer usable"""
+        if discard or not conn.open:
+            self._close(conn)
+            self._release_slot()
+            return
+        with self._lock:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+    
+    @contextmanager
+    def connection(self):
+        """Context manager that checks out a pooled connection"""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        except Exception:
+            # Leave no half-finished transaction behind on a reused connection
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+    
+    @contextmanager
+    def transaction(self):
+        """Context manager that runs its statements in one transaction on a pooled connection"""
+        with self.connection() as conn:
+            conn.begin()
+            yield conn
+            conn.commit()
+    
+    def close_all(self):
+        """Close every idle connection in the pool"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+    
+    def get_pool_stats(self):
+        """Return pool size and wait-time metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pool_size'] = self.pool_size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._in_use
+        checkouts = stats['checkouts']
+        stats['avg_wait_ms'] = round(stats['total_wait_ms'] / checkouts, 3) if checkouts else 0.0
+        stats['total_wait_ms'] = round(stats['total_wait_ms'], 3)
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+        return stats
     
     def execute_query(self, sql, params=None):
         """
         Execute SQL query with optional parameters
         Returns list of dicts for SELECT, True for other queries
         """
-        conn = None
         try:
-            conn = pymysql.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                cursorclass=pymysql.cursors.DictCursor,
-                connect_timeout=10
-            )
-            
-            with conn.cursor() as cursor:
-                if params:
-                    cursor.execute(sql, params)
-                else:
-                    cursor.execute(sql)
-                
-                if sql.strip().upper().startswith('SELECT'):
-                    results = cursor.fetchall()
-                    return list(results) if results else []
-                else:
-                    conn.commit()
-                    return True
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    if params:
+                        cursor.execute(sql, params)
+                    else:
+                        cursor.execute(sql)
+                    
+                    if sql.strip().upper().startswith('SELECT'):
+                        results = cursor.fetchall()
+                        return list(results) if results else []
+                    else:
+                        conn.commit()
+                        return True
                     
         except Exception as e:
             print(f"Database error: {e}")
             return None
-        finally:
-            if conn:
-                conn.close()
+    
+    def fetch_all_on(self, conn, sql, params=None):
+        """Fetch all rows using an already checked-out connection"""
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return list(cursor.fetchall())
+    
+    def execute_on(self, conn, sql, params=None):
+        """Execute a write using an already checked-out connection, returns the cursor's lastrowid"""
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.lastrowid
+    
+    def fetch_one_on(self, conn, sql, params=None):
+        """Fetch one row using an already checked-out connection"""
+        rows = self.fetch_all_on(conn, sql, params)
+        return rows[0] if rows else None
     
     def fetch_one(self, sql, params=None):
         """Fetch one row"""
@@ -85,6 +321,10 @@ class DatabaseClient:
 # Database client instance
 db = DatabaseClient()
 
+# Email and upload job status shared across web workers
+job_status = JobStatusStore(db, ttl=int(os.getenv('JOB_STATUS_TTL', '86400')))
+email_dispatcher.status_store = job_status
+
 def login_required(f):
     """Decorator to require login"""
     @wraps(f)
@@ -148,64 +388,262 @@ def get_facilities():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
-@app.route('/api/alerts')
-@login_required
-def get_alerts():
-    """Get alerts with optional facility filter"""
-    try:
-        facility_ids = request.args.get('facilities', '')
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 6))
-        
-        # If facility_ids is empty string, return no alerts (user unchecked all)
-        if facility_ids == '':
-            all_alerts = []
-        elif facility_ids:
-            # Specific facilities selected
-            query = f"""
-            SELECT a.alert_id, a.patient_id, a.alert_type, a.alert_date_time, a.facility_id,
-                   p.patient_first_name, p.patient_last_name, f.facility_name
-            FROM alert a
-            JOIN patient p ON a.patient_id = p.patient_id
-            JOIN facility f ON a.facility_id = f.facility_id
-            WHERE a.facility_id IN ({facility_ids}) AND a.alert_archive = 0
-            ORDER BY a.alert_date_time DESC
-            """
-            all_alerts = db.fetch_all(query)
-        else:
-            # No filter parameter provided (shouldn't happen, but default to all)
-            query = """
+ALERT_CURSOR_FORMAT = '%Y%m%d%H%M%S'
+
+def parse_facility_ids(facility_ids):
+    """Parse the comma-separated facilities query parameter into a list of ints"""
+    return [int(fid) for fid in facility_ids.split(',') if fid.strip()]
+
+def encode_alert_cursor(alert):
+    """Build a keyset cursor from the (alert_date_time, alert_id) of the last row on a page"""
+    return f"{alert['alert_date_time'].strftime(ALERT_CURSOR_FORMAT)}-{alert['alert_id']}"
+
+def decode_alert_cursor(cursor):
+    """Split a keyset cursor back into (alert_date_time, alert_id)"""
+    timestamp, alert_id = cursor.split('-', 1)
+    return datetime.strptime(timestamp, ALERT_CURSOR_FORMAT), int(alert_id)
+
+def fetch_alert_page(archived, facility_ids, page, per_page, cursor=None):
+    """
+    Fetch one page of alerts with the filtering, ordering and limit done in MySQL
+    facility_ids=None means no facility filter. When a cursor is given the page
+    is read with a keyset seek on (alert_date_time, alert_id) instead of OFFSET.
+    Returns (alerts, total, next_cursor); database errors are raised, not
+    turned into an empty page, so they never end up in the alert cache
+    """
+    where = ["a.alert_archive = %s"]
+    params = [1 if archived else 0]
+    if facility_ids is not None:
+        where.append(f"a.facility_id IN ({', '.join(['%s'] * len(facility_ids))})")
+        params.extend(facility_ids)
+    else:
+        # Mirrors the inner join on facility in the list query
+        where.append("a.facility_id IS NOT NULL")
+    
+    count_sql = f"SELECT COUNT(*) AS total FROM alert a WHERE {' AND '.join(where)}"
+    
+    page_params = list(params)
+    if cursor:
+        cursor_time, cursor_id = decode_alert_cursor(cursor)
+        where.append("(a.alert_date_time < %s OR (a.alert_date_time = %s AND a.alert_id < %s))")
+        page_params.extend([cursor_time, cursor_time, cursor_id])
+        limit_clause = "LIMIT %s"
+        page_params.append(per_page + 1)
+    else:
+        limit_clause = "LIMIT %s OFFSET %s"
+        page_params.extend([per_page + 1, (page - 1) * per_page])
+    
+    with db.connection() as conn:
+        # Cheap count path - index-only scan, no joins
+        count_row = db.fetch_one_on(conn, count_sql, params)
+        total = count_row['total'] if count_row else 0
+        rows = db.fetch_all_on(conn, f"""
             SELECT a.alert_id, a.patient_id, a.alert_type, a.alert_date_time, a.facility_id,
                    p.patient_first_name, p.patient_last_name, f.facility_name
             FROM alert a
             JOIN patient p ON a.patient_id = p.patient_id
             JOIN facility f ON a.facility_id = f.facility_id
-            WHERE a.alert_archive = 0
-            ORDER BY a.alert_date_time DESC
-            """
-            all_alerts = db.fetch_all(query)
-        
-        # Convert datetime to string
-        for alert in all_alerts:
-            if isinstance(alert['alert_date_time'], datetime):
-                if alert['alert_date_time'].date() == datetime.now().date():
-                    alert['alert_date_time'] = alert['alert_date_time'].strftime('Today, %I:%M %p')
-                else:
-                    alert['alert_date_time'] = alert['alert_date_time'].strftime('%Y-%m-%d, %I:%M %p')
-        
-        # Pagination
-        total = len(all_alerts)
-        start = (page - 1) * per_page
-        end = start + per_page
-        alerts = all_alerts[start:end]
-        
+            WHERE {' AND '.join(where)}
+            ORDER BY a.alert_date_time DESC, a.alert_id DESC
+            {limit_clause}
+        """, page_params)
+    
+    # One extra row tells us whether another page exists
+    alerts = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page and isinstance(alerts[-1]['alert_date_time'], datetime):
+        next_cursor = encode_alert_cursor(alerts[-1])
+    
+    # Convert datetime to string (only for the rows being returned)
+    today = datetime.now().date()
+    for alert in alerts:
+        if isinstance(alert['alert_date_time'], datetime):
+            if alert['alert_date_time'].date() == today:
+                alert['alert_date_time'] = alert['alert_date_time'].strftime('Today, %I:%M %p')
+            else:
+                alert['alert_date_time'] = alert['alert_date_time'].strftime('%Y-%m-%d, %I:%M %p')
+    
+    return alerts, total, next_cursor
+
+class AlertQueryCache:
+    """
+    Cache for alert list pages and the recent-alert count
+    Keys embed a generation number per (archived flag, facility). Inserting
+    or archiving an alert bumps the generations for its facility, so only
+    result sets that include that facility miss on the next read; entries
+    also expire after the TTL as a fallback.
+    """
+    
+    def __init__(self, ttl, max_entries):
+        self.cache = TTLCache(MemoryCacheBackend(max_entries), ttl)
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._recent_generation = 0
+    
+    def _page_key(self, archived, facility_ids, *extra):
+        """Key for a list page, tied to the current generation of every facility in it"""
+        facility_ids = sorted(facility_ids)
+        with self._lock:
+            generations = [self._generations.get((archived, fid), 0) for fid in facility_ids]
+        return content_key('alerts', archived, facility_ids, generations, *extra)
+    
+    def get_page(self, archived, facility_ids, page, per_page, cursor):
+        """Cached fetch_alert_page; a failed query raises and is not cached"""
+        key = self._page_key(archived, facility_ids, page, per_page, cursor)
+        result = self.cache.get(key)
+        if result is None:
+            result = fetch_alert_page(archived, facility_ids, page, per_page, cursor)
+            self.cache.set(key, result)
+        return result
+    
+    def get_recent_alert_times(self, cutoff):
+        """Creation times of active alerts since cutoff; cached until the next insert/archive"""
+        with self._lock:
+            key = f"recent:{self._recent_generation}"
+        times = self.cache.get(key)
+        if times is None:
+            with db.connection() as conn:
+                rows = db.fetch_all_on(
+                    conn,
+                    "SELECT alert_date_time FROM alert WHERE alert_date_time >= %s AND alert_archive = 0",
+                    (cutoff,)
+                )
+            times = [row['alert_date_time'] for row in rows]
+            self.cache.set(key, times)
+        return [t for t in times if isinstance(t, datetime) and t >= cutoff]
+    
+    def invalidate(self, facility_id, archived_states=(False,)):
+        """Invalidate result sets touching facility_id (all facilities when None)"""
+        with self._lock:
+            self._recent_generation += 1
+            if facility_id is None:
+                self._generations.clear()
+                self.cache.clear()
+                return
+            for archived in archived_states:
+                key = (archived, facility_id)
+                self._generations[key] = self._generations.get(key, 0) + 1
+    
+    def get_stats(self):
+        """Hit-rate stats"""
+        return self.cache.get_stats()
+
+# Alert list/count cache, invalidated on alert insert and archive
+alert_cache = AlertQueryCache(
+    ttl=int(os.getenv('ALERT_CACHE_TTL', '60')),
+    max_entries=int(os.getenv('ALERT_CACHE_MAX_ENTRIES', '500'))
+)
+
+# Archiving happens in whichever web worker served the request. It records a
+# marker in job_status; every worker compares it before reading its alert
+# cache and drops the cached lists when another archive has happened.
+ALERT_ARCHIVE_UNCHECKED = object()
+_seen_alert_archive = ALERT_ARCHIVE_UNCHECKED
+
+def on_alert_archived(alert_id, facility_id):
+    """Drop this worker's lists for the facility and tell the other workers"""
+    alert_cache.invalidate(facility_id, archived_states=(False, True))
+    job_status.save('alert_archive', 'latest', {
+        'alert_id': alert_id, 'facility_id': facility_id, 'archived_at': time.time()
+    })
+
+def sync_alert_cache():
+    """Invalidate cached alert lists if an alert was archived since the last check"""
+    global _seen_alert_archive
+    marker = job_status.load('alert_archive', 'latest')
+    # The first check only records the marker; nothing is cached before it.
+    # Several archives may land between checks, so any change clears everything.
+    if _seen_alert_archive is not ALERT_ARCHIVE_UNCHECKED and marker != _seen_alert_archive:
+        alert_cache.invalidate(None)
+    _seen_alert_archive = marker
+
+def announce_alert(alert):
+    """Refresh cached alert lists for the alert's facility and push it to connected dashboards"""
+    alert_cache.invalidate(alert['facility_id'])
+    alert_broker.publish(alert)
+
+def fetch_alerts_after(alert_id):
+    """Active alerts with ids past alert_id, in id order, shaped like stream events"""
+    alerts = db.fetch_all("""
+        SELECT alert_id, patient_id, facility_id, alert_type, alert_date_time
+        FROM alert
+        WHERE alert_id > %s AND alert_archive = 0
+        ORDER BY alert_id
+        LIMIT 500
+    """, (alert_id,))
+    return format_datetime_column(alerts, 'alert_date_time')
+
+def fetch_latest_alert_id():
+    """Highest alert id, or None if the database is unreachable"""
+    row = db.fetch_one("SELECT COALESCE(MAX(alert_id), 0) AS alert_id FROM alert")
+    return row['alert_id'] if row else None
+
+alert_tail = AlertTail(fetch_latest_alert_id, fetch_alerts_after, announce_alert, interval=ALERT_TAIL_SECONDS)
+
+def follow_external_alerts():
+    """Start tailing the alert table when monitors run in other processes"""
+    if not MONITOR_EMBEDDED:
+        alert_tail.ensure_started()
+
+def alert_page_response(archived):
+    """Build the paginated JSON response shared by the active and archived alert lists"""
+    follow_external_alerts()
+    sync_alert_cache()
+    facility_ids = request.args.get('facilities', '')
+    page = max(int(request.args.get('page', 1)), 1)
+    per_page = min(max(int(request.args.get('per_page', 6)), 1), 100)
+    cursor = request.args.get('cursor') or None
+    
+    # If facility_ids is empty, return no alerts (user unchecked all)
+    parsed_ids = parse_facility_ids(facility_ids)
+    if not parsed_ids:
+        alerts, total, next_cursor = [], 0, None
+    else:
+        alerts, total, next_cursor = alert_cache.get_page(archived, parsed_ids, page, per_page, cursor)
+    
+    return jsonify({
+        'success': True,
+        'alerts': alerts,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': (total + per_page - 1) // per_page,
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/alerts')
+@login_required
+def get_alerts():
+    """Get alerts with optional facility filter"""
+    try:
+        return alert_page_response(archived=False)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/metrics')
+@login_required
+def get_metrics():
+    """Get runtime metrics for the database pool, monitor, caches, queues and alert stream"""
+    try:
         return jsonify({
             'success': True,
-            'alerts': alerts,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            'database': db.get_pool_stats(),
+            'monitor': evaluation_pool.get_stats(),
+            'monitor_leases': monitor_leases.get_stats(),
+            'eval_queue': eval_queue.get_stats(),
+            'change_feed': change_feed.get_stats(),
+            'ingest': clinical_ingester.get_stats(),
+            'bedrock_cache': bedrock_cache.get_stats() if bedrock_cache else None,
+            'alert_cache': alert_cache.get_stats(),
+            'recommendation_cache': recommendation_cache.get_stats() if recommendation_cache else None,
+            'aws_clients': aws_clients.get_stats(),
+            'kb_ingestion': kb_ingestion.get_stats(),
+            'answer_cache': answer_cache.get_stats(),
+            'activity_queue': activity_queue.get_stats(),
+            'email_dispatch': email_dispatcher.get_stats(),
+            'alert_stream': alert_broker.get_stats(),
+            'alert_tail': alert_tail.get_stats() if not MONITOR_EMBEDDED else None,
+            'job_status': job_status.get_stats()
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -221,31 +659,66 @@ def get_activities():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+# Queries shared by the single-resource endpoints and the alert bundle
+PATIENT_DETAILS_SQL = """
+    SELECT p.*, f.facility_name, f.facility_email,
+           ph.physician_first_name, ph.physician_last_name, ph.physician_email
+    FROM patient p
+    LEFT JOIN facility f ON p.facility_id = f.facility_id
+    LEFT JOIN physician ph ON p.physician_id = ph.physician_id
+    WHERE p.patient_id = %s
+"""
+ALERT_DETAILS_SQL = "SELECT * FROM alert WHERE alert_id = %s"
+RECENT_VITALS_SQL = """
+    SELECT * FROM vitals_data 
+    WHERE patient_id = %s
+    ORDER BY vitals_date_time DESC 
+    LIMIT 10
+"""
+RECENT_MEDICATIONS_SQL = """
+    SELECT * FROM medication 
+    WHERE patient_id = %s
+    ORDER BY medication_date_time DESC 
+    LIMIT 10
+"""
+RECENT_LABS_SQL = """
+    SELECT * FROM lab_result 
+    WHERE patient_id = %s
+    ORDER BY lab_date_time DESC 
+    LIMIT 10
+"""
+
+# Thread pool for I/O (S3) that runs alongside database work in a request
+io_executor = ThreadPoolExecutor(max_workers=int(os.getenv('IO_WORKERS', '8')), thread_name_prefix='io')
+
+def format_patient(patient):
+    """Convert patient dates to display strings and add the age"""
+    if patient.get('patient_dob'):
+        patient['patient_dob'] = patient['patient_dob'].strftime('%m/%d/%Y')
+        patient['patient_age'] = datetime.now().year - datetime.strptime(patient['patient_dob'], '%m/%d/%Y').year
+    if patient.get('patient_admission_date'):
+        patient['patient_admission_date'] = patient['patient_admission_date'].strftime('%m/%d/%Y')
+    return patient
+
+def format_datetime_column(rows, key):
+    """Convert one datetime column to display strings in place"""
+    for row in rows:
+        if isinstance(row.get(key), datetime):
+            row[key] = row[key].strftime('%Y-%m-%d %I:%M %p')
+    return rows
+
 @app.route('/api/patient/<int:patient_id>')
 @login_required
 def get_patient_details(patient_id):
     """Get patient details"""
     try:
-        patient = db.fetch_one(f"""
-            SELECT p.*, f.facility_name, f.facility_email,
-                   ph.physician_first_name, ph.physician_last_name, ph.physician_email
-            FROM patient p
-            LEFT JOIN facility f ON p.facility_id = f.facility_id
-            LEFT JOIN physician ph ON p.physician_id = ph.physician_id
-            WHERE p.patient_id = {patient_id}
-        """)
+        patient = db.fetch_one(PATIENT_DETAILS_SQL, (patient_id,))
         
         if not patient:
             return jsonify({'success': False, 'message': 'Patient not found'})
         
         # Convert date to string
-        if patient.get('patient_dob'):
-            patient['patient_dob'] = patient['patient_dob'].strftime('%m/%d/%Y')
-            patient['patient_age'] = datetime.now().year - datetime.strptime(patient['patient_dob'], '%m/%d/%Y').year
-        if patient.get('patient_admission_date'):
-            patient['patient_admission_date'] = patient['patient_admission_date'].strftime('%m/%d/%Y')
-        
-        return jsonify({'success': True, 'patient': patient})
+        return jsonify({'success': True, 'patient': format_patient(patient)})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -254,19 +727,55 @@ def get_patient_details(patient_id):
 def get_alert_details(alert_id):
     """Get alert details"""
     try:
-        alert = db.fetch_one(f"SELECT * FROM alert WHERE alert_id = {alert_id}")
+        alert = db.fetch_one(ALERT_DETAILS_SQL, (alert_id,))
         
         if not alert:
             return jsonify({'success': False, 'message': 'Alert not found'})
         
         # Convert datetime to string
-        if isinstance(alert.get('alert_date_time'), datetime):
-            alert['alert_date_time'] = alert['alert_date_time'].strftime('%Y-%m-%d %I:%M %p')
+        format_datetime_column([alert], 'alert_date_time')
         
         return jsonify({'success': True, 'alert': alert})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+# Only a present column is remembered for good; a missing one is looked up
+# again after RECOMMENDATION_KEY_RECHECK_SECONDS, so running the migration
+# takes effect without restarting
+RECOMMENDATION_KEY_RECHECK_SECONDS = int(os.getenv('RECOMMENDATION_KEY_RECHECK_SECONDS', '60'))
+_recommendation_key_column = False
+_recommendation_key_missing_until = 0
+
+def has_recommendation_key_column():
+    """
+    Whether alert.recommendation_key exists (None if the database is unreachable)
+    Databases that have not run migrate_recommendation_keys.py lack it.
+    """
+    global _recommendation_key_column, _recommendation_key_missing_until
+    if _recommendation_key_column:
+        return True
+    if time.monotonic() < _recommendation_key_missing_until:
+        return False
+    columns = db.execute_query("""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'alert' AND COLUMN_NAME = 'recommendation_key'
+    """)
+    if columns is None:
+        return None
+    if columns:
+        _recommendation_key_column = True
+        return True
+    if not _recommendation_key_missing_until:
+        print("⚠ alert.recommendation_key is missing - run migrate_recommendation_keys.py; "
+              "looking recommendations up by filename until then")
+    _recommendation_key_missing_until = time.monotonic() + RECOMMENDATION_KEY_RECHECK_SECONDS
+    return False
+
+def alert_recommendation_sql():
+    """Query for an alert's patient_id and S3 key; the key is NULL (filename lookup) without the column"""
+    key_column = 'recommendation_key' if has_recommendation_key_column() else 'NULL AS recommendation_key'
+    return f"SELECT patient_id, {key_column} FROM alert WHERE alert_id = %s"
+
 @app.route('/api/recommendation/<int:alert_id>')
 @login_required
 def get_recommendation(alert_id):
@@ -274,29 +783,17 @@ def get_recommendation(alert_id):
     try:
         print(f"Fetching recommendation for alert_id: {alert_id}")
         
-        # Get patient_id from database
-        alert = db.fetch_one(f"SELECT patient_id FROM alert WHERE alert_id = {alert_id}")
-        patient_id = alert.get('patient_id') if alert else None
+        # Get patient_id and the resolved S3 key from database
+        alert = db.fetch_one(alert_recommendation_sql(), (alert_id,))
+        if not alert:
+            return jsonify({'success': False, 'message': 'Alert not found'})
         
-        recommendation = get_recommendation_from_s3(alert_id, patient_id)
+        recommendation = get_recommendation_from_s3(alert_id, alert['patient_id'], alert['recommendation_key'])
         if recommendation:
             print(f"✓ Recommendation found for alert {alert_id}")
             return jsonify({'success': True, 'recommendation': recommendation})
         else:
             print(f"⚠ Recommendation not found for alert {alert_id}")
-            # List available files in S3 for debugging
-            try:
-                s3_client = boto3.client('s3', region_name=os.getenv('AWS_REGION', 'us-east-1'))
-                bucket = os.getenv('RECOMMENDATION_BUCKET_NAME')
-                response = s3_client.list_objects_v2(Bucket=bucket, Prefix=str(alert_id))
-                if 'Contents' in response:
-                    files = [obj['Key'] for obj in response['Contents']]
-                    print(f"  Available files with prefix {alert_id}: {files}")
-                else:
-                    print(f"  No files found with prefix {alert_id}")
-            except Exception as list_error:
-                print(f"  Error listing S3 files: {list_error}")
-            
             return jsonify({'success': False, 'message': f'Recommendation not found for alert {alert_id}'})
     except Exception as e:
         print(f"❌ Error fetching recommendation: {e}")
@@ -307,17 +804,10 @@ def get_recommendation(alert_id):
 def get_vitals(patient_id):
     """Get patient vitals"""
     try:
-        vitals = db.fetch_all(f"""
-            SELECT * FROM vitals_data 
-            WHERE patient_id = {patient_id}
-            ORDER BY vitals_date_time DESC 
-            LIMIT 10
-        """)
+        vitals = db.fetch_all(RECENT_VITALS_SQL, (patient_id,))
         
         # Convert datetime to string
-        for vital in vitals:
-            if isinstance(vital.get('vitals_date_time'), datetime):
-                vital['vitals_date_time'] = vital['vitals_date_time'].strftime('%Y-%m-%d %I:%M %p')
+        format_datetime_column(vitals, 'vitals_date_time')
         
         return jsonify({'success': True, 'vitals': vitals})
     except Exception as e:
@@ -328,17 +818,10 @@ def get_vitals(patient_id):
 def get_medications(patient_id):
     """Get patient medications"""
     try:
-        medications = db.fetch_all(f"""
-            SELECT * FROM medication 
-            WHERE patient_id = {patient_id}
-            ORDER BY medication_date_time DESC 
-            LIMIT 10
-        """)
+        medications = db.fetch_all(RECENT_MEDICATIONS_SQL, (patient_id,))
         
         # Convert datetime to string
-        for med in medications:
-            if isinstance(med.get('medication_date_time'), datetime):
-                med['medication_date_time'] = med['medication_date_time'].strftime('%Y-%m-%d %I:%M %p')
+        format_datetime_column(medications, 'medication_date_time')
         
         return jsonify({'success': True, 'medications': medications})
     except Exception as e:
@@ -349,26 +832,79 @@ def get_medications(patient_id):
 def get_labs(patient_id):
     """Get patient lab results"""
     try:
-        labs = db.fetch_all(f"""
-            SELECT * FROM lab_result 
-            WHERE patient_id = {patient_id}
-            ORDER BY lab_date_time DESC 
-            LIMIT 10
-        """)
+        labs = db.fetch_all(RECENT_LABS_SQL, (patient_id,))
         
         # Convert datetime to string
-        for lab in labs:
-            if isinstance(lab.get('lab_date_time'), datetime):
-                lab['lab_date_time'] = lab['lab_date_time'].strftime('%Y-%m-%d %I:%M %p')
+        format_datetime_column(labs, 'lab_date_time')
         
         return jsonify({'success': True, 'labs': labs})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/alert/<int:alert_id>/bundle')
+@login_required
+def get_alert_bundle(alert_id):
+    """
+    Get everything the resident view needs for an alert in one call
+    All database queries share one pooled connection while the S3
+    recommendation fetch runs concurrently on the I/O pool.
+    """
+    try:
+        recommendation_future = None
+        with db.connection() as conn:
+            alert = db.fetch_one_on(conn, ALERT_DETAILS_SQL, (alert_id,))
+            if not alert:
+                return jsonify({'success': False, 'message': 'Alert not found'})
+            patient_id = alert['patient_id']
+            
+            recommendation_future = io_executor.submit(
+                get_recommendation_from_s3, alert_id, patient_id, alert.get('recommendation_key'))
+            
+            patient = db.fetch_one_on(conn, PATIENT_DETAILS_SQL, (patient_id,))
+            vitals = db.fetch_all_on(conn, RECENT_VITALS_SQL, (patient_id,))
+            medications = db.fetch_all_on(conn, RECENT_MEDICATIONS_SQL, (patient_id,))
+            labs = db.fetch_all_on(conn, RECENT_LABS_SQL, (patient_id,))
+        
+        recommendation = recommendation_future.result()
+        
+        return jsonify({
+            'success': True,
+            'patient': format_patient(patient) if patient else None,
+            'alert': format_datetime_column([alert], 'alert_date_time')[0],
+            'recommendation': recommendation,
+            'vitals': format_datetime_column(vitals, 'vitals_date_time'),
+            'medications': format_datetime_column(medications, 'medication_date_time'),
+            'labs': format_datetime_column(labs, 'lab_date_time')
+        })
+    except Exception as e:
+        print(f"❌ Error loading alert bundle: {e}")
+        return jsonify({'success': False, 'message': str(e)})
+
+def email_attachments(data):
+    """Attachments for a send-email request: uploaded files plus, optionally, the alert's recommendation"""
+    attachments = [{
+        'filename': attachment['filename'],
+        'content': attachment['content_base64'],
+        'base64': True,
+        'content_type': attachment.get('content_type') or 'application/octet-stream'
+    } for attachment in data.get('attachments', [])]
+    
+    alert_id = data.get('alert_id')
+    if data.get('attach_recommendation') and alert_id:
+        alert = db.fetch_one(alert_recommendation_sql(), (alert_id,))
+        recommendation = get_recommendation_from_s3(alert_id, alert['patient_id'], alert['recommendation_key']) if alert else None
+        if recommendation:
+            attachments.append({
+                'filename': f"recommendation_alert_{alert_id}.txt",
+                'content': recommendation,
+                'content_type': 'text/plain'
+            })
+    return attachments
+
 @app.route('/api/send-email', methods=['POST'])
 @login_required
 def send_email():
-    """Send email to care team"""
+    """Queue an email to the care team"""
     try:
         data = request.get_json()
         recipients = data.get('recipients', [])
@@ -376,19 +912,53 @@ def send_email():
         message = data.get('message', '')
         patient_name = data.get('patient_name', '')
         
-        success, msg_id = send_email_ses(recipients, subject, message)
+        message_id = email_dispatcher.submit(recipients, subject, message, email_attachments(data))
         
-        if success:
-            # Log activity
-            admin_id = session.get('admin_id')
-            log_admin_activity(admin_id, f"You sent recommendation for {patient_name}")
-            
-            return jsonify({'success': True, 'message': 'Email sent successfully'})
-        else:
-            return jsonify({'success': False, 'message': f'Failed to send email: {msg_id}'})
+        # Log activity
+        admin_id = session.get('admin_id')
+        log_admin_activity(admin_id, f"You queued recommendation email for {patient_name}")
+        
+        return jsonify({'success': True, 'message': 'Email queued', 'message_id': message_id})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Failed to send email: {e}'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/send-email/bulk', methods=['POST'])
+@login_required
+def send_email_bulk():
+    """Queue several care team emails, e.g. one per facility"""
+    try:
+        data = request.get_json()
+        messages = [{
+            'recipients': item.get('recipients', []),
+            'subject': item.get('subject', ''),
+            'body': item.get('message', ''),
+            'attachments': email_attachments(item)
+        } for item in data.get('messages', [])]
+        if not messages:
+            return jsonify({'success': False, 'message': 'No messages provided'})
+        
+        message_ids = email_dispatcher.submit_bulk(messages)
+        
+        admin_id = session.get('admin_id')
+        log_admin_activity(admin_id, f"You queued {len(message_ids)} care team emails")
+        
+        return jsonify({'success': True, 'message': f'{len(message_ids)} emails queued', 'message_ids': message_ids})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Failed to send email: {e}'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/send-email/<message_id>')
+@login_required
+def get_email_status(message_id):
+    """Get the delivery status of a queued email"""
+    status = email_dispatcher.get_status(message_id)
+    if not status:
+        return jsonify({'success': False, 'message': 'Unknown message'})
+    return jsonify({'success': True, 'email': status})
+
 @app.route('/api/log-review', methods=['POST'])
 @login_required
 def log_review():
@@ -416,12 +986,17 @@ def archive_alert():
         if not alert_id:
             return jsonify({'success': False, 'message': 'Alert ID is required'})
         
+        alert = db.fetch_one("SELECT facility_id FROM alert WHERE alert_id = %s", (alert_id,))
+        
         # Update alert_archive to 1
-        db.execute_query(f"""
+        db.execute_query("""
             UPDATE alert 
             SET alert_archive = 1 
-            WHERE alert_id = {alert_id}
-        """)
+            WHERE alert_id = %s
+        """, (alert_id,))
+        
+        # The alert moves from the active to the archived list of its facility, in every worker
+        on_alert_archived(alert_id, alert['facility_id'] if alert else None)
         
         # Log activity
         admin_id = session.get('admin_id')
@@ -436,365 +1011,719 @@ def archive_alert():
 def get_archived_alerts():
     """Get archived alerts with optional facility filter"""
     try:
-        facility_ids = request.args.get('facilities', '')
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 6))
-        
-        # If facility_ids is empty string, return no alerts (user unchecked all)
-        if facility_ids == '':
-            all_alerts = []
-        elif facility_ids:
-            # Specific facilities selected
-            query = f"""
-            SELECT a.alert_id, a.patient_id, a.alert_type, a.alert_date_time, a.facility_id,
-                   p.patient_first_name, p.patient_last_name, f.facility_name
-            FROM alert a
-            JOIN patient p ON a.patient_id = p.patient_id
-            JOIN facility f ON a.facility_id = f.facility_id
-            WHERE a.facility_id IN ({facility_ids}) AND a.alert_archive = 1
-            ORDER BY a.alert_date_time DESC
-            """
-            all_alerts = db.fetch_all(query)
-        else:
-            # No filter parameter provided (shouldn't happen, but default to all)
-            query = """
-            SELECT a.alert_id, a.patient_id, a.alert_type, a.alert_date_time, a.facility_id,
-                   p.patient_first_name, p.patient_last_name, f.facility_name
-            FROM alert a
-            JOIN patient p ON a.patient_id = p.patient_id
-            JOIN facility f ON a.facility_id = f.facility_id
-            WHERE a.alert_archive = 1
-            ORDER BY a.alert_date_time DESC
-            """
-            all_alerts = db.fetch_all(query)
-        
-        # Convert datetime to string
-        for alert in all_alerts:
-            if isinstance(alert['alert_date_time'], datetime):
-                if alert['alert_date_time'].date() == datetime.now().date():
-                    alert['alert_date_time'] = alert['alert_date_time'].strftime('Today, %I:%M %p')
-                else:
-                    alert['alert_date_time'] = alert['alert_date_time'].strftime('%Y-%m-%d, %I:%M %p')
-        
-        # Pagination
-        total = len(all_alerts)
-        start = (page - 1) * per_page
-        end = start + per_page
-        alerts = all_alerts[start:end]
-        
-        return jsonify({
-            'success': True,
-            'alerts': alerts,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
-        })
+        return alert_page_response(archived=True)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/alerts/stream')
+@login_required
+def stream_alerts():
+    """
+    Server-Sent Events stream of newly created alerts
+    Filtered to the facilities in ?facilities=1,2 (all when omitted). Supports
+    Last-Event-ID (header or ?last_event_id=) to resume after a reconnect.
+    The stream closes after SSE_MAX_STREAM_SECONDS; its final id lets the
+    browser's automatic reconnect resume without missing alerts.
+    """
+    facility_param = request.args.get('facilities', '')
+    facility_ids = set(parse_facility_ids(facility_param)) if facility_param else None
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    follow_external_alerts()
+    
+    def matches(alert):
+        return facility_ids is None or alert.get('facility_id') in facility_ids
+    
+    def generate():
+        alert_broker.track('connections')
+        alert_broker.track('subscribers')
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            
+            after_seq = alert_broker.current_seq()
+            resume = alert_broker.parse_event_id(last_event_id) if last_event_id else None
+            if resume and resume[0] == 'seq':
+                alert_broker.track('resumes')
+                after_seq = resume[1]
+            elif resume and resume[0] == 'alert':
+                # Broker restarted or the buffer no longer reaches back - backfill from the DB,
+                # page by page until a short page shows nothing is left
+                alert_broker.track('backfills')
+                backfill_from = resume[1]
+                while True:
+                    alerts = fetch_alerts_since(backfill_from, facility_ids)
+                    for alert in alerts:
+                        yield format_sse(alert, event='alert', event_id=f"{alert_broker.epoch}-{after_seq}-{alert['alert_id']}")
+                    if len(alerts) < ALERT_BACKFILL_PAGE_SIZE:
+                        break
+                    backfill_from = alerts[-1]['alert_id']
+            
+            deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                events = alert_broker.wait_for_events(after_seq, min(SSE_HEARTBEAT_SECONDS, remaining))
+                if not events:
+                    yield ": heartbeat\n\n"
+                    continue
+                for event in events:
+                    after_seq = event['seq']
+                    if matches(event['alert']):
+                        yield format_sse(event['alert'], event='alert', event_id=event['id'])
+            
+            # An id-only message moves the browser's Last-Event-ID to where this stream
+            # stopped; events published while reading the latest alert id are sent first
+            latest = db.fetch_one("SELECT COALESCE(MAX(alert_id), 0) AS alert_id FROM alert")
+            for event in alert_broker.wait_for_events(after_seq, 0):
+                after_seq = event['seq']
+                if matches(event['alert']):
+                    yield format_sse(event['alert'], event='alert', event_id=event['id'])
+            if latest is not None:
+                yield f"id: {alert_broker.epoch}-{after_seq}-{latest['alert_id']}\n\n"
+        finally:
+            alert_broker.track('subscribers', -1)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+ALERT_BACKFILL_PAGE_SIZE = 100
+
+def fetch_alerts_since(alert_id, facility_ids):
+    """Next page of active alerts created after alert_id, for resuming a stream across restarts"""
+    where = ["a.alert_id > %s", "a.alert_archive = 0"]
+    params = [alert_id]
+    if facility_ids:
+        where.append(f"a.facility_id IN ({', '.join(['%s'] * len(facility_ids))})")
+        params.extend(sorted(facility_ids))
+    alerts = db.fetch_all(f"""
+        SELECT a.alert_id, a.patient_id, a.facility_id, a.alert_type, a.alert_date_time
+        FROM alert a
+        WHERE {' AND '.join(where)}
+        ORDER BY a.alert_id
+        LIMIT %s
+    """, params + [ALERT_BACKFILL_PAGE_SIZE])
+    return format_datetime_column(alerts, 'alert_date_time')
+
 @app.route('/api/check-new-alerts')
 @login_required
 def check_new_alerts():
     """Check if there are new alerts in the last 5 minutes"""
     try:
-        result = db.fetch_one("""
-            SELECT COUNT(*) as count 
-            FROM alert 
-            WHERE alert_date_time >= DATE_SUB(NOW(), INTERVAL 5 MINUTE) AND alert_archive = 0
-        """)
-        
-        has_new_alerts = result['count'] > 0 if result else False
+        # Served from the alert cache; the window is re-applied on every read
+        follow_external_alerts()
+        sync_alert_cache()
+        cutoff = datetime.now() - timedelta(minutes=5)
+        count = len(alert_cache.get_recent_alert_times(cutoff))
         
         return jsonify({
             'success': True,
-            'has_new_alerts': has_new_alerts,
-            'count': result['count'] if result else 0
+            'has_new_alerts': count > 0,
+            'count': count
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def find_patients_with_new_entries(patient_ids=None, shards=None, shard_count=1):
+    """
+    Watermark-based change detection for the monitor
+    One set-based query compares each clinical table's latest timestamp per
+    patient (last 30 days) against the eval table and returns only patients
+    with rows newer than what was last evaluated. With shards, only patients
+    whose patient_id modulo shard_count is in shards are considered.
+    """
+    thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    patient_filter = ""
+    filter_params = []
+    if patient_ids:
+        patient_filter += f"AND patient_id IN ({', '.join(['%s'] * len(patient_ids))}) "
+        filter_params.extend(patient_ids)
+    shard_sql, shard_params = shard_filter(shards, shard_count)
+    patient_filter += shard_sql
+    filter_params.extend(shard_params)
+    params = []
+    for _ in range(3):
+        params.append(thirty_days_ago)
+        params.extend(filter_params)
+    
+    # Each branch is a loose index scan over idx_patient_datetime
+    return db.fetch_all(f"""
+        SELECT c.patient_id,
+               MAX(c.latest_vitals_time) AS latest_vitals_time,
+               MAX(c.latest_lab_time) AS latest_lab_time,
+               MAX(c.latest_med_time) AS latest_med_time,
+               MAX(e.patient_id IS NOT NULL) AS has_eval,
+               MAX(e.vitals_last_date_time) AS eval_vitals_time,
+               MAX(e.lab_last_date_time) AS eval_lab_time,
+               MAX(e.medication_last_date_time) AS eval_med_time
+        FROM (
+            SELECT patient_id, MAX(vitals_date_time) AS latest_vitals_time,
+                   NULL AS latest_lab_time, NULL AS latest_med_time
+            FROM vitals_data
+            WHERE vitals_date_time >= %s {patient_filter}
+            GROUP BY patient_id
+            UNION ALL
+            SELECT patient_id, NULL, MAX(lab_date_time), NULL
+            FROM lab_result
+            WHERE lab_date_time >= %s {patient_filter}
+            GROUP BY patient_id
+            UNION ALL
+            SELECT patient_id, NULL, NULL, MAX(medication_date_time)
+            FROM medication
+            WHERE medication_date_time >= %s {patient_filter}
+            GROUP BY patient_id
+        ) c
+        LEFT JOIN eval e ON e.patient_id = c.patient_id
+        GROUP BY c.patient_id
+        HAVING latest_vitals_time > COALESCE(eval_vitals_time, '1000-01-01')
+            OR latest_lab_time > COALESCE(eval_lab_time, '1000-01-01')
+            OR latest_med_time > COALESCE(eval_med_time, '1000-01-01')
+    """, params)
+
+class PatientEvaluationPool:
+    """
+    Bounded worker pool for process_patient_alert
+    At most MONITOR_WORKERS tasks run concurrently and a patient that is
+    already being evaluated is never submitted a second time. With
+    batch_size > 1 each task analyzes a batch of patients in one Bedrock call.
+    Patients come from the durable evaluation queue. Failed patients are
+    handed back to the queue for a retry as soon as their task finishes; the
+    rest of a cycle is settled once every task is done, writing the eval
+    watermarks of patients evaluated without an alert and removing the
+    patients from the queue in one transaction. Tasks submitted outside a
+    cycle settle on their own.
+    """
+    
+    def __init__(self, max_workers, evaluation_queue, batch_size=1):
+        self.max_workers = max_workers
+        self.queue = evaluation_queue
+        self.batch_size = max(batch_size, 1)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='patient-eval')
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._queued = 0
+        self._stats = {
+            'cycles': 0,
+            'eval_upserts': 0,
+            'eval_upsert_rows': 0,
+            'submitted': 0,
+            'skipped_in_flight': 0,
+            'completed': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_cycle_patients': 0,
+            'last_cycle_duration_s': None,
+            'max_cycle_duration_s': 0.0,
+            'last_eval_duration_s': None
+        }
+    
+    def _claim(self, changes):
+        """Mark patients in flight, returning only those that were not already"""
+        claimed = []
+        with self._lock:
+            for change in changes:
+                if change['patient_id'] in self._in_flight:
+                    self._stats['skipped_in_flight'] += 1
+                    continue
+                self._in_flight.add(change['patient_id'])
+                claimed.append(change)
+            self._queued += len(claimed)
+            self._stats['submitted'] += len(claimed)
+        return claimed
+    
+    def submit(self, change, cycle=None):
+        """Queue a claimed patient for evaluation, returns the future or None if already in flight"""
+        if not self._claim([change]):
+            return None
+        return self.executor.submit(self._run, change, cycle)
+    
+    def submit_batch(self, changes, cycle=None):
+        """Queue a batch of patients for one batched evaluation, returns the future or None"""
+        claimed = self._claim(changes)
+        if not claimed:
+            return None
+        with self._lock:
+            self._stats['batches'] += 1
+        return self.executor.submit(self._run_batch, claimed, cycle)
+    
+    @property
+    def capacity(self):
+        """Patients that can be evaluated at once"""
+        return self.max_workers * self.batch_size
+    
+    def _settle(self, changes, failed, evaluated):
+        """Record eval watermarks and finish queue rows in one transaction; hand failures back for retry"""
+        succeeded = [change for change in changes if change['patient_id'] not in failed]
+        self._complete(succeeded, evaluated)
+        self._fail(failed)
+    
+    def _complete(self, succeeded, evaluated):
+        """Write eval watermarks and remove finished patients from the queue in one transaction"""
+        if succeeded:
+            try:
+                with db.transaction() as conn:
+                    record_evaluations(evaluated, conn)
+                    self.queue.complete(conn, succeeded)
+                if evaluated:
+                    print(f"  ✓ Eval table updated for {len(evaluated)} patient(s) with no alert")
+                    with self._lock:
+                        self._stats['eval_upserts'] += 1
+                        self._stats['eval_upsert_rows'] += len(evaluated)
+            except Exception as e:
+                # Leases expire and the patients are claimed again
+                print(f"❌ Error completing evaluations for {len(succeeded)} patient(s): {e}")
+    
+    def _fail(self, failed):
+        """Hand failed patients back to the queue for a retry"""
+        try:
+            self.queue.fail(failed)
+        except Exception as e:
+            print(f"❌ Error scheduling evaluation retries: {e}")
+    
+    def _finish(self, changes, start, failed, evaluated=(), cycle=None):
+        """Settle (or defer to the cycle) queue rows, release in-flight slots and record outcome counters"""
+        patient_ids = [change['patient_id'] for change in changes]
+        if cycle is None:
+            self._settle(changes, failed, evaluated)
+            released = patient_ids
+        else:
+            # Successful patients stay in flight until the cycle settles them
+            self._fail(failed)
+            released = [patient_id for patient_id in patient_ids if patient_id in failed]
+            with self._lock:
+                cycle['succeeded'].extend(change for change in changes if change['patient_id'] not in failed)
+                cycle['evaluated'].extend(evaluated)
+        with self._lock:
+            self._in_flight.difference_update(released)
+            self._stats['completed'] += len(patient_ids) - len(failed)
+            self._stats['failed'] += len(failed)
+            self._stats['last_eval_duration_s'] = round(time.monotonic() - start, 3)
+    
+    def _run(self, change, cycle=None):
+        """Evaluate one patient and release its in-flight slot"""
+        patient_id = change['patient_id']
+        with self._lock:
+            self._queued -= 1
+        start = time.monotonic()
+        failed = {}
+        evaluated = []
+        try:
+            unalerted = process_patient_alert(patient_id, change)
+            if unalerted:
+                evaluated.append(unalerted)
+        except Exception as e:
+            print(f"Error processing patient {patient_id}: {e}")
+            failed[patient_id] = str(e)
+        finally:
+            self._finish([change], start, failed, evaluated, cycle)
+    
+    def _run_batch(self, changes, cycle=None):
+        """Evaluate a batch of patients and release their in-flight slots"""
+        patient_ids = [change['patient_id'] for change in changes]
+        with self._lock:
+            self._queued -= len(changes)
+        start = time.monotonic()
+        failed = {}
+        evaluated = []
+        try:
+            failed, evaluated = process_patient_batch(changes)
+        except Exception as e:
+            print(f"Error processing patient batch {patient_ids}: {e}")
+            failed = {patient_id: str(e) for patient_id in patient_ids}
+        finally:
+            self._finish(changes, start, failed, evaluated, cycle)
+    
+    def run_cycle(self, changes):
+        """Submit one monitoring cycle; once every patient finishes, settle it and record its duration"""
+        cycle_start = time.monotonic()
+        cycle = {'succeeded': [], 'evaluated': []}
+        if self.batch_size > 1:
+            submissions = (self.submit_batch(changes[i:i + self.batch_size], cycle)
+                           for i in range(0, len(changes), self.batch_size))
+        else:
+            submissions = (self.submit(change, cycle) for change in changes)
+        futures = [f for f in submissions if f]
+        with self._lock:
+            self._stats['cycles'] += 1
+            self._stats['last_cycle_patients'] = len(changes)
+        
+        if not futures:
+            self._record_cycle(cycle_start)
+            return futures
+        
+        remaining = [len(futures)]
+        def on_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                self._settle_cycle(cycle)
+                self._record_cycle(cycle_start)
+        for future in futures:
+            future.add_done_callback(on_done)
+        return futures
+    
+    def _settle_cycle(self, cycle):
+        """Complete every successful patient of a cycle in one transaction and release them"""
+        self._complete(cycle['succeeded'], cycle['evaluated'])
+        with self._lock:
+            self._in_flight.difference_update(change['patient_id'] for change in cycle['succeeded'])
+    
+    def _record_cycle(self, cycle_start):
+        """Store cycle duration metrics"""
+        duration = round(time.monotonic() - cycle_start, 3)
+        with self._lock:
+            self._stats['last_cycle_duration_s'] = duration
+            self._stats['max_cycle_duration_s'] = max(self._stats['max_cycle_duration_s'], duration)
+    
+    def shutdown(self):
+        """Wait for running evaluations to finish and settle their queue rows"""
+        self.executor.shutdown(wait=True)
+    
+    def get_stats(self):
+        """Return cycle duration and queue depth metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['workers'] = self.max_workers
+            stats['queue_depth'] = self._queued
+            stats['in_flight'] = len(self._in_flight)
+        return stats
+
+# Monitor shards: each monitor process (embedded or monitor.py) evaluates
+# only the shards it holds a lease on, so several can run side by side
+MONITOR_INTERVAL_SECONDS = int(os.getenv('MONITOR_INTERVAL_SECONDS', '60'))
+monitor_leases = ShardLeaseManager(
+    db.connect_dedicated,
+    shard_count=int(os.getenv('MONITOR_SHARD_COUNT', '1')),
+    max_shards=int(os.getenv('MONITOR_MAX_SHARDS', '0')) or None,
+    lock_prefix=f"{db.database}.care_monitor"
+)
+
+# New clinical rows are picked up from the trigger-fed clinical_change table
+# within CHANGE_POLL_SECONDS; the full watermark scan runs on startup, when
+# the owned shards change and every MONITOR_FULL_SCAN_SECONDS as a backstop
+# (every MONITOR_INTERVAL_SECONDS if the change table is missing)
+MONITOR_FULL_SCAN_SECONDS = int(os.getenv('MONITOR_FULL_SCAN_SECONDS', '3600'))
+CHANGE_POLL_SECONDS = float(os.getenv('CHANGE_POLL_SECONDS', '1'))
+change_feed = ChangeFeed(
+    db,
+    batch_size=int(os.getenv('CHANGE_FEED_BATCH_SIZE', '1000')),
+    gap_timeout=float(os.getenv('CHANGE_FEED_GAP_TIMEOUT', '10')),
+    retention_hours=int(os.getenv('CHANGE_FEED_RETENTION_HOURS', '24'))
+)
+
+def enqueue_changed_patients(shards, patient_ids=None):
+    """Detect patients in our shards with new clinical rows and queue them by severity"""
+    # Only patients with rows newer than their eval watermark
+    changed_patients = find_patients_with_new_entries(patient_ids, shards=shards, shard_count=monitor_leases.shard_count)
+    if changed_patients:
+        print(f"✓ Found {len(changed_patients)} patients with new entries: {[row['patient_id'] for row in changed_patients]}")
+        priorities = evaluation_priorities([row['patient_id'] for row in changed_patients])
+        eval_queue.enqueue(changed_patients, priorities)
+
 def check_new_entries_and_generate_alerts():
     """Background task to check for new entries and generate alerts"""
-    print("🔍 Care coordination monitoring started - checking every minute for new entries...")
+    print(f"🔍 Care coordination monitoring started - following clinical changes every {CHANGE_POLL_SECONDS:g}s...")
     
+    owned_shards = None
+    next_full_scan = 0
     while True:
         try:
-            time.sleep(60)  # Check every minute
+            # Standby until another monitor releases a shard
+            shards = monitor_leases.refresh()
+            if not shards:
+                owned_shards = None
+                time.sleep(MONITOR_INTERVAL_SECONDS)
+                continue
             
-            thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Find all patients with data in last 30 days
-            patients_to_check = set()
-            
-            # Check vitals_data
-            vitals_patients = db.fetch_all(f"""
-                SELECT DISTINCT patient_id FROM vitals_data 
-                WHERE vitals_date_time >= '{thirty_days_ago}'
-            """)
-            for row in vitals_patients:
-                patients_to_check.add(row['patient_id'])
-            
-            # Check lab_result
-            lab_patients = db.fetch_all(f"""
-                SELECT DISTINCT patient_id FROM lab_result 
-                WHERE lab_date_time >= '{thirty_days_ago}'
-            """)
-            for row in lab_patients:
-                patients_to_check.add(row['patient_id'])
+            if shards != owned_shards or time.monotonic() >= next_full_scan:
+                # Restart the feed at its tail, then scan everything before it
+                change_feed.reset()
+                enqueue_changed_patients(shards)
+                owned_shards = shards
+                next_full_scan = time.monotonic() + (MONITOR_FULL_SCAN_SECONDS if change_feed.enabled else MONITOR_INTERVAL_SECONDS)
+                change_feed.prune()
+            else:
+                patient_ids = change_feed.poll(shards, monitor_leases.shard_count)
+                if patient_ids:
+                    enqueue_changed_patients(shards, patient_ids)
             
-            # Check medication
-            med_patients = db.fetch_all(f"""
-                SELECT DISTINCT patient_id FROM medication 
-                WHERE medication_date_time >= '{thirty_days_ago}'
-            """)
-            for row in med_patients:
-                patients_to_check.add(row['patient_id'])
+            # Evaluate the most severe queued patients first, as many as the pool runs at once
+            claimed = eval_queue.claim(evaluation_pool.capacity, shards, monitor_leases.shard_count)
+            if claimed:
+                wait(evaluation_pool.run_cycle(claimed))
+                continue
             
-            if patients_to_check:
-                print(f"✓ Found {len(patients_to_check)} patients with data in last 30 days: {patients_to_check}")
-                
-                # Process each patient
-                for patient_id in patients_to_check:
-                    try:
-                        process_patient_alert(patient_id)
-                    except Exception as e:
-                        print(f"Error processing patient {patient_id}: {e}")
+            change_feed.wait(CHANGE_POLL_SECONDS if change_feed.enabled else max(next_full_scan - time.monotonic(), 0))
             
         except Exception as e:
             print(f"Error in care coordination monitoring: {e}")
             import traceback
             traceback.print_exc()
+            time.sleep(MONITOR_INTERVAL_SECONDS)
 
-def process_patient_alert(patient_id):
-    """Process alert for a specific patient using eval table tracking"""
-    print(f"📊 Analyzing patient {patient_id}...")
-    
-    thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+# Clinical data used by the analysis and recommendation prompts: table,
+# timestamp column, id column (tie-breaker) and the columns the prompts use.
+# Prompts only look at the newest rows, so only that many are fetched.
+CLINICAL_TABLES = (
+    ('vitals_data', 'vitals_date_time', 'vitals_id',
+     ('blood_pressure', 'heart_rate', 'temperature', 'BMI', 'spo2', 'vitals_date_time')),
+    ('lab_result', 'lab_date_time', 'lab_id',
+     ('sodium', 'potassium', 'BUN', 'creatinine', 'glucose', 'lab_date_time')),
+    ('medication', 'medication_date_time', 'medication_id',
+     ('medication_name', 'medication_dose', 'medication_frequency', 'medication_route', 'medication_date_time')),
+)
+CLINICAL_ROWS_PER_PATIENT = 10
+CLINICAL_LOOKBACK_DAYS = 30
+
+def clinical_cutoff():
+    """Oldest timestamp considered for analysis"""
+    return datetime.now() - timedelta(days=CLINICAL_LOOKBACK_DAYS)
+
+def fetch_patient_clinical_data(patient_id):
+    """Fetch the newest vitals, labs and medications from the last 30 days for a patient"""
+    cutoff = clinical_cutoff()
+    results = []
+    with db.connection() as conn:
+        for table, time_column, id_column, columns in CLINICAL_TABLES:
+            results.append(db.fetch_all_on(conn, f"""
+                SELECT {', '.join(columns)} FROM {table}
+                WHERE patient_id = %s AND {time_column} >= %s
+                ORDER BY {time_column} DESC, {id_column} DESC
+                LIMIT %s
+            """, (patient_id, cutoff, CLINICAL_ROWS_PER_PATIENT)))
+    vitals, labs, meds = results
+    return vitals, labs, meds
+
+def fetch_clinical_data_bulk(patient_ids, rows_per_patient=CLINICAL_ROWS_PER_PATIENT):
+    """
+    Same as fetch_patient_clinical_data for many patients, using one
+    windowed (ROW_NUMBER) query per table; returns patient_id -> (vitals, labs, meds)
+    """
+    cutoff = clinical_cutoff()
+    clinical_data = {patient_id: ([], [], []) for patient_id in patient_ids}
+    if not patient_ids:
+        return clinical_data
+    placeholders = ', '.join(['%s'] * len(patient_ids))
+    with db.connection() as conn:
+        for index, (table, time_column, id_column, columns) in enumerate(CLINICAL_TABLES):
+            rows = db.fetch_all_on(conn, f"""
+                SELECT patient_id, {', '.join(columns)} FROM (
+                    SELECT patient_id, {', '.join(columns)},
+                        ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY {time_column} DESC, {id_column} DESC) AS row_num
+                    FROM {table}
+                    WHERE patient_id IN ({placeholders}) AND {time_column} >= %s
+                ) ranked
+                WHERE row_num <= %s
+                ORDER BY patient_id, row_num
+            """, (*patient_ids, cutoff, rows_per_patient))
+            for row in rows:
+                clinical_data[row.pop('patient_id')][index].append(row)
+    return clinical_data
+
+def evaluation_priorities(patient_ids):
+    """
+    Queue priority per patient: the number of values in the latest vitals
+    and lab rows that fall outside the normal ranges (0 when normal)
+    """
+    clinical_data = fetch_clinical_data_bulk(patient_ids, rows_per_patient=1)
+    return {patient_id: len(screen_patient_data(vitals, labs))
+            for patient_id, (vitals, labs, meds) in clinical_data.items()}
+
+EVAL_UPSERT_SQL = """
+    INSERT INTO eval (patient_id, vitals_last_date_time, lab_last_date_time, medication_last_date_time)
+    VALUES {rows}
+    ON DUPLICATE KEY UPDATE
+        vitals_last_date_time = VALUES(vitals_last_date_time),
+        lab_last_date_time = VALUES(lab_last_date_time),
+        medication_last_date_time = VALUES(medication_last_date_time)
+"""
+
+# Facility plus the latest active alert type, read in the alert transaction
+ALERT_CONTEXT_SQL = """
+    SELECT p.facility_id,
+        (SELECT a.alert_type FROM alert a
+         WHERE a.patient_id = p.patient_id AND a.alert_archive = 0
+         ORDER BY a.alert_date_time DESC
+         LIMIT 1) AS existing_alert_type
+    FROM patient p
+    WHERE p.patient_id = %s
+"""
+
+INSERT_ALERT_SQL = """
+    INSERT INTO alert (patient_id, alert_type, alert_detail, facility_id, alert_date_time, alert_archive)
+    VALUES (%s, %s, %s, %s, %s, 0)
+"""
+
+def record_evaluations(changes, conn=None):
+    """
+    Upsert the eval watermarks (latest vitals/lab/med times) for evaluated
+    patients in one multi-row statement, on conn when given
+    """
+    if not changes:
+        return
+    sql = EVAL_UPSERT_SQL.format(rows=', '.join(['(%s, %s, %s, %s)'] * len(changes)))
+    params = []
+    for change in changes:
+        params.extend([change['patient_id'], change.get('latest_vitals_time'),
+                       change.get('latest_lab_time'), change.get('latest_med_time')])
+    if conn is not None:
+        db.execute_on(conn, sql, params)
+        return
+    with db.connection() as conn:
+        db.execute_on(conn, sql, params)
+
+def is_duplicate_alert(existing_type, alert_type):
+    """Only consider duplicate if exact match OR 3+ common significant keywords"""
+    existing_type = existing_type.lower()
+    new_type = alert_type.lower()
+    existing_keywords = set(word for word in existing_type.split() if len(word) > 3)
+    new_keywords = set(word for word in new_type.split() if len(word) > 3)
+    return existing_type == new_type or len(existing_keywords & new_keywords) >= 3
+
+def process_patient_alert(patient_id, change=None, clinical_data=None, analysis=None):
+    """
+    Process alert for a specific patient using eval table tracking
+    change is the patient's row from find_patients_with_new_entries; when
+    omitted it is looked up here. clinical_data (vitals, labs, meds) and
+    analysis (alert_type, alert_detail) can be passed in when they were
+    already produced by a batched evaluation.
     
-    # Fetch last 30 days of data using database client
-    vitals = db.fetch_all(f"""
-        SELECT * FROM vitals_data 
-        WHERE patient_id = {patient_id} AND vitals_date_time >= '{thirty_days_ago}'
-        ORDER BY vitals_date_time DESC
-    """)
+    Returns the change when no alert was raised: the caller records those
+    eval watermarks in bulk with record_evaluations. When an alert is raised
+    the alert and the patient's watermark are written in one transaction.
+    Raises when the evaluation failed and should be retried.
+    """
+    if change is None:
+        changes = find_patients_with_new_entries([patient_id])
+        if not changes:
+            print(f"  ℹ️  No new entries detected for patient {patient_id}")
+            return None
+        change = changes[0]
     
-    labs = db.fetch_all(f"""
-        SELECT * FROM lab_result 
-        WHERE patient_id = {patient_id} AND lab_date_time >= '{thirty_days_ago}'
-        ORDER BY lab_date_time DESC
-    """)
+    print(f"📊 Analyzing patient {patient_id}...")
     
-    meds = db.fetch_all(f"""
-        SELECT * FROM medication 
-        WHERE patient_id = {patient_id} AND medication_date_time >= '{thirty_days_ago}'
-        ORDER BY medication_date_time DESC
-    """)
+    if clinical_data is None:
+        clinical_data = fetch_patient_clinical_data(patient_id)
+    vitals, labs, meds = clinical_data
     
     if not vitals and not labs and not meds:
         print(f"  ⚠ No data found for patient {patient_id}")
-        return
+        return None
     
-    # Get latest timestamps from each table
-    latest_vitals_time = vitals[0]['vitals_date_time'] if vitals else None
-    latest_lab_time = labs[0]['lab_date_time'] if labs else None
-    latest_med_time = meds[0]['medication_date_time'] if meds else None
-    
-    # Get last evaluated timestamps from eval table
-    eval_record = db.fetch_one(f"""
-        SELECT lab_last_date_time, medication_last_date_time, vitals_last_date_time 
-        FROM eval 
-        WHERE patient_id = {patient_id}
-    """)
-    
-    # Check if any table has new entries
-    has_new_entry = False
-    
-    # Debug: Print what we're comparing
-    print(f"  🔍 Latest timestamps - Vitals: {latest_vitals_time}, Labs: {latest_lab_time}, Meds: {latest_med_time}")
-    if eval_record:
-        print(f"  🔍 Eval table - Vitals: {eval_record.get('vitals_last_date_time')}, Labs: {eval_record.get('lab_last_date_time')}, Meds: {eval_record.get('medication_last_date_time')}")
+    # Latest timestamps and eval watermark come from the change-detection query
+    print(f"  🔍 Latest timestamps - Vitals: {change.get('latest_vitals_time')}, Labs: {change.get('latest_lab_time')}, Meds: {change.get('latest_med_time')}")
+    if change.get('has_eval'):
+        print(f"  🔍 Eval table - Vitals: {change.get('eval_vitals_time')}, Labs: {change.get('eval_lab_time')}, Meds: {change.get('eval_med_time')}")
     else:
         print(f"  🔍 No eval record exists for patient {patient_id}")
     
-    if latest_vitals_time:
-        eval_vitals_time = eval_record.get('vitals_last_date_time') if eval_record else None
-        # Treat invalid dates (0000-00-00) as None
-        if isinstance(eval_vitals_time, str) or not eval_vitals_time:
-            eval_vitals_time = None
-        if not eval_vitals_time or latest_vitals_time > eval_vitals_time:
-            has_new_entry = True
-            print(f"  ✓ New vitals entry detected: {latest_vitals_time}")
-    
-    if latest_lab_time:
-        eval_lab_time = eval_record.get('lab_last_date_time') if eval_record else None
-        # Treat invalid dates (0000-00-00) as None
-        if isinstance(eval_lab_time, str) or not eval_lab_time:
-            eval_lab_time = None
-        if not eval_lab_time or latest_lab_time > eval_lab_time:
-            has_new_entry = True
-            print(f"  ✓ New lab entry detected: {latest_lab_time}")
-    
-    if latest_med_time:
-        eval_med_time = eval_record.get('medication_last_date_time') if eval_record else None
-        # Treat invalid dates (0000-00-00) as None
-        if isinstance(eval_med_time, str) or not eval_med_time:
-            eval_med_time = None
-        if not eval_med_time or latest_med_time > eval_med_time:
-            has_new_entry = True
-            print(f"  ✓ New medication entry detected: {latest_med_time}")
-    
-    # If no new entries, skip processing
-    if not has_new_entry:
-        print(f"  ℹ️  No new entries detected for patient {patient_id}")
-        return
-    
     print(f"  🔄 Processing new entries for patient {patient_id}...")
     
     # Analyze with Bedrock
-    alert_type, alert_detail = analyze_with_bedrock(patient_id, vitals, labs, meds)
+    if analysis is None:
+        analysis = analyze_with_bedrock(patient_id, vitals, labs, meds, retry_allowed=change.get('retry_allowed', False))
+    alert_type, alert_detail = analysis
     
     if not alert_type or not alert_detail:
         print(f"  ✓ No abnormalities detected for patient {patient_id}")
-        # Update eval table even if no alert (to track that we evaluated this data)
-        vitals_time_str = f"'{latest_vitals_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_vitals_time else 'NULL'
-        lab_time_str = f"'{latest_lab_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_lab_time else 'NULL'
-        med_time_str = f"'{latest_med_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_med_time else 'NULL'
-        
-        if eval_record:
-            db.execute_query(f"""
-                UPDATE eval 
-                SET vitals_last_date_time = {vitals_time_str},
-                    lab_last_date_time = {lab_time_str},
-                    medication_last_date_time = {med_time_str}
-                WHERE patient_id = {patient_id}
-            """)
-        else:
-            db.execute_query(f"""
-                INSERT INTO eval (patient_id, vitals_last_date_time, lab_last_date_time, medication_last_date_time)
-                VALUES ({patient_id}, {vitals_time_str}, {lab_time_str}, {med_time_str})
-            """)
-        print(f"  ✓ Eval table updated (no alert needed)")
-        return
+        # Eval is still updated (in bulk) to track that we evaluated this data
+        return change
     
-    # Check if similar alert already exists for this patient (not archived)
-    existing_alert = db.fetch_one(f"""
-        SELECT alert_id, alert_type FROM alert 
-        WHERE patient_id = {patient_id} 
-        AND alert_archive = 0
-        ORDER BY alert_date_time DESC 
-        LIMIT 1
-    """)
-    
-    if existing_alert:
-        # Check if alert types are identical or very similar
-        existing_type = existing_alert['alert_type'].lower()
-        new_type = alert_type.lower()
-        
-        # Only skip if alerts are exactly the same or share 3+ significant keywords
-        existing_keywords = set(word for word in existing_type.split() if len(word) > 3)
-        new_keywords = set(word for word in new_type.split() if len(word) > 3)
-        common_keywords = existing_keywords.intersection(new_keywords)
-        
-        # Only consider duplicate if exact match OR 3+ common significant keywords
-        if existing_type == new_type or len(common_keywords) >= 3:
-            print(f"  ℹ️  Similar alert already exists: '{existing_alert['alert_type']}'")
-            print(f"  ℹ️  New alert would be: '{alert_type}'")
-            print(f"  ℹ️  Skipping duplicate alert, updating eval table only")
+    try:
+        current_time = datetime.now()
+        with db.transaction() as conn:
+            context = db.fetch_one_on(conn, ALERT_CONTEXT_SQL, (patient_id,)) or {}
+            facility_id = context.get('facility_id')
+            existing_type = context.get('existing_alert_type')
             
-            # Update eval table to track that we processed this data
-            vitals_time_str = f"'{latest_vitals_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_vitals_time else 'NULL'
-            lab_time_str = f"'{latest_lab_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_lab_time else 'NULL'
-            med_time_str = f"'{latest_med_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_med_time else 'NULL'
+            # Check if similar alert already exists for this patient (not archived)
+            if existing_type and is_duplicate_alert(existing_type, alert_type):
+                print(f"  ℹ️  Similar alert already exists: '{existing_type}'")
+                print(f"  ℹ️  New alert would be: '{alert_type}'")
+                print(f"  ℹ️  Skipping duplicate alert, updating eval table only")
+                return change
             
-            if eval_record:
-                db.execute_query(f"""
-                    UPDATE eval 
-                    SET vitals_last_date_time = {vitals_time_str},
-                        lab_last_date_time = {lab_time_str},
-                        medication_last_date_time = {med_time_str}
-                    WHERE patient_id = {patient_id}
-                """)
-            else:
-                db.execute_query(f"""
-                    INSERT INTO eval (patient_id, vitals_last_date_time, lab_last_date_time, medication_last_date_time)
-                    VALUES ({patient_id}, {vitals_time_str}, {lab_time_str}, {med_time_str})
-                """)
-            print(f"  ✓ Eval table updated (duplicate alert prevented)")
-            return
+            alert_id = db.execute_on(conn, INSERT_ALERT_SQL,
+                                     (patient_id, alert_type, alert_detail, facility_id, current_time))
+            record_evaluations([change], conn)
+    except Exception as e:
+        print(f"  ❌ Error creating alert: {e}")
+        # Eval table is not updated if alert creation failed
+        raise
     
-    # Get facility_id
-    patient_info = db.fetch_one(f"SELECT facility_id FROM patient WHERE patient_id = {patient_id}")
-    facility_id = patient_info['facility_id'] if patient_info else None
+    print(f"  🚨 Alert created (ID: {alert_id}): {alert_type}")
+    print(f"  ✓ Eval table updated for patient {patient_id}")
     
-    # Escape single quotes in alert text to prevent SQL errors
-    alert_type_escaped = alert_type.replace("'", "''")
-    alert_detail_escaped = alert_detail.replace("'", "''")
+    # Refresh cached alert lists for this facility and push to connected dashboards
+    announce_alert({
+        'alert_id': alert_id,
+        'patient_id': patient_id,
+        'facility_id': facility_id,
+        'alert_type': alert_type,
+        'alert_date_time': current_time.strftime('%Y-%m-%d %I:%M %p')
+    })
     
-    # Insert alert using database client with escaped text (alert_id will be auto-generated)
-    try:
-        # Get current timestamp for matching
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        db.execute_query(f"""
-            INSERT INTO alert (patient_id, alert_type, alert_detail, facility_id, alert_date_time, alert_archive)
-            VALUES ({patient_id}, '{alert_type_escaped}', '{alert_detail_escaped}', {facility_id}, '{current_time}', 0)
-        """)
-        
-        # Get the alert we just inserted by matching patient_id and timestamp
-        alert_result = db.fetch_one(f"""
-            SELECT alert_id FROM alert 
-            WHERE patient_id = {patient_id} 
-            AND alert_date_time >= '{current_time}'
-            ORDER BY alert_id DESC 
-            LIMIT 1
-        """)
-        
-        alert_id = alert_result['alert_id'] if alert_result else None
-        
-        if not alert_id:
-            print(f"  ❌ Failed to get alert_id after insert")
-            return
-        
-        print(f"  🚨 Alert created (ID: {alert_id}): {alert_type}")
-        
-        # Generate and save recommendation with new filename convention
-        recommendation = generate_recommendation(patient_id, alert_type, alert_detail, vitals, labs, meds)
-        save_recommendation_to_s3(alert_id, recommendation, patient_id)
-        
-        print(f"  ✓ Recommendation saved to S3 as {alert_id}_{patient_id}_recommendation.txt")
-        
-        # Update eval table with latest timestamps
-        vitals_time_str = f"'{latest_vitals_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_vitals_time else 'NULL'
-        lab_time_str = f"'{latest_lab_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_lab_time else 'NULL'
-        med_time_str = f"'{latest_med_time.strftime('%Y-%m-%d %H:%M:%S')}'" if latest_med_time else 'NULL'
-        
-        if eval_record:
-            # Update existing record
-            db.execute_query(f"""
-                UPDATE eval 
-                SET vitals_last_date_time = {vitals_time_str},
-                    lab_last_date_time = {lab_time_str},
-                    medication_last_date_time = {med_time_str}
-                WHERE patient_id = {patient_id}
-            """)
-        else:
-            # Insert new record
-            db.execute_query(f"""
-                INSERT INTO eval (patient_id, vitals_last_date_time, lab_last_date_time, medication_last_date_time)
-                VALUES ({patient_id}, {vitals_time_str}, {lab_time_str}, {med_time_str})
-            """)
-        
-        print(f"  ✓ Eval table updated for patient {patient_id}")
-        
-    except Exception as e:
-        print(f"  ❌ Error creating alert: {e}")
-        # Don't update eval table if alert creation failed
-        return
+    # Generate and save recommendation with new filename convention
+    recommendation = generate_recommendation(patient_id, alert_type, alert_detail, vitals, labs, meds)
+    recommendation_key = save_recommendation_to_s3(alert_id, recommendation, patient_id)
+    if recommendation_key and has_recommendation_key_column():
+        # Record the key so readers need exactly one S3 GET
+        db.execute_query("UPDATE alert SET recommendation_key = %s WHERE alert_id = %s", (recommendation_key, alert_id))
+        print(f"  ✓ Recommendation saved to S3 as {recommendation_key}")
+    return None
+
+# Surrogate keys and bookkeeping columns that don't change the clinical content
+CACHE_IGNORED_COLUMNS = {'vitals_id', 'lab_id', 'medication_id', 'created_at'}
 
-def analyze_with_bedrock(patient_id, vitals, labs, meds):
-    """Analyze patient data with Bedrock LLM"""
-    prompt = """You are an expert medical doctor specializing in geriatric care and clinical diagnostics. 
+def canonicalize_rows(rows):
+    """Drop surrogate columns and exact duplicates so equal data snapshots hash the same"""
+    canonical = []
+    seen = set()
+    for row in rows:
+        cleaned = {k: str(v) if v is not None else None for k, v in sorted(row.items()) if k not in CACHE_IGNORED_COLUMNS}
+        fingerprint = json.dumps(cleaned, sort_keys=True)
+        if fingerprint not in seen:
+            seen.add(fingerprint)
+            canonical.append(cleaned)
+    return canonical
+
+def invoke_bedrock(content, max_tokens, cache_parts=None, validate=None):
+    """
+    Call Bedrock invoke_model and return the response text
+    When cache_parts is given the result is cached under a hash of the model
+    id, max_tokens and those parts (prompt plus canonicalized patient data).
+    If validate is given the text is only cached when validate(text) does not raise.
+    """
+    model_id = os.getenv('BEDROCK_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+    key = None
+    if bedrock_cache is not None and cache_parts is not None:
+        key = content_key(model_id, max_tokens, *cache_parts)
+        cached = bedrock_cache.get(key)
+        if cached is not None:
+            print(f"  ⚡ Bedrock cache hit ({cache_parts[0]})")
+            return cached
+    
+    response = bedrock_runtime.invoke_model(
+        modelId=model_id,
+        body=json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "messages": [{"role": "user", "content": content}]
+        })
+    )
+    
+    response_body = json.loads(response['body'].read())
+    text = response_body['content'][0]['text']
+    if validate is not None:
+        validate(text)
+    if key is not None:
+        bedrock_cache.set(key, text)
+    return text
+
+ANALYSIS_INSTRUCTIONS = """You are an expert medical doctor specializing in geriatric care and clinical diagnostics. 
 
 ⚠️ CRITICAL REQUIREMENT: You MUST evaluate EVERY SINGLE parameter in the data provided. Do NOT skip any values.
 ⚠️ BE STRICT: Even slightly abnormal values MUST be flagged. If a value is outside the range by even 1 unit, FLAG IT.
@@ -836,7 +1765,9 @@ STEP-BY-STEP PROCESS:
 3. List EVERY abnormal value you find
 4. Create comprehensive alert listing ALL abnormalities
 
-OUTPUT FORMAT:
+"""
+
+SINGLE_PATIENT_OUTPUT_FORMAT = """OUTPUT FORMAT:
 If you find ANY abnormality, respond with:
 ALERT: [List ALL abnormal findings with values]
 DETAIL: [Detailed explanation of ALL abnormalities]
@@ -850,43 +1781,73 @@ NO_ALERT
 
 PATIENT DATA TO ANALYZE:
 """
-    
-    data_summary = f"""
+
+BATCH_OUTPUT_FORMAT = """OUTPUT FORMAT:
+You will receive data for SEVERAL patients. Evaluate each patient independently.
+Respond with ONLY a JSON object, no other text, in this exact shape:
+{"results": [{"patient_id": <id>, "alert": "<ALL abnormal findings with values, or null>", "detail": "<detailed explanation, or null>"}]}
+
+Include exactly one entry per patient ID provided. Use null for "alert" and "detail" when a patient has NO abnormalities.
+
+PATIENTS TO ANALYZE:
+"""
+
+def build_data_summary(patient_id, vitals, labs, meds, findings):
+    """Format one patient's recent clinical data for the analysis prompt"""
+    return f"""
 PATIENT ID: {patient_id}
 DATA PERIOD: Last 30 days
 
-VITAL SIGNS ({len(vitals)} records):
+VITAL SIGNS ({len(vitals)} most recent records):
 {json.dumps(vitals[:10], default=str)}
 
-LABORATORY RESULTS ({len(labs)} records):
+LABORATORY RESULTS ({len(labs)} most recent records):
 {json.dumps(labs[:10], default=str)}
 
-MEDICATIONS ({len(meds)} records):
+MEDICATIONS ({len(meds)} most recent records):
 {json.dumps(meds[:10], default=str)}
 
+RULE-BASED PRE-SCREEN FINDINGS (already verified against the normal ranges):
+{json.dumps(findings, default=str)}
+
 Analyze this data and identify any abnormalities or concerning patterns.
 """
+
+class BedrockAnalysisError(Exception):
+    """Bedrock analysis failed and the evaluation should be retried later"""
+
+def analyze_with_bedrock(patient_id, vitals, labs, meds, retry_allowed=False):
+    """
+    Analyze patient data with Bedrock LLM
+    A deterministic rules pre-screen runs first; Bedrock is only called for
+    the narrative when at least one value is outside the normal ranges.
+    When Bedrock fails and retry_allowed is set, BedrockAnalysisError is
+    raised so the evaluation queue retries the patient after a backoff;
+    otherwise the rule findings are used.
+    """
+    findings = screen_patient_data(vitals[:10], labs[:10])
+    if RULES_PRESCREEN_ENABLED and not findings:
+        print(f"  ✓ Rule pre-screen: all values within normal ranges for patient {patient_id} (Bedrock skipped)")
+        return None, None
+    if findings:
+        print(f"  ⚠ Rule pre-screen flagged {len(findings)} abnormal value(s) for patient {patient_id}")
+    
+    prompt = ANALYSIS_INSTRUCTIONS + SINGLE_PATIENT_OUTPUT_FORMAT
+    
+    data_summary = build_data_summary(patient_id, vitals, labs, meds, findings)
     
     try:
-        response = bedrock_runtime.invoke_model(
-            modelId=os.getenv('BEDROCK_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0'),
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
-                "messages": [{"role": "user", "content": prompt + data_summary}]
-            })
+        analysis = invoke_bedrock(
+            prompt + data_summary,
+            max_tokens=1000,
+            cache_parts=('analysis', prompt, patient_id, canonicalize_rows(vitals[:10]),
+                         canonicalize_rows(labs[:10]), canonicalize_rows(meds[:10]))
         )
         
-        response_body = json.loads(response['body'].read())
-        analysis = response_body['content'][0]['text']
-        
-        if "NO_ALERT" in analysis:
-            return None, None
-        
         alert_type = ""
         alert_detail = ""
         
-        if "ALERT:" in analysis:
+        if "ALERT:" in analysis and "NO_ALERT" not in analysis:
             lines = analysis.split('\n')
             for line in lines:
                 if line.startswith("ALERT:"):
@@ -894,12 +1855,154 @@ Analyze this data and identify any abnormalities or concerning patterns.
                 elif line.startswith("DETAIL:"):
                     alert_detail = line.replace("DETAIL:", "").strip()
         
-        return alert_type, alert_detail
+        if alert_type and alert_detail:
+            return alert_type, alert_detail
+        if "NO_ALERT" in analysis:
+            # An explicit answer from the model stands; the rules only pre-screen
+            return None, None
+        
+        # Fall back to the rule findings only when the model output is unusable
+        if findings:
+            print(f"  ⚠ Bedrock returned no usable alert, using rule pre-screen findings")
+            return summarize_findings(findings)
+        return None, None
         
     except Exception as e:
         print(f"  ❌ Error calling Bedrock: {e}")
+        if retry_allowed:
+            raise BedrockAnalysisError(str(e)) from e
+        if findings:
+            return summarize_findings(findings)
         return None, None
 
+def parse_batch_analysis(analysis, patient_ids):
+    """
+    Parse the JSON response of a batched analysis into
+    {patient_id: (alert_type, alert_detail)}; patients missing from the
+    response are left out so the caller can fall back for them
+    """
+    start = analysis.find('{')
+    end = analysis.rfind('}')
+    if start == -1 or end == -1:
+        raise ValueError("No JSON object in batch analysis response")
+    payload = json.loads(analysis[start:end + 1])
+    
+    results = {}
+    for entry in payload.get('results', []):
+        try:
+            patient_id = int(entry.get('patient_id'))
+        except (TypeError, ValueError):
+            continue
+        if patient_id not in patient_ids:
+            continue
+        alert_type = (entry.get('alert') or '').strip()
+        alert_detail = (entry.get('detail') or '').strip()
+        if alert_type.upper() in ('', 'NULL', 'NONE', 'NO_ALERT'):
+            results[patient_id] = (None, None)
+        elif alert_detail:
+            results[patient_id] = (alert_type, alert_detail)
+    return results
+
+# Output budget for batched analysis; larger batches would truncate the JSON response
+BATCH_TOKENS_PER_PATIENT = 800
+BATCH_MAX_TOKENS = 4000
+MAX_BEDROCK_BATCH_SIZE = BATCH_MAX_TOKENS // BATCH_TOKENS_PER_PATIENT
+
+def bedrock_batch_size():
+    """BEDROCK_BATCH_SIZE, clamped to the patients one response's token budget can cover"""
+    batch_size = int(os.getenv('BEDROCK_BATCH_SIZE', '1'))
+    if batch_size > MAX_BEDROCK_BATCH_SIZE:
+        print(f"⚠ BEDROCK_BATCH_SIZE={batch_size} exceeds the {BATCH_MAX_TOKENS}-token response budget; "
+              f"using {MAX_BEDROCK_BATCH_SIZE}")
+        return MAX_BEDROCK_BATCH_SIZE
+    return batch_size
+
+def analyze_patients_batch(clinical_data, retry_allowed=()):
+    """
+    Analyze several patients with a single Bedrock request
+    clinical_data maps patient_id -> (vitals, labs, meds). Returns
+    {patient_id: (alert_type, alert_detail)}. Patients the batch response
+    does not cover (or all of them, if it cannot be parsed) fall back to
+    analyze_with_bedrock; for those in retry_allowed a failed fallback maps
+    to the BedrockAnalysisError instead.
+    """
+    results = {}
+    pending = {}
+    for patient_id, (vitals, labs, meds) in clinical_data.items():
+        findings = screen_patient_data(vitals[:10], labs[:10])
+        if RULES_PRESCREEN_ENABLED and not findings:
+            print(f"  ✓ Rule pre-screen: all values within normal ranges for patient {patient_id} (Bedrock skipped)")
+            results[patient_id] = (None, None)
+        else:
+            pending[patient_id] = findings
+    
+    def analyze_single(patient_id):
+        try:
+            return analyze_with_bedrock(patient_id, *clinical_data[patient_id],
+                                        retry_allowed=patient_id in retry_allowed)
+        except BedrockAnalysisError as e:
+            return e
+    
+    if len(pending) <= 1:
+        for patient_id in pending:
+            results[patient_id] = analyze_single(patient_id)
+        return results
+    
+    print(f"  📦 Analyzing {len(pending)} patients in one Bedrock request: {list(pending)}")
+    prompt = ANALYSIS_INSTRUCTIONS + BATCH_OUTPUT_FORMAT
+    summaries = [build_data_summary(patient_id, *clinical_data[patient_id], findings) for patient_id, findings in pending.items()]
+    
+    parsed = {}
+    try:
+        analysis = invoke_bedrock(
+            prompt + ''.join(summaries),
+            max_tokens=min(BATCH_TOKENS_PER_PATIENT * len(pending), BATCH_MAX_TOKENS),
+            cache_parts=('batch_analysis', prompt) + tuple(
+                (patient_id, canonicalize_rows(clinical_data[patient_id][0][:10]),
+                 canonicalize_rows(clinical_data[patient_id][1][:10]), canonicalize_rows(clinical_data[patient_id][2][:10]))
+                for patient_id in pending
+            ),
+            validate=lambda text: parse_batch_analysis(text, set(pending))
+        )
+        parsed = parse_batch_analysis(analysis, set(pending))
+    except Exception as e:
+        print(f"  ⚠ Batch analysis failed, falling back to single-patient calls: {e}")
+    
+    for patient_id in pending:
+        if patient_id not in parsed:
+            print(f"  ⚠ No batch result for patient {patient_id}, analyzing individually")
+            results[patient_id] = analyze_single(patient_id)
+        else:
+            results[patient_id] = parsed[patient_id]
+    return results
+
+def process_patient_batch(changes):
+    """
+    Fetch data for a batch of changed patients, analyze them together, then record each result
+    Returns ({failed patient id: error}, changes evaluated without an alert)
+    """
+    clinical_data = fetch_clinical_data_bulk([change['patient_id'] for change in changes])
+    with_data = {patient_id: data for patient_id, data in clinical_data.items() if any(data)}
+    analyses = analyze_patients_batch(with_data, {change['patient_id'] for change in changes if change.get('retry_allowed')})
+    
+    failed = {}
+    evaluated = []
+    for change in changes:
+        patient_id = change['patient_id']
+        analysis = analyses.get(patient_id, (None, None))
+        if isinstance(analysis, Exception):
+            failed[patient_id] = str(analysis)
+            continue
+        try:
+            unalerted = process_patient_alert(patient_id, change, clinical_data=clinical_data[patient_id],
+                                              analysis=analysis)
+            if unalerted:
+                evaluated.append(unalerted)
+        except Exception as e:
+            print(f"Error processing patient {patient_id}: {e}")
+            failed[patient_id] = str(e)
+    return failed, evaluated
+
 def generate_recommendation(patient_id, alert_type, alert_detail, vitals, labs, meds):
     """Generate clinical recommendation"""
     prompt = """You are an expert medical doctor providing clinical recommendations.
@@ -931,40 +2034,85 @@ Provide comprehensive clinical recommendations.
 """
     
     try:
-        response = bedrock_runtime.invoke_model(
-            modelId=os.getenv('BEDROCK_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0'),
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 2000,
-                "messages": [{"role": "user", "content": prompt + context}]
-            })
+        return invoke_bedrock(
+            prompt + context,
+            max_tokens=2000,
+            cache_parts=('recommendation', prompt, patient_id, alert_type, alert_detail,
+                         canonicalize_rows(vitals[:5]), canonicalize_rows(labs[:5]), canonicalize_rows(meds[:10]))
         )
         
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
-        
     except Exception as e:
         print(f"  ❌ Error generating recommendation: {e}")
         return f"Error generating recommendation: {str(e)}"
 
-def save_recommendation_to_s3(alert_id, recommendation, patient_id):
-    """Save recommendation to S3 with patient_id in filename"""
-    try:
-        s3_client.put_object(
-            Bucket=os.getenv('RECOMMENDATION_BUCKET_NAME'),
-            Key=f"{alert_id}_{patient_id}_recommendation.txt",
-            Body=recommendation.encode('utf-8')
-        )
-    except Exception as e:
-        print(f"  ❌ Error saving to S3: {e}")
+# Durable queue of patients awaiting evaluation and the worker pool that drains it
+eval_queue = EvaluationQueue(
+    db,
+    lease_seconds=int(os.getenv('EVAL_LEASE_SECONDS', '600')),
+    backoff_base=float(os.getenv('EVAL_RETRY_BACKOFF_BASE', '30')),
+    backoff_max=float(os.getenv('EVAL_RETRY_BACKOFF_MAX', '900')),
+    max_attempts=int(os.getenv('EVAL_MAX_ATTEMPTS', '5'))
+)
+evaluation_pool = PatientEvaluationPool(
+    int(os.getenv('MONITOR_WORKERS', '4')),
+    eval_queue,
+    batch_size=bedrock_batch_size()
+)
 
 def start_care_coordination_monitoring():
     """Start the background care coordination monitoring thread"""
+    # MONITOR_EMBEDDED=false leaves monitoring to separate monitor.py processes
+    if not MONITOR_EMBEDDED:
+        print("Care coordination monitoring runs in monitor.py, not in the web process")
+        return
     # Only start in the main process (not in Flask reloader process)
     if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
         monitor_thread = threading.Thread(target=check_new_entries_and_generate_alerts, daemon=True)
         monitor_thread.start()
 
+# ============ CLINICAL DATA INGEST ============
+
+# Feeds authenticate with "Authorization: Bearer <INGEST_API_TOKEN>"; a
+# logged-in dashboard session is accepted as well
+INGEST_API_TOKEN = os.getenv('INGEST_API_TOKEN') or None
+clinical_ingester = ClinicalIngester(
+    db,
+    eval_queue,
+    batch_size=int(os.getenv('INGEST_BATCH_SIZE', '500')),
+    lock_timeout=int(os.getenv('INGEST_LOCK_TIMEOUT', '30')),
+    # Rows are already queued; wake an in-process monitor to claim them now
+    on_commit=lambda patient_ids: change_feed.notify()
+)
+
+def ingest_auth_required(f):
+    """Decorator to require the ingest token or a dashboard login"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        header = request.headers.get('Authorization', '')
+        if INGEST_API_TOKEN and hmac.compare_digest(header.encode(), f"Bearer {INGEST_API_TOKEN}".encode()):
+            return f(*args, **kwargs)
+        if 'admin_id' in session:
+            return f(*args, **kwargs)
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    return decorated_function
+
+@app.route('/api/ingest', methods=['POST'])
+@ingest_auth_required
+def ingest_clinical_data():
+    """Bulk-load vitals, labs and medications from an NDJSON or CSV request body"""
+    data_format = request.args.get('format') or ('csv' if 'csv' in (request.content_type or '') else 'ndjson')
+    if data_format not in ('ndjson', 'csv'):
+        return jsonify({'success': False, 'message': 'format must be ndjson or csv'})
+    try:
+        # The body is read as a stream, so large feeds are never held in memory
+        summary = clinical_ingester.ingest(open_text_stream(request.stream), data_format, request.args.get('type'))
+        print(f"📥 Ingested {summary['inserted']} row(s) for {summary['patients']} patient(s) "
+              f"({summary['duplicates']} duplicate, {summary['invalid']} invalid, {summary['rows_per_s']} rows/s)")
+        return jsonify({'success': summary['failed_batches'] == 0, **summary})
+    except Exception as e:
+        print(f"❌ Error ingesting clinical data: {e}")
+        return jsonify({'success': False, 'message': str(e)})
+
 # ============ CHATBOT ENDPOINTS ============
 
 @app.route('/api/chatbot/patients')
@@ -983,15 +2131,81 @@ def get_patients_for_chatbot():
         print(f"Error fetching patients: {e}")
         return jsonify({'success': False, 'message': str(e)})
 
+# Knowledge base uploads and ingestion run in the background; requests only spool files to disk
+KB_UPLOAD_SPOOL_DIR = os.getenv('KB_UPLOAD_SPOOL_DIR') or None
+KB_UPLOAD_MEMORY_THRESHOLD = int(os.getenv('KB_UPLOAD_MEMORY_THRESHOLD_MB', '8')) * 1024 * 1024
+kb_ingestion = KnowledgeBaseIngestion(
+    s3_client,
+    get_client('bedrock-agent'),
+    os.getenv('BEDROCK_KNOWLEDGE_BUCKET_NAME'),
+    os.getenv('BEDROCK_KNOWLEDGE_ID'),
+    os.getenv('BEDROCK_KNOWLEDGE_DATA_SOURCE_ID'),
+    upload_workers=int(os.getenv('KB_UPLOAD_WORKERS', '4')),
+    debounce_seconds=float(os.getenv('KB_INGESTION_DEBOUNCE_SECONDS', '5')),
+    max_wait_seconds=float(os.getenv('KB_INGESTION_MAX_WAIT_SECONDS', '30')),
+    poll_interval=float(os.getenv('KB_INGESTION_POLL_SECONDS', '5')),
+    part_size=int(os.getenv('KB_UPLOAD_PART_SIZE_MB', '8')) * 1024 * 1024,
+    part_concurrency=int(os.getenv('KB_UPLOAD_PART_CONCURRENCY', '4')),
+    status_store=job_status
+)
+
+# Chatbot answers are reused until the knowledge base is re-ingested
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv('CHATBOT_CACHE_MAX_ENTRIES', '500')),
+    ttl=int(os.getenv('CHATBOT_CACHE_TTL', '3600')),
+    similarity_threshold=float(os.getenv('CHATBOT_CACHE_SIMILARITY', '0'))
+)
+
+# A sync finishing in any web worker is recorded in job_status; the other
+# workers compare it on their next chatbot query and drop their answers
+KB_SYNC_UNCHECKED = object()
+_seen_kb_sync = KB_SYNC_UNCHECKED
+
+def on_kb_sync_finished(status):
+    """Drop this worker's answers and tell the other workers"""
+    global _seen_kb_sync
+    answer_cache.invalidate()
+    finished_at = time.time()
+    job_status.save('kb_sync', 'latest', {'status': status, 'finished_at': finished_at})
+    _seen_kb_sync = finished_at
+
+def sync_answer_cache():
+    """Invalidate cached answers if a knowledge base sync finished in another worker"""
+    global _seen_kb_sync
+    marker = job_status.load('kb_sync', 'latest')
+    finished_at = marker['finished_at'] if marker else None
+    # The first check only records the marker; nothing is cached before it
+    if _seen_kb_sync is not KB_SYNC_UNCHECKED and finished_at != _seen_kb_sync:
+        answer_cache.invalidate()
+    _seen_kb_sync = finished_at
+
+kb_ingestion.add_listener(on_kb_sync_finished)
+
+# Token streaming for chatbot answers (CHATBOT_STREAM_BACKEND=stub runs without AWS)
+answer_streamer = make_answer_streamer(get_client)
+
+NO_KB_ANSWER = "I don't have any information in my knowledge base yet. Please upload documents first using the upload section above."
+
+def finalize_answer(answer):
+    """Replace empty or refusal answers with the upload hint"""
+    # Check if KB returned a meaningful answer
+    if not answer or "unable to assist" in answer.lower():
+        return NO_KB_ANSWER
+    return answer
+
 @app.route('/api/chatbot/upload', methods=['POST'])
 @login_required
 def upload_to_knowledge_base():
-    """Upload documents to Bedrock Knowledge Base S3 bucket"""
+    """
+    Upload documents to Bedrock Knowledge Base S3 bucket
+    Files are spooled and handed to the ingestion pipeline; the
+    response carries a job_id to poll at /api/chatbot/upload/<job_id>
+    """
     try:
         if 'files' not in request.files:
             return jsonify({'success': False, 'message': 'No files provided'})
         
-        files = request.files.getlist('files')
+        files = [file for file in request.files.getlist('files') if file.filename]
         category = request.form.get('category', 'internal-kb')
         patient_id = request.form.get('patient_id', '')
         
@@ -1001,11 +2215,11 @@ def upload_to_knowledge_base():
         # Determine S3 prefix
         if category == 'patient' and patient_id:
             # Get patient info using database client
-            patient = db.fetch_one(f"""
+            patient = db.fetch_one("""
                 SELECT patient_first_name, patient_last_name 
                 FROM patient 
-                WHERE patient_id = {patient_id}
-            """)
+                WHERE patient_id = %s
+            """, (patient_id,))
             if not patient:
                 return jsonify({'success': False, 'message': 'Patient not found'})
             
@@ -1015,54 +2229,34 @@ def upload_to_knowledge_base():
         else:
             s3_prefix = "internal-kb/"
         
-        # Upload files to S3
-        bucket_name = os.getenv('BEDROCK_KNOWLEDGE_BUCKET_NAME')
-        uploaded_files = []
-        
+        # Spool each file (large ones to disk) and hash it so the upload can outlive the request
+        spooled = []
         for file in files:
-            if file.filename:
-                # Keep original filename
-                s3_key = s3_prefix + file.filename
-                
-                # Upload to S3
-                s3_client.put_object(
-                    Bucket=bucket_name,
-                    Key=s3_key,
-                    Body=file.read()
-                )
-                uploaded_files.append(s3_key)
-        
-        # Sync data source twice with 10 second delay
-        knowledge_base_id = os.getenv('BEDROCK_KNOWLEDGE_ID')
-        data_source_id = os.getenv('BEDROCK_KNOWLEDGE_DATA_SOURCE_ID')
+            # Keep original filename
+            spooled.append(spool_upload(file, s3_prefix + file.filename, KB_UPLOAD_SPOOL_DIR, KB_UPLOAD_MEMORY_THRESHOLD))
         
-        bedrock_agent = boto3.client('bedrock-agent', region_name=os.getenv('AWS_REGION'))
-        
-        # First sync
-        bedrock_agent.start_ingestion_job(
-            knowledgeBaseId=knowledge_base_id,
-            dataSourceId=data_source_id
-        )
-        
-        # Wait 10 seconds
-        time.sleep(10)
-        
-        # Second sync
-        bedrock_agent.start_ingestion_job(
-            knowledgeBaseId=knowledge_base_id,
-            dataSourceId=data_source_id
-        )
+        job_id = kb_ingestion.submit(spooled)
         
         return jsonify({
             'success': True,
-            'message': f'Uploaded {len(uploaded_files)} file(s) and synced knowledge base',
-            'files': uploaded_files
+            'job_id': job_id,
+            'message': f'Uploading {len(spooled)} file(s); the knowledge base will sync when they finish',
+            'files': [f['key'] for f in spooled]
         })
         
     except Exception as e:
         print(f"Error uploading to KB: {e}")
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/chatbot/upload/<job_id>')
+@login_required
+def get_upload_status(job_id):
+    """Get progress of a knowledge base upload job"""
+    job = kb_ingestion.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Upload job not found'})
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/api/chatbot/query', methods=['POST'])
 @login_required
 def query_knowledge_base():
@@ -1076,11 +2270,18 @@ def query_knowledge_base():
         if not question:
             return jsonify({'success': False, 'message': 'No question provided'})
         
+        sync_answer_cache()
+        cached_answer = answer_cache.get(question)
+        if cached_answer is not None:
+            print(f"✅ Answer served from cache")
+            return jsonify({'success': True, 'answer': cached_answer, 'cached': True})
+        generation = answer_cache.generation()
+        
         # Query Bedrock Knowledge Base
         print(f"🔍 Querying KB ID: {os.getenv('BEDROCK_KNOWLEDGE_ID')}")
         print(f"🔍 Using model: {os.getenv('BEDROCK_MODEL_ID')}")
         
-        bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name=os.getenv('AWS_REGION'))
+        bedrock_agent_runtime = get_client('bedrock-agent-runtime')
         
         response = bedrock_agent_runtime.retrieve_and_generate(
             input={'text': question},
@@ -1093,14 +2294,12 @@ def query_knowledge_base():
             }
         )
         
-        print(f"✅ KB response received")
-        print(f"📄 Full response: {json.dumps(response, default=str)}")
-        
         answer = response.get('output', {}).get('text', 'No response from knowledge base')
+        print(f"✅ KB response received ({len(answer)} chars)")
         
-        # Check if KB returned a meaningful answer
-        if not answer or "unable to assist" in answer.lower():
-            answer = "I don't have any information in my knowledge base yet. Please upload documents first using the upload section above."
+        answer = finalize_answer(answer)
+        
+        answer_cache.put(question, answer, generation)
         
         return jsonify({
             'success': True,
@@ -1114,6 +2313,59 @@ def query_knowledge_base():
         print(f"Full traceback:\n{error_details}")
         return jsonify({'success': False, 'message': f"Error: {str(e)}"})
 
+@app.route('/api/chatbot/query/stream', methods=['POST'])
+@login_required
+def stream_knowledge_base_answer():
+    """
+    Query Bedrock Knowledge Base and stream the answer as Server-Sent Events
+    Emits 'token' events with text chunks, then a 'done' event with the
+    final answer (which replaces the streamed text if it was a refusal),
+    or an 'error' event
+    """
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '')
+    
+    print(f"📝 Chatbot question received (streaming): {question}")
+    
+    if not question:
+        return jsonify({'success': False, 'message': 'No question provided'})
+    
+    sync_answer_cache()
+    
+    def generate():
+        cached_answer = answer_cache.get(question)
+        if cached_answer is not None:
+            print(f"✅ Answer served from cache")
+            yield format_sse({'text': cached_answer}, event='token')
+            yield format_sse({'answer': cached_answer, 'cached': True}, event='done')
+            return
+        generation = answer_cache.generation()
+        
+        started = time.time()
+        first_token_at = None
+        chunks = []
+        try:
+            for text in answer_streamer.stream(question):
+                if first_token_at is None:
+                    first_token_at = time.time()
+                chunks.append(text)
+                yield format_sse({'text': text}, event='token')
+        except Exception as e:
+            print(f"❌ Error streaming KB answer: {e}")
+            yield format_sse({'message': f"Error: {str(e)}"}, event='error')
+            return
+        
+        answer = finalize_answer(''.join(chunks))
+        first_token_ms = round((first_token_at - started) * 1000) if first_token_at else None
+        print(f"✅ KB answer streamed ({len(answer)} chars, first token after {first_token_ms} ms)")
+        answer_cache.put(question, answer, generation)
+        yield format_sse({'answer': answer, 'cached': False}, event='done')
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 
 if __name__ == '__main__':
     # Start background care coordination monitoring
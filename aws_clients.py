@@ -0,0 +1,72 @@
+"""
+Shared registry of boto3 clients
+boto3 clients are thread-safe and expensive to build (credential
+resolution, endpoint and model loading), so every module gets its clients
+from here instead of constructing its own
+"""
+import os
+import threading
+import boto3
+from botocore.config import Config
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def build_client_config():
+    """
+    botocore Config shared by all clients
+    The HTTP pool is sized so every monitor worker, I/O worker and request
+    thread can hold a connection without waiting on another
+    """
+    default_pool = int(os.getenv('MONITOR_WORKERS', '4')) + int(os.getenv('IO_WORKERS', '8')) + 10
+    return Config(
+        max_pool_connections=int(os.getenv('AWS_MAX_POOL_CONNECTIONS', str(default_pool))),
+        tcp_keepalive=True,
+        connect_timeout=int(os.getenv('AWS_CONNECT_TIMEOUT', '5')),
+        # Bedrock model calls can take well over a minute
+        read_timeout=int(os.getenv('AWS_READ_TIMEOUT', '120')),
+        retries={
+            'mode': os.getenv('AWS_RETRY_MODE', 'adaptive'),
+            'max_attempts': int(os.getenv('AWS_MAX_ATTEMPTS', '5'))
+        }
+    )
+
+class AWSClientRegistry:
+    """Lazily created, process-wide boto3 clients keyed by service name"""
+
+    def __init__(self, region, config):
+        self.region = region
+        self.config = config
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def client(self, service):
+        """Return the shared client for a service, creating it on first use"""
+        with self._lock:
+            stats = self._stats.setdefault(service, {'created': 0, 'reused': 0})
+            client = self._clients.get(service)
+            if client is None:
+                # boto3's default session is not thread-safe, so creation stays under the lock
+                client = boto3.client(service, region_name=self.region, config=self.config)
+                self._clients[service] = client
+                stats['created'] += 1
+            else:
+                stats['reused'] += 1
+            return client
+
+    def get_stats(self):
+        """Return per-service creation/reuse counts and the pool configuration"""
+        with self._lock:
+            return {
+                'region': self.region,
+                'max_pool_connections': self.config.max_pool_connections,
+                'retry_mode': self.config.retries.get('mode'),
+                'services': {service: dict(stats) for service, stats in self._stats.items()}
+            }
+
+aws_clients = AWSClientRegistry(os.getenv('AWS_REGION', 'us-east-1'), build_client_config())
+
+def get_client(service):
+    """Shortcut for aws_clients.client(service)"""
+    return aws_clients.client(service)
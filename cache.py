@@ -0,0 +1,205 @@
+"""
+Small TTL/LRU cache with pluggable backends
+Used to avoid repeating expensive calls (Bedrock, S3, database) for
+results that have already been computed
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+def content_key(*parts):
+    """Build a content-addressed key (sha256) from JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class MemoryCacheBackend:
+    """In-process LRU store"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (value, expires_at) or None, marking the key most recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires_at):
+        """Store a value, evicting least recently used entries; returns evicted count"""
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        """Remove one key"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        """Remove every key starting with prefix"""
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Remove every key"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+class SQLiteCacheBackend:
+    """On-disk LRU store that survives restarts; values must be JSON-serializable"""
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Return (value, expires_at) or None, marking the key most recently used"""
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        """Store a value, evicting least recently used entries; returns evicted count"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, default=str), expires_at, time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            evicted = max(count - self.max_entries, 0)
+            if evicted:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access LIMIT ?)",
+                    (evicted,)
+                )
+            self._conn.commit()
+            return evicted
+
+    def delete(self, key):
+        """Remove one key"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def delete_prefix(self, prefix):
+        """Remove every key starting with prefix"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            self._conn.commit()
+
+    def clear(self):
+        """Remove every key"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+class TTLCache:
+    """TTL cache over a backend with hit/miss counters"""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'sets': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key, default=None):
+        """Return the cached value, or default on a miss or expired entry"""
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count('misses')
+            return default
+        value, expires_at = entry
+        if expires_at < time.time():
+            self.backend.delete(key)
+            self._count('expired')
+            self._count('misses')
+            return default
+        self._count('hits')
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value for ttl seconds (defaults to the cache TTL)"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        evicted = self.backend.set(key, value, expires_at)
+        self._count('sets')
+        if evicted:
+            self._count('evictions', evicted)
+
+    def delete(self, key):
+        """Invalidate one key"""
+        self.backend.delete(key)
+        self._count('invalidations')
+
+    def delete_prefix(self, prefix):
+        """Invalidate every key starting with prefix"""
+        self.backend.delete_prefix(prefix)
+        self._count('invalidations')
+
+    def clear(self):
+        """Invalidate everything"""
+        self.backend.clear()
+        self._count('invalidations')
+
+    def get_stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['size'] = len(self.backend)
+        return stats
+
+def make_cache(backend, ttl, max_entries, path=None):
+    """
+    Build a TTLCache from configuration values
+    backend is 'memory', 'sqlite' (requires path) or 'none' to disable caching
+    """
+    if backend == 'none':
+        return None
+    if backend == 'sqlite':
+        return TTLCache(SQLiteCacheBackend(path, max_entries), ttl)
+    return TTLCache(MemoryCacheBackend(max_entries), ttl)
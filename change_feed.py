@@ -0,0 +1,130 @@
+"""
+Tail of the clinical_change table
+MySQL triggers on vitals_data, lab_result and medication append a row per
+insert. The monitor reads rows past its cursor (an indexed primary key
+range, cheap enough to poll every second) and queues only those patients,
+instead of scanning the whole 30-day window every minute.
+
+AUTO_INCREMENT ids can become visible out of order when transactions
+commit late, so the cursor only advances over a contiguous run of ids.
+Each missing id is waited on for gap_timeout seconds from when it was
+first seen missing (ids left by rolled-back inserts never appear) before
+the cursor moves past it. Rows already read past a held gap are remembered
+so their patients are returned once, not on every poll. The monitor's
+periodic full scan backs this up and restarts the feed from the tail.
+"""
+import threading
+import time
+
+class ChangeFeed:
+    """Cursor over clinical_change for one monitor process"""
+
+    def __init__(self, db, batch_size=1000, gap_timeout=10, retention_hours=24):
+        self.db = db
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self.retention_hours = retention_hours
+        self.enabled = True
+        self._cursor = None
+        self._gaps = {}
+        self._returned = set()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'polls': 0, 'changes': 0, 'gaps_skipped': 0, 'pruned': 0}
+
+    def notify(self):
+        """Wake a waiting monitor early (e.g. after an in-process ingest)"""
+        self._wakeup.set()
+
+    def wait(self, timeout):
+        """Sleep until notified or timeout"""
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def reset(self):
+        """
+        Restart from the current tail of the table (and retry a disabled feed)
+        Call right before a full scan, which covers everything before the tail
+        """
+        self.enabled = True
+        self._gaps = {}
+        self._returned = set()
+        row = self.db.fetch_one("SELECT COALESCE(MAX(change_id), 0) AS change_id FROM clinical_change")
+        if row is None:
+            print("⚠ Clinical change feed unavailable; falling back to periodic full scans")
+            self.enabled = False
+            self._cursor = None
+            return
+        self._cursor = row['change_id']
+
+    def poll(self, shards=None, shard_count=1):
+        """Return the patient ids in our shards with new clinical rows since the last poll"""
+        if not self.enabled or self._cursor is None:
+            return []
+        # Read every shard's rows so gaps in the id sequence can be seen
+        rows = self.db.fetch_all("""
+            SELECT change_id, patient_id FROM clinical_change
+            WHERE change_id > %s
+            ORDER BY change_id
+            LIMIT %s
+        """, (self._cursor, self.batch_size))
+
+        # Rows past a held gap are read again until it closes; only report new ones
+        new_rows = [row for row in rows if row['change_id'] not in self._returned]
+        with self._lock:
+            self._stats['polls'] += 1
+            self._stats['changes'] += len(new_rows)
+        if not rows:
+            return []
+        self._returned.update(row['change_id'] for row in new_rows)
+        self._advance([row['change_id'] for row in rows])
+        return sorted({row['patient_id'] for row in new_rows
+                       if shards is None or shard_count <= 1 or row['patient_id'] % shard_count in shards})
+
+    def _advance(self, change_ids):
+        """Move the cursor over present ids and over missing ids older than gap_timeout"""
+        now = time.monotonic()
+        present = set(change_ids)
+        for change_id in range(self._cursor + 1, change_ids[-1]):
+            if change_id not in present:
+                self._gaps.setdefault(change_id, now)
+
+        cursor = self._cursor
+        skipped = 0
+        while cursor < change_ids[-1]:
+            next_id = cursor + 1
+            if next_id not in present:
+                if now - self._gaps[next_id] <= self.gap_timeout:
+                    break
+                skipped += 1
+            cursor = next_id
+        self._cursor = cursor
+
+        # Forget bookkeeping the cursor has moved past
+        self._gaps = {change_id: since for change_id, since in self._gaps.items() if change_id > cursor}
+        self._returned = {change_id for change_id in self._returned if change_id > cursor}
+        if skipped:
+            with self._lock:
+                self._stats['gaps_skipped'] += skipped
+
+    def prune(self):
+        """Delete change rows older than the retention window"""
+        if not self.enabled:
+            return
+        with self.db.connection() as conn:
+            with conn.cursor() as cursor:
+                deleted = cursor.execute(
+                    "DELETE FROM clinical_change WHERE created_at < NOW() - INTERVAL %s HOUR LIMIT 10000",
+                    (self.retention_hours,)
+                )
+        with self._lock:
+            self._stats['pruned'] += deleted or 0
+
+    def get_stats(self):
+        """Return cursor position and poll counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['cursor'] = self._cursor
+        stats['pending_gaps'] = len(self._gaps)
+        return stats
@@ -0,0 +1,57 @@
+"""
+Streaming knowledge base answers for the chatbot
+BedrockAnswerStreamer yields answer text as retrieve_and_generate_stream
+produces it. StubAnswerStreamer yields a canned answer word by word, for
+running the chat panel locally without AWS (CHATBOT_STREAM_BACKEND=stub).
+"""
+import os
+import time
+
+class BedrockAnswerStreamer:
+    """Stream answer text from a Bedrock knowledge base"""
+
+    def __init__(self, client_factory, knowledge_base_id, model_arn):
+        self.client_factory = client_factory
+        self.knowledge_base_id = knowledge_base_id
+        self.model_arn = model_arn
+
+    def stream(self, question):
+        """Yield answer text chunks as they arrive"""
+        response = self.client_factory('bedrock-agent-runtime').retrieve_and_generate_stream(
+            input={'text': question},
+            retrieveAndGenerateConfiguration={
+                'type': 'KNOWLEDGE_BASE',
+                'knowledgeBaseConfiguration': {
+                    'knowledgeBaseId': self.knowledge_base_id,
+                    'modelArn': self.model_arn
+                }
+            }
+        )
+        for event in response['stream']:
+            text = event.get('output', {}).get('text')
+            if text:
+                yield text
+
+class StubAnswerStreamer:
+    """Yield a fixed answer in small pieces with a delay between them"""
+
+    def __init__(self, answer=None, delay=0.05):
+        self.answer = answer or "This is a stubbed knowledge base answer for local testing."
+        self.delay = delay
+
+    def stream(self, question):
+        """Yield the stub answer word by word"""
+        for index, word in enumerate(self.answer.split(' ')):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word if index == 0 else ' ' + word
+
+def make_answer_streamer(client_factory):
+    """Build the streamer selected by CHATBOT_STREAM_BACKEND ('bedrock' or 'stub')"""
+    if os.getenv('CHATBOT_STREAM_BACKEND', 'bedrock') == 'stub':
+        return StubAnswerStreamer(os.getenv('CHATBOT_STREAM_STUB_ANSWER'))
+    return BedrockAnswerStreamer(
+        client_factory,
+        os.getenv('BEDROCK_KNOWLEDGE_ID'),
+        f"arn:aws:bedrock:{os.getenv('AWS_REGION')}::foundation-model/{os.getenv('BEDROCK_MODEL_ID')}"
+    )
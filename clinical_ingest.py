@@ -0,0 +1,381 @@
+"""
+Bulk ingestion of vitals, lab results and medications
+Rows arrive as NDJSON (one JSON object per line) or CSV (header row) and
+are validated, then written in batches: each batch is one transaction
+that drops rows already stored for the same patient and timestamp,
+inserts the rest with executemany (one multi-row INSERT per table) and
+queues the affected patients for evaluation. Batches writing the same
+table are serialized with a MySQL named lock (GET_LOCK), so concurrent
+ingests of the same rows cannot both miss each other's duplicates.
+"""
+import csv
+import io
+import json
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from clinical_rules import screen_patient_data
+
+# Record type -> (table, timestamp column, {column: (kind, max length)})
+# Medications are deduplicated on the medication name as well, since one
+# administration time commonly covers several drugs.
+INGEST_TYPES = {
+    'vitals': ('vitals_data', 'vitals_date_time', {
+        'blood_pressure': ('str', 20),
+        'heart_rate': ('int', None),
+        'temperature': ('decimal', None),
+        'weight': ('decimal', None),
+        'height': ('decimal', None),
+        'BMI': ('decimal', None),
+        'spo2': ('int', None),
+        'recorded_by': ('str', 100),
+        'notes': ('str', 65535),
+    }),
+    'labs': ('lab_result', 'lab_date_time', {
+        'sodium': ('decimal', None),
+        'potassium': ('decimal', None),
+        'BUN': ('decimal', None),
+        'creatinine': ('decimal', None),
+        'glucose': ('decimal', None),
+        'lab_technician': ('str', 100),
+        'lab_notes': ('str', 65535),
+    }),
+    'medications': ('medication', 'medication_date_time', {
+        'medication_name': ('str', 200),
+        'medication_dose': ('str', 100),
+        'medication_frequency': ('str', 100),
+        'medication_route': ('str', 50),
+        'prescribed_by': ('str', 100),
+        'medication_notes': ('str', 65535),
+    }),
+}
+REQUIRED_COLUMNS = {'medications': ('medication_name',)}
+TYPE_ALIASES = {'vitals_data': 'vitals', 'lab_result': 'labs', 'lab': 'labs', 'medication': 'medications'}
+MAX_REPORTED_ERRORS = 100
+
+class IngestError(ValueError):
+    """A row failed validation"""
+
+def parse_value(value, kind, max_length, column):
+    """Convert one field to the column's type; blank values become NULL"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if kind == 'int':
+        # JSON floats and CSV strings go through the same check, so 72.5 is rejected rather than truncated
+        try:
+            number = Decimal(str(value).strip())
+        except InvalidOperation:
+            raise IngestError(f"{column} must be an integer")
+        if not number.is_finite() or number != number.to_integral_value():
+            raise IngestError(f"{column} must be an integer")
+        return int(number)
+    if kind == 'decimal':
+        try:
+            number = Decimal(str(value).strip())
+        except InvalidOperation:
+            raise IngestError(f"{column} must be a number")
+        if not number.is_finite():
+            raise IngestError(f"{column} must be a number")
+        return number
+    value = str(value).strip()
+    if len(value) > max_length:
+        raise IngestError(f"{column} is longer than {max_length} characters")
+    return value
+
+def parse_timestamp(value, column):
+    """
+    Parse an ISO 8601 date/time ('2024-05-01 08:30:00' or '2024-05-01T08:30:00')
+    Values with an offset ('Z', '+02:00') are converted to local time, which
+    the DATETIME columns are stored in.
+    """
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except (TypeError, ValueError):
+        raise IngestError(f"{column} must be an ISO date/time")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    # DATETIME columns keep whole seconds; truncating here keeps dedup keys equal to stored values
+    return parsed.replace(microsecond=0)
+
+def validate_record(record, default_type=None):
+    """Return (record type, row dict) for a raw record, or raise IngestError"""
+    record_type = record.get('type') or default_type
+    record_type = TYPE_ALIASES.get(record_type, record_type)
+    if record_type not in INGEST_TYPES:
+        raise IngestError(f"type must be one of {', '.join(INGEST_TYPES)}")
+    table, time_column, columns = INGEST_TYPES[record_type]
+
+    try:
+        patient_id = int(record.get('patient_id'))
+    except (TypeError, ValueError):
+        raise IngestError("patient_id must be an integer")
+    if not record.get(time_column):
+        raise IngestError(f"{time_column} is required")
+
+    row = {'patient_id': patient_id, time_column: parse_timestamp(record[time_column], time_column)}
+    for column, (kind, max_length) in columns.items():
+        row[column] = parse_value(record.get(column), kind, max_length, column)
+    for column in REQUIRED_COLUMNS.get(record_type, ()):
+        if row[column] is None:
+            raise IngestError(f"{column} is required")
+    return record_type, row
+
+def read_records(stream, data_format):
+    """Yield (line number, raw record dict or IngestError) from a text stream"""
+    if data_format == 'csv':
+        for line_number, record in enumerate(csv.DictReader(stream), start=2):
+            yield line_number, record
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, IngestError(f"invalid JSON: {e}")
+            continue
+        yield line_number, record if isinstance(record, dict) else IngestError("each line must be a JSON object")
+
+def normalize_name(name):
+    """
+    Compare names the way the column collation (utf8mb4_unicode_ci) does:
+    case- and accent-insensitive, ignoring trailing spaces
+    """
+    decomposed = unicodedata.normalize('NFKD', name.rstrip(' '))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+def dedup_key(record_type, row):
+    """Identity of a clinical row for deduplication (from a parsed or a stored row)"""
+    time_column = INGEST_TYPES[record_type][1]
+    if record_type == 'medications':
+        return (row['patient_id'], row[time_column], normalize_name(row['medication_name']))
+    return (row['patient_id'], row[time_column])
+
+class ClinicalIngester:
+    """
+    Batched, transactional writer for clinical rows
+    eval_queue (an EvaluationQueue) receives the affected patients inside
+    each batch's transaction; on_commit is called with their ids after it.
+    """
+
+    def __init__(self, db, eval_queue, batch_size=500, on_commit=None, lock_timeout=30, lock_prefix='care_ingest'):
+        self.db = db
+        self.eval_queue = eval_queue
+        self.batch_size = batch_size
+        self.on_commit = on_commit
+        self.lock_timeout = lock_timeout
+        self.lock_prefix = lock_prefix
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'rows_received': 0,
+            'rows_inserted': 0,
+            'duplicates': 0,
+            'invalid': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'seconds': 0.0,
+            'last_rows_per_s': None
+        }
+
+    def ingest(self, stream, data_format='ndjson', default_type=None):
+        """Ingest every record in a text stream; returns a summary of the run"""
+        start = time.monotonic()
+        summary = {'received': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0,
+                   'batches': 0, 'failed_batches': 0, 'patients': set(), 'errors': []}
+
+        def report(line_number, message):
+            summary['invalid'] += 1
+            if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                summary['errors'].append({'line': line_number, 'error': message})
+
+        batch = []
+        for line_number, record in read_records(stream, data_format):
+            summary['received'] += 1
+            if isinstance(record, IngestError):
+                report(line_number, str(record))
+                continue
+            try:
+                batch.append((line_number, *validate_record(record, default_type)))
+            except IngestError as e:
+                report(line_number, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch, summary, report)
+                batch = []
+        if batch:
+            self._write_batch(batch, summary, report)
+
+        duration = time.monotonic() - start
+        rows_per_s = round(summary['inserted'] / duration, 1) if duration > 0 else None
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['rows_received'] += summary['received']
+            self._stats['rows_inserted'] += summary['inserted']
+            self._stats['duplicates'] += summary['duplicates']
+            self._stats['invalid'] += summary['invalid']
+            self._stats['batches'] += summary['batches']
+            self._stats['failed_batches'] += summary['failed_batches']
+            self._stats['seconds'] += duration
+            self._stats['last_rows_per_s'] = rows_per_s
+
+        summary['patients'] = len(summary['patients'])
+        summary['errors'].sort(key=lambda error: error['line'])
+        summary['duration_s'] = round(duration, 3)
+        summary['rows_per_s'] = rows_per_s
+        return summary
+
+    def _write_batch(self, batch, summary, report):
+        """Write one batch in a transaction, recording the outcome in summary"""
+        try:
+            inserted, duplicates, patient_ids, rejected = self._insert_batch(batch)
+        except Exception as e:
+            print(f"❌ Ingest batch of {len(batch)} row(s) failed: {e}")
+            summary['failed_batches'] += 1
+            for line_number, _, _ in batch:
+                report(line_number, f"batch failed: {e}")
+            return
+        for line_number, message in rejected:
+            report(line_number, message)
+        summary['batches'] += 1
+        summary['inserted'] += inserted
+        summary['duplicates'] += duplicates
+        summary['patients'].update(patient_ids)
+        if patient_ids and self.on_commit:
+            self.on_commit(patient_ids)
+
+    def _lock_tables(self, conn, tables):
+        """Take the named lock of each table (in a fixed order); returns the names held"""
+        held = []
+        try:
+            for table in sorted(tables):
+                name = f"{self.lock_prefix}.{table}"
+                row = self.db.fetch_one_on(conn, "SELECT GET_LOCK(%s, %s) AS acquired", (name, self.lock_timeout))
+                if not row or row['acquired'] != 1:
+                    raise RuntimeError(f"timed out waiting for another ingest into {table}")
+                held.append(name)
+        except Exception:
+            self._unlock_tables(conn, held)
+            raise
+        return held
+
+    def _unlock_tables(self, conn, names):
+        """Release named locks taken by _lock_tables"""
+        for name in names:
+            self.db.fetch_one_on(conn, "SELECT RELEASE_LOCK(%s)", (name,))
+
+    def _insert_batch(self, batch):
+        """
+        Dedupe, insert and queue one batch
+        Returns (inserted, duplicates, patient ids, [(line number, error)] for rejected rows)
+        """
+        tables = {INGEST_TYPES[record_type][0] for _, record_type, _ in batch}
+        with self.db.connection() as conn:
+            # Named locks outlive the transaction, so they are released after its commit
+            held = self._lock_tables(conn, tables)
+            try:
+                conn.begin()
+                result = self._insert_rows(conn, batch)
+                conn.commit()
+            finally:
+                self._unlock_tables(conn, held)
+        return result
+
+    def _insert_rows(self, conn, batch):
+        """Reject unknown patients, then dedupe, insert and queue the rest on conn"""
+        patient_ids = sorted({row['patient_id'] for _, _, row in batch})
+        known = {row['patient_id'] for row in self.db.fetch_all_on(
+            conn,
+            f"SELECT patient_id FROM patient WHERE patient_id IN ({', '.join(['%s'] * len(patient_ids))})",
+            patient_ids
+        )}
+
+        by_type = {}
+        rejected = []
+        for line_number, record_type, row in batch:
+            if row['patient_id'] not in known:
+                rejected.append((line_number, f"unknown patient_id {row['patient_id']}"))
+                continue
+            by_type.setdefault(record_type, []).append(row)
+
+        inserted = duplicates = 0
+        affected = set()
+        latest = {}
+        for record_type, rows in by_type.items():
+            fresh = self._drop_duplicates(conn, record_type, rows)
+            duplicates += len(rows) - len(fresh)
+            if not fresh:
+                continue
+            table, time_column, columns = INGEST_TYPES[record_type]
+            names = ['patient_id', time_column, *columns]
+            with conn.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))})",
+                    [tuple(row[name] for name in names) for row in fresh]
+                )
+            inserted += len(fresh)
+            for row in fresh:
+                affected.add(row['patient_id'])
+                # Latest ingested vitals/lab row per patient, for the queue priority
+                previous = latest.get((record_type, row['patient_id']))
+                if previous is None or row[time_column] >= previous[time_column]:
+                    latest[(record_type, row['patient_id'])] = row
+
+        if affected:
+            self._queue_patients(conn, sorted(affected), latest)
+        return inserted, duplicates, sorted(affected), rejected
+
+    def _drop_duplicates(self, conn, record_type, rows):
+        """Rows not already stored and not repeated earlier in the batch"""
+        table, time_column, _ = INGEST_TYPES[record_type]
+        key_columns = ['patient_id', time_column] + (['medication_name'] if record_type == 'medications' else [])
+        unique = {}
+        for row in rows:
+            unique.setdefault(dedup_key(record_type, row), row)
+
+        placeholders = ', '.join(['(' + ', '.join(['%s'] * len(key_columns)) + ')'] * len(unique))
+        params = [row[column] for row in unique.values() for column in key_columns]
+        # Plain read: the table's named lock keeps concurrent batches from inserting in between
+        existing = self.db.fetch_all_on(conn, f"""
+            SELECT {', '.join(key_columns)} FROM {table}
+            WHERE ({', '.join(key_columns)}) IN ({placeholders})
+        """, params)
+        # The IN match follows the column collation; compare keys normalized the same way
+        stored = {dedup_key(record_type, row) for row in existing}
+        return [row for key, row in unique.items() if key not in stored]
+
+    def _queue_patients(self, conn, patient_ids, latest):
+        """Queue affected patients for evaluation with their latest timestamps, on conn"""
+        placeholders = ', '.join(['%s'] * len(patient_ids))
+        changes = {patient_id: {'patient_id': patient_id} for patient_id in patient_ids}
+        for table, time_column, key in (('vitals_data', 'vitals_date_time', 'latest_vitals_time'),
+                                        ('lab_result', 'lab_date_time', 'latest_lab_time'),
+                                        ('medication', 'medication_date_time', 'latest_med_time')):
+            for row in self.db.fetch_all_on(conn, f"""
+                SELECT patient_id, MAX({time_column}) AS latest FROM {table}
+                WHERE patient_id IN ({placeholders})
+                GROUP BY patient_id
+            """, patient_ids):
+                changes[row['patient_id']][key] = row['latest']
+
+        priorities = {}
+        for patient_id in patient_ids:
+            vitals = latest.get(('vitals', patient_id))
+            labs = latest.get(('labs', patient_id))
+            priorities[patient_id] = len(screen_patient_data([vitals] if vitals else [], [labs] if labs else []))
+        self.eval_queue.enqueue(list(changes.values()), priorities, conn=conn)
+
+    def get_stats(self):
+        """Return ingestion counters and throughput"""
+        with self._lock:
+            stats = dict(self._stats)
+        seconds = stats.pop('seconds')
+        stats['total_seconds'] = round(seconds, 3)
+        stats['avg_rows_per_s'] = round(stats['rows_inserted'] / seconds, 1) if seconds > 0 else None
+        return stats
+
+def open_text_stream(binary_stream):
+    """Wrap a binary stream (request body, stdin) for line-by-line UTF-8 reading"""
+    return io.TextIOWrapper(binary_stream, encoding='utf-8', newline='')
@@ -0,0 +1,156 @@
+"""
+Deterministic clinical rules for screening vitals and lab results
+Uses the same normal ranges as the Bedrock analysis prompt so normal
+patients can be cleared locally without a model call
+"""
+from datetime import datetime
+from decimal import Decimal
+
+# column, label, unit, low, high
+# A value is abnormal when it is strictly below low or strictly above high
+VITAL_RULES = [
+    ('heart_rate', 'Heart Rate', 'bpm', 60, 100),
+    ('temperature', 'Temperature', '°F', 97, 99),
+    ('spo2', 'SpO2', '%', 95, None),
+    ('BMI', 'BMI', '', 18.5, 24.9),
+]
+
+LAB_RULES = [
+    ('sodium', 'Sodium', 'mEq/L', 135, 145),
+    ('potassium', 'Potassium', 'mEq/L', 3.5, 5.0),
+    ('BUN', 'BUN', 'mg/dL', 7, 20),
+    ('creatinine', 'Creatinine', 'mg/dL', 0.6, 1.2),
+    ('glucose', 'Glucose', 'mg/dL', 70, 140),
+]
+
+# Blood pressure is stored as "systolic/diastolic"; like the prompt, only
+# readings above 120/80 are flagged (low pressure is left to the model)
+SYSTOLIC_RANGE = (None, 120)
+DIASTOLIC_RANGE = (None, 80)
+
+# Temperatures below this are assumed to be recorded in Celsius
+CELSIUS_CUTOFF = 50
+
+def to_number(value):
+    """Convert a DB value (Decimal, int, str) to float, or None if missing/invalid"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return None
+
+def parse_blood_pressure(value):
+    """Split a "120/80" reading into (systolic, diastolic) floats"""
+    if not value or '/' not in str(value):
+        return None, None
+    systolic, diastolic = str(value).split('/', 1)
+    return to_number(systolic), to_number(diastolic)
+
+def format_value(value):
+    """Format numbers the way the alert text shows them (no trailing .0)"""
+    return f"{value:g}"
+
+def column(rows, key, transform=to_number):
+    """Extract one column across all rows"""
+    return [transform(row.get(key)) for row in rows]
+
+def out_of_range(values, low, high):
+    """Return (index, value, status) for every value outside [low, high]"""
+    flagged = []
+    for index, value in enumerate(values):
+        if value is None:
+            continue
+        if low is not None and value < low:
+            flagged.append((index, value, 'Low'))
+        elif high is not None and value > high:
+            flagged.append((index, value, 'High'))
+    return flagged
+
+def make_finding(row, time_key, parameter, value, unit, status, low, high, display=None):
+    """Build a structured abnormality finding"""
+    recorded_at = row.get(time_key)
+    if isinstance(recorded_at, datetime):
+        recorded_at = recorded_at.strftime('%Y-%m-%d %H:%M:%S')
+    return {
+        'parameter': parameter,
+        'status': status,
+        'value': display if display is not None else format_value(value),
+        'unit': unit,
+        'normal_low': low,
+        'normal_high': high,
+        'recorded_at': recorded_at
+    }
+
+def screen_vitals(vitals):
+    """Evaluate every vitals row against the normal ranges"""
+    findings = []
+    if not vitals:
+        return findings
+
+    # Blood pressure: flag if either component is outside its range
+    pressures = column(vitals, 'blood_pressure', parse_blood_pressure)
+    systolic = [bp[0] for bp in pressures]
+    diastolic = [bp[1] for bp in pressures]
+    flagged = {}
+    for index, _, status in out_of_range(systolic, *SYSTOLIC_RANGE) + out_of_range(diastolic, *DIASTOLIC_RANGE):
+        flagged.setdefault(index, status)
+    for index in sorted(flagged):
+        findings.append(make_finding(
+            vitals[index], 'vitals_date_time', 'Blood Pressure', None, 'mmHg', flagged[index],
+            '90/60', '120/80', display=str(vitals[index]['blood_pressure']).strip()
+        ))
+
+    for key, label, unit, low, high in VITAL_RULES:
+        values = column(vitals, key)
+        if key == 'temperature':
+            # Normalize Celsius readings to Fahrenheit before comparing
+            values = [round(v * 9 / 5 + 32, 1) if v is not None and v < CELSIUS_CUTOFF else v for v in values]
+        for index, value, status in out_of_range(values, low, high):
+            findings.append(make_finding(vitals[index], 'vitals_date_time', label, value, unit, status, low, high))
+
+    return findings
+
+def screen_labs(labs):
+    """Evaluate every lab row against the normal ranges"""
+    findings = []
+    for key, label, unit, low, high in LAB_RULES:
+        values = column(labs, key)
+        for index, value, status in out_of_range(values, low, high):
+            findings.append(make_finding(labs[index], 'lab_date_time', label, value, unit, status, low, high))
+    return findings
+
+def screen_patient_data(vitals, labs):
+    """Run all rules and return the list of abnormal findings (empty when normal)"""
+    return screen_vitals(vitals) + screen_labs(labs)
+
+def summarize_findings(findings):
+    """
+    Build (alert_type, alert_detail) from findings in the same format the
+    Bedrock prompt asks for; each parameter is listed once using its most
+    recent abnormal reading (rows arrive newest first)
+    """
+    latest = {}
+    for finding in findings:
+        latest.setdefault(finding['parameter'], finding)
+
+    labels = []
+    details = []
+    for finding in latest.values():
+        value = f"{finding['value']}{finding['unit']}" if finding['unit'] in ('%', '°F') else f"{finding['value']} {finding['unit']}".strip()
+        labels.append(f"{finding['status']} {finding['parameter']} ({value})")
+        if finding['normal_high'] is None:
+            normal = f">{format_value(finding['normal_low'])}"
+        elif finding['normal_low'] is None:
+            normal = f"<{format_value(finding['normal_high'])}"
+        elif isinstance(finding['normal_low'], str):
+            normal = f"{finding['normal_low']} to {finding['normal_high']}"
+        else:
+            normal = f"{format_value(finding['normal_low'])}-{format_value(finding['normal_high'])}"
+        details.append(f"{finding['parameter']} at {value} is {finding['status'].lower()} (normal {normal}) as of {finding['recorded_at']}")
+
+    alert_type = ', '.join(labels)
+    alert_detail = 'Rule-based screening found: ' + '; '.join(details) + '.'
+    return alert_type, alert_detail
@@ -125,6 +125,30 @@ CREATE TABLE IF NOT EXISTS medication (
     INDEX idx_medication_name (medication_name)
 );
 
+-- Clinical change log - One row per inserted vitals/lab/medication row,
+-- written by the triggers below in the same transaction as the insert.
+-- The monitor tails it by change_id to queue patients within seconds.
+CREATE TABLE IF NOT EXISTS clinical_change (
+    change_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    patient_id INT NOT NULL,
+    source ENUM('vitals', 'lab', 'medication') NOT NULL,
+    recorded_at DATETIME,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_created (created_at)
+);
+
+DROP TRIGGER IF EXISTS trg_vitals_data_change;
+CREATE TRIGGER trg_vitals_data_change AFTER INSERT ON vitals_data FOR EACH ROW
+    INSERT INTO clinical_change (patient_id, source, recorded_at) VALUES (NEW.patient_id, 'vitals', NEW.vitals_date_time);
+
+DROP TRIGGER IF EXISTS trg_lab_result_change;
+CREATE TRIGGER trg_lab_result_change AFTER INSERT ON lab_result FOR EACH ROW
+    INSERT INTO clinical_change (patient_id, source, recorded_at) VALUES (NEW.patient_id, 'lab', NEW.lab_date_time);
+
+DROP TRIGGER IF EXISTS trg_medication_change;
+CREATE TRIGGER trg_medication_change AFTER INSERT ON medication FOR EACH ROW
+    INSERT INTO clinical_change (patient_id, source, recorded_at) VALUES (NEW.patient_id, 'medication', NEW.medication_date_time);
+
 -- ============================================
 -- ALERT MANAGEMENT TABLES
 -- ============================================
@@ -141,6 +165,7 @@ CREATE TABLE IF NOT EXISTS alert (
     alert_severity ENUM('Low', 'Medium', 'High', 'Critical') DEFAULT 'Medium',
     reviewed_by INT,
     reviewed_at DATETIME,
+    recommendation_key VARCHAR(255) DEFAULT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (patient_id) REFERENCES patient(patient_id) ON DELETE CASCADE,
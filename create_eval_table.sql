@@ -10,10 +10,43 @@ CREATE TABLE IF NOT EXISTS eval (
     FOREIGN KEY (patient_id) REFERENCES patient(patient_id) ON DELETE CASCADE
 );
 
+-- Durable queue of patients waiting for evaluation (one row per patient)
+-- Monitors claim rows by priority with a lease; failed evaluations are
+-- retried after a backoff, and version changes whenever newer data arrives
+CREATE TABLE IF NOT EXISTS eval_queue (
+    patient_id INT NOT NULL PRIMARY KEY,
+    priority INT NOT NULL DEFAULT 0,
+    latest_vitals_time DATETIME DEFAULT NULL,
+    latest_lab_time DATETIME DEFAULT NULL,
+    latest_med_time DATETIME DEFAULT NULL,
+    version INT NOT NULL DEFAULT 1,
+    attempts INT NOT NULL DEFAULT 0,
+    available_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    lease_owner VARCHAR(64) DEFAULT NULL,
+    lease_expires_at DATETIME DEFAULT NULL,
+    last_error VARCHAR(500) DEFAULT NULL,
+    enqueued_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_claim (priority, enqueued_at),
+    FOREIGN KEY (patient_id) REFERENCES patient(patient_id) ON DELETE CASCADE
+);
+
+-- Latest status of email and knowledge base upload jobs, so any web
+-- worker can answer a status poll for a job another worker is running
+CREATE TABLE IF NOT EXISTS job_status (
+    kind VARCHAR(32) NOT NULL,
+    job_id VARCHAR(64) NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (kind, job_id),
+    INDEX idx_updated (updated_at)
+);
+
 -- Add alert_archive column to alert table
 ALTER TABLE alert 
 ADD COLUMN alert_archive TINYINT DEFAULT 0;
 
 -- Verify the changes
 DESCRIBE eval;
+DESCRIBE eval_queue;
+DESCRIBE job_status;
 DESCRIBE alert;
@@ -0,0 +1,284 @@
+"""
+Queued email dispatch through SES
+Messages are built as MIME multipart (text body plus attachments), queued,
+and sent by background workers with send_raw_email. A token bucket keeps
+the send rate within the SES account's maximum send rate, and throttling
+errors are retried with backoff. Each message has a status that callers
+can poll.
+"""
+import base64
+import queue
+import random
+import threading
+import time
+import uuid
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from botocore.exceptions import ClientError
+
+# SES accepts at most 50 recipients and 10 MB (after encoding) per raw message
+SES_MAX_RECIPIENTS = 50
+SES_MAX_MESSAGE_BYTES = 10 * 1024 * 1024
+THROTTLING_CODES = ('Throttling', 'ThrottlingException', 'TooManyRequestsException')
+
+# Message states
+MESSAGE_QUEUED = 'queued'
+MESSAGE_SENDING = 'sending'
+MESSAGE_SENT = 'sent'
+MESSAGE_FAILED = 'failed'
+
+def build_mime_message(sender, to_emails, subject, body, attachments=None):
+    """
+    Build a raw MIME message
+    attachments is a list of dicts with 'filename', 'content' (bytes, str,
+    or base64 text when 'base64' is true) and optional 'content_type'
+    """
+    message = MIMEMultipart('mixed')
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = ', '.join(to_emails)
+    message.attach(MIMEText(body, 'plain', 'utf-8'))
+
+    for attachment in attachments or []:
+        content = attachment['content']
+        if attachment.get('base64'):
+            content = base64.b64decode(content)
+        elif isinstance(content, str):
+            content = content.encode('utf-8')
+        maintype, _, subtype = attachment.get('content_type', 'application/octet-stream').partition('/')
+        part = MIMEApplication(content, _subtype=subtype or 'octet-stream')
+        if maintype != 'application':
+            part.replace_header('Content-Type', f"{maintype}/{subtype}")
+        part.add_header('Content-Disposition', 'attachment', filename=attachment['filename'])
+        message.attach(part)
+
+    return message.as_bytes()
+
+def is_throttling_error(error):
+    """True for SES errors that should be retried after a pause"""
+    if not isinstance(error, ClientError):
+        return False
+    details = error.response.get('Error', {})
+    return details.get('Code') in THROTTLING_CODES or 'rate exceeded' in details.get('Message', '').lower()
+
+class TokenBucket:
+    """Blocking token bucket: rate tokens per second, bursts up to capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Wait until tokens are available and take them; returns seconds waited"""
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class EmailDispatcher:
+    """
+    Background SES sender with per-message status
+    When max_send_rate is None the account's MaxSendRate is read from
+    get_send_quota when the first message is sent. The rate is account-wide,
+    so each of the processes sending email gets an equal share of it. With a
+    status_store (a JobStatusStore) every status change is shared with other
+    processes.
+    """
+
+    def __init__(self, ses_client, sender, max_send_rate=None, workers=2, max_retries=5,
+                 backoff_base=1.0, backoff_max=30.0, status_ttl=3600, status_store=None, processes=1):
+        self.ses_client = ses_client
+        self.sender = sender
+        self.max_send_rate = max_send_rate
+        self.processes = max(int(processes), 1)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.status_ttl = status_ttl
+        self.status_store = status_store
+
+        self._queue = queue.Queue()
+        self._messages = {}
+        self._lock = threading.Lock()
+        self._limiter = None
+        self._threads = []
+        self._stats = {'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'throttled': 0, 'rate_wait_s': 0.0}
+
+    def _ensure_limiter(self):
+        """Create this process's rate limiter on first use (reads the SES quota, so called without the lock)"""
+        if self._limiter is not None:
+            return
+        rate = self.max_send_rate
+        if rate is None:
+            try:
+                rate = self.ses_client.get_send_quota()['MaxSendRate']
+            except Exception as e:
+                print(f"⚠ Could not read SES send quota ({e}), limiting to 1 email/s")
+                rate = 1
+        limiter = TokenBucket(float(rate) / self.processes)
+        with self._lock:
+            if self._limiter is None:
+                self._limiter = limiter
+
+    def _ensure_workers(self):
+        """Start worker threads on first use (caller holds the lock)"""
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"email-dispatch-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _prune(self, now):
+        """Forget finished messages older than the status TTL (caller holds the lock)"""
+        for message_id in [m for m, status in self._messages.items()
+                           if status['status'] in (MESSAGE_SENT, MESSAGE_FAILED) and now - status['updated_at'] > self.status_ttl]:
+            del self._messages[message_id]
+
+    def _build(self, to_emails, subject, body, attachments):
+        """Validate recipients and build the raw message"""
+        to_emails = [email for email in to_emails if email]
+        if not to_emails:
+            raise ValueError('No recipients provided')
+        if len(to_emails) > SES_MAX_RECIPIENTS:
+            raise ValueError(f"At most {SES_MAX_RECIPIENTS} recipients per message")
+        raw = build_mime_message(self.sender, to_emails, subject, body, attachments)
+        if len(raw) > SES_MAX_MESSAGE_BYTES:
+            raise ValueError(f"Message is {len(raw)} bytes; SES accepts at most {SES_MAX_MESSAGE_BYTES}")
+        return to_emails, subject, raw
+
+    def _enqueue(self, built):
+        """Record and queue already-built messages; returns their ids"""
+        self._ensure_limiter()
+        now = time.time()
+        message_ids = []
+        with self._lock:
+            self._prune(now)
+            for to_emails, subject, raw in built:
+                message_id = uuid.uuid4().hex
+                self._messages[message_id] = {
+                    'message_id': message_id,
+                    'status': MESSAGE_QUEUED,
+                    'recipients': to_emails,
+                    'subject': subject,
+                    'attempts': 0,
+                    'ses_message_id': None,
+                    'error': None,
+                    'created_at': now,
+                    'updated_at': now
+                }
+                message_ids.append(message_id)
+            self._stats['queued'] += len(built)
+            self._ensure_workers()
+        for message_id in message_ids:
+            self._share(message_id)
+        for message_id, (to_emails, subject, raw) in zip(message_ids, built):
+            self._queue.put((message_id, to_emails, raw))
+        return message_ids
+
+    def submit(self, to_emails, subject, body, attachments=None):
+        """Queue one message to all recipients; returns its message id"""
+        return self._enqueue([self._build(to_emails, subject, body, attachments)])[0]
+
+    def submit_bulk(self, messages):
+        """
+        Queue several messages (dicts with recipients, subject, body, attachments)
+        Every message is validated before any is queued; returns their ids
+        """
+        return self._enqueue([self._build(m['recipients'], m['subject'], m['body'], m.get('attachments'))
+                              for m in messages])
+
+    def _update(self, message_id, **fields):
+        with self._lock:
+            status = self._messages.get(message_id)
+            if status:
+                status.update(fields)
+                status['updated_at'] = time.time()
+        self._share(message_id)
+
+    def _share(self, message_id):
+        """Write a message's status to the status store, if any"""
+        if self.status_store is None:
+            return
+        status = self.get_status(message_id, local_only=True)
+        if status:
+            self.status_store.save('email', message_id, status)
+
+    def _send(self, message_id, to_emails, raw):
+        """Send one message, retrying throttling errors with backoff"""
+        for attempt in range(self.max_retries + 1):
+            # SES counts every recipient against the send rate
+            waited = self._limiter.acquire(len(to_emails))
+            with self._lock:
+                self._stats['rate_wait_s'] += waited
+            self._update(message_id, status=MESSAGE_SENDING, attempts=attempt + 1)
+            try:
+                response = self.ses_client.send_raw_email(
+                    Source=self.sender,
+                    Destinations=to_emails,
+                    RawMessage={'Data': raw}
+                )
+            except Exception as e:
+                if is_throttling_error(e) and attempt < self.max_retries:
+                    delay = min(self.backoff_base * (2 ** attempt), self.backoff_max) * random.uniform(0.5, 1.0)
+                    with self._lock:
+                        self._stats['throttled'] += 1
+                        self._stats['retries'] += 1
+                    print(f"⚠ SES throttled message {message_id}, retrying in {delay:.1f}s")
+                    self._update(message_id, status=MESSAGE_QUEUED, error=str(e))
+                    time.sleep(delay)
+                    continue
+                print(f"Error sending email: {e}")
+                self._update(message_id, status=MESSAGE_FAILED, error=str(e))
+                with self._lock:
+                    self._stats['failed'] += 1
+                return
+            self._update(message_id, status=MESSAGE_SENT, ses_message_id=response['MessageId'], error=None)
+            with self._lock:
+                self._stats['sent'] += 1
+            return
+
+    def _run(self):
+        """Worker loop"""
+        while True:
+            message_id, to_emails, raw = self._queue.get()
+            try:
+                self._send(message_id, to_emails, raw)
+            except Exception as e:
+                print(f"❌ Email dispatch error: {e}")
+                self._update(message_id, status=MESSAGE_FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    def get_status(self, message_id, local_only=False):
+        """Return a copy of a message's status (from the status store when queued elsewhere), or None if unknown"""
+        with self._lock:
+            status = self._messages.get(message_id)
+            if status:
+                return dict(status)
+        if self.status_store is None or local_only:
+            return None
+        return self.status_store.load('email', message_id)
+
+    def get_stats(self):
+        """Return send counters and queue depth"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rate_wait_s'] = round(stats['rate_wait_s'], 3)
+            stats['max_send_rate'] = self._limiter.rate if self._limiter else self.max_send_rate
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
@@ -0,0 +1,149 @@
+"""
+Durable patient evaluation queue backed by the eval_queue table
+Change detection enqueues patients with a priority (how abnormal their
+latest readings are). Monitors claim the highest-priority rows with a
+lease, so a crashed monitor's work is picked up again once the lease
+expires. Failed evaluations are retried after an exponential backoff.
+Each row carries a version that is bumped when newer clinical data arrives
+while the patient is queued or being evaluated; completing a stale version
+releases the row for another pass instead of deleting it.
+"""
+import os
+import socket
+import threading
+from monitor_lease import shard_filter
+
+ENQUEUE_SQL = """
+    INSERT INTO eval_queue (patient_id, priority, latest_vitals_time, latest_lab_time, latest_med_time)
+    VALUES {rows}
+    ON DUPLICATE KEY UPDATE
+        version = version + IF(latest_vitals_time <=> VALUES(latest_vitals_time)
+                               AND latest_lab_time <=> VALUES(latest_lab_time)
+                               AND latest_med_time <=> VALUES(latest_med_time), 0, 1),
+        priority = VALUES(priority),
+        latest_vitals_time = VALUES(latest_vitals_time),
+        latest_lab_time = VALUES(latest_lab_time),
+        latest_med_time = VALUES(latest_med_time)
+"""
+
+CLAIM_SELECT_SQL = """
+    SELECT patient_id, priority, latest_vitals_time, latest_lab_time, latest_med_time, version, attempts
+    FROM eval_queue
+    WHERE available_at <= NOW()
+      AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+      {shards}
+    ORDER BY priority DESC, enqueued_at
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+
+class EvaluationQueue:
+    """
+    Claim/lease/retry operations on the eval_queue table
+    max_attempts marks the attempt from which evaluations should stop
+    waiting for Bedrock and fall back to the rule findings (retry_allowed
+    is False on claimed rows).
+    """
+
+    def __init__(self, db, lease_seconds=600, backoff_base=30, backoff_max=900, max_attempts=5, owner=None):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        self.owner = (owner or f"{socket.gethostname()}:{os.getpid()}")[:64]
+        self._lock = threading.Lock()
+        self._stats = {'enqueued': 0, 'claimed': 0, 'completed': 0, 'requeued_stale': 0, 'retried': 0}
+
+    def _count(self, key, amount):
+        with self._lock:
+            self._stats[key] += amount
+
+    def enqueue(self, changes, priorities, conn=None):
+        """Queue changed patients (rows from change detection) with their priority, on conn when given"""
+        if not changes:
+            return
+        params = []
+        for change in changes:
+            params.extend([change['patient_id'], priorities.get(change['patient_id'], 0),
+                           change.get('latest_vitals_time'), change.get('latest_lab_time'),
+                           change.get('latest_med_time')])
+        sql = ENQUEUE_SQL.format(rows=', '.join(['(%s, %s, %s, %s, %s)'] * len(changes)))
+        if conn is not None:
+            self.db.execute_on(conn, sql, params)
+        else:
+            with self.db.connection() as conn:
+                self.db.execute_on(conn, sql, params)
+        self._count('enqueued', len(changes))
+
+    def claim(self, limit, shards=None, shard_count=1):
+        """Lease up to limit of the highest-priority ready patients in our shards"""
+        shard_sql, shard_params = shard_filter(shards, shard_count)
+        with self.db.transaction() as conn:
+            rows = self.db.fetch_all_on(conn, CLAIM_SELECT_SQL.format(shards=shard_sql), (*shard_params, limit))
+            if not rows:
+                return []
+            patient_ids = [row['patient_id'] for row in rows]
+            self.db.execute_on(conn, f"""
+                UPDATE eval_queue
+                SET lease_owner = %s, lease_expires_at = NOW() + INTERVAL %s SECOND, attempts = attempts + 1
+                WHERE patient_id IN ({', '.join(['%s'] * len(patient_ids))})
+            """, (self.owner, self.lease_seconds, *patient_ids))
+        for row in rows:
+            row['attempts'] += 1
+            row['retry_allowed'] = row['attempts'] < self.max_attempts
+        self._count('claimed', len(rows))
+        return rows
+
+    def complete(self, conn, changes):
+        """
+        Remove evaluated patients from the queue on conn (inside the caller's
+        transaction, alongside the eval watermark upsert). Rows whose version
+        moved on while they were evaluated are released for another pass.
+        """
+        stale = []
+        for change in changes:
+            with conn.cursor() as cursor:
+                if not cursor.execute(
+                    "DELETE FROM eval_queue WHERE patient_id = %s AND version = %s AND lease_owner = %s",
+                    (change['patient_id'], change['version'], self.owner)
+                ):
+                    stale.append(change['patient_id'])
+        if stale:
+            self.db.execute_on(conn, f"""
+                UPDATE eval_queue
+                SET lease_owner = NULL, lease_expires_at = NULL, attempts = 0, last_error = NULL
+                WHERE patient_id IN ({', '.join(['%s'] * len(stale))}) AND lease_owner = %s
+            """, (*stale, self.owner))
+        self._count('completed', len(changes) - len(stale))
+        self._count('requeued_stale', len(stale))
+
+    def fail(self, failures):
+        """Release failed patients ({patient_id: error}) for a retry after backoff"""
+        if not failures:
+            return
+        with self.db.connection() as conn:
+            for patient_id, error in failures.items():
+                self.db.execute_on(conn, """
+                    UPDATE eval_queue
+                    SET lease_owner = NULL, lease_expires_at = NULL, last_error = %s,
+                        available_at = NOW() + INTERVAL LEAST(%s * POW(2, attempts - 1), %s) SECOND
+                    WHERE patient_id = %s AND lease_owner = %s
+                """, (str(error)[:500], self.backoff_base, self.backoff_max, patient_id, self.owner))
+        self._count('retried', len(failures))
+        print(f"⚠ {len(failures)} evaluation(s) failed, retrying after backoff: {sorted(failures)}")
+
+    def get_stats(self):
+        """Return local counters plus queue depth from the table"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['owner'] = self.owner
+        depth = self.db.fetch_one("""
+            SELECT COUNT(*) AS depth,
+                   COALESCE(SUM(lease_expires_at >= NOW()), 0) AS leased,
+                   COALESCE(SUM(available_at > NOW()), 0) AS backing_off,
+                   MAX(priority) AS max_priority
+            FROM eval_queue
+        """) or {}
+        stats.update({key: int(value) if value is not None else None for key, value in depth.items()})
+        return stats
@@ -0,0 +1,51 @@
+"""
+Shared job status records in the job_status table
+Email dispatch and knowledge base upload jobs run in the web process that
+accepted them, but the dashboard may poll their status through any worker.
+Each status change is written here so every process can answer the poll.
+"""
+import json
+import threading
+import time
+
+class JobStatusStore:
+    """Upsert/read of JSON status records keyed by (kind, job_id)"""
+
+    def __init__(self, db, ttl=86400, prune_interval=600):
+        self.db = db
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._next_prune = 0
+        self._lock = threading.Lock()
+        self._stats = {'saved': 0, 'loaded': 0, 'errors': 0}
+
+    def save(self, kind, job_id, record):
+        """Write the latest status of a job"""
+        result = self.db.execute_query("""
+            INSERT INTO job_status (kind, job_id, status) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE status = VALUES(status)
+        """, (kind, job_id, json.dumps(record, default=str)))
+        with self._lock:
+            self._stats['saved' if result else 'errors'] += 1
+            prune = time.monotonic() >= self._next_prune
+            if prune:
+                self._next_prune = time.monotonic() + self.prune_interval
+        if prune:
+            self.db.execute_query(
+                "DELETE FROM job_status WHERE updated_at < NOW() - INTERVAL %s SECOND LIMIT 10000",
+                (self.ttl,)
+            )
+
+    def load(self, kind, job_id):
+        """Return a job's latest status, or None if unknown"""
+        row = self.db.fetch_one("SELECT status FROM job_status WHERE kind = %s AND job_id = %s", (kind, job_id))
+        if row is None:
+            return None
+        with self._lock:
+            self._stats['loaded'] += 1
+        return json.loads(row['status'])
+
+    def get_stats(self):
+        """Return save/load counters"""
+        with self._lock:
+            return dict(self._stats)
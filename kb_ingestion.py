@@ -0,0 +1,393 @@
+"""
+Background upload and ingestion pipeline for the chatbot knowledge base
+Uploaded files are spooled by the request (in memory when small, on disk
+above a threshold) and hashed as they are read, then streamed to S3 in
+parallel on a worker pool using multipart uploads; files whose content
+is already in S3 are skipped. A coordinator thread starts Bedrock
+ingestion jobs: uploads that finish close together are debounced into a
+single ingestion job, and uploads that finish while a job is running are
+coalesced into the next one
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+# Upload job states, in order
+JOB_UPLOADING = 'uploading'
+JOB_QUEUED = 'queued'
+JOB_INGESTING = 'ingesting'
+JOB_COMPLETE = 'complete'
+JOB_FAILED = 'failed'
+
+INGESTION_DONE_STATUSES = ('COMPLETE', 'FAILED', 'STOPPED')
+
+# S3 object metadata holding the SHA-256 of the uploaded content
+CHECKSUM_METADATA_KEY = 'sha256'
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+def spool_upload(file, key, spool_dir=None, memory_threshold=8 * 1024 * 1024):
+    """
+    Read an uploaded file once, hashing it as it streams
+    Files up to memory_threshold bytes are kept in memory; larger ones are
+    written to a temp file in spool_dir so request memory stays bounded.
+    Returns a dict for KnowledgeBaseIngestion.submit()
+    """
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    spool = None
+    path = None
+    size = 0
+    try:
+        while True:
+            chunk = file.stream.read(SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            if spool is None and size > memory_threshold:
+                fd, path = tempfile.mkstemp(prefix='kb-upload-', dir=spool_dir)
+                spool = os.fdopen(fd, 'wb')
+                spool.write(buffer.getvalue())
+                buffer = None
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                buffer.write(chunk)
+    except Exception:
+        if spool is not None:
+            spool.close()
+            os.remove(path)
+        raise
+    if spool is not None:
+        spool.close()
+    return {
+        'name': file.filename,
+        'key': key,
+        'path': path,
+        'data': buffer.getvalue() if buffer is not None else None,
+        'size': size,
+        'sha256': digest.hexdigest()
+    }
+
+class KnowledgeBaseIngestion:
+    """
+    Tracks upload jobs from request to searchable knowledge base
+    submit() returns immediately with a job id; get_job() reports progress.
+    With a status_store (a JobStatusStore) job records are shared with other
+    processes, so any web worker can report a job's progress.
+    """
+
+    def __init__(self, s3_client, bedrock_agent, bucket, knowledge_base_id, data_source_id,
+                 upload_workers=4, debounce_seconds=5.0, max_wait_seconds=30.0,
+                 poll_interval=5.0, job_ttl=3600, part_size=8 * 1024 * 1024, part_concurrency=4,
+                 status_store=None):
+        self.s3_client = s3_client
+        self.bedrock_agent = bedrock_agent
+        self.bucket = bucket
+        self.knowledge_base_id = knowledge_base_id
+        self.data_source_id = data_source_id
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.poll_interval = poll_interval
+        self.job_ttl = job_ttl
+        self.status_store = status_store
+        self.transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=part_concurrency
+        )
+
+        self.executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix='kb-upload')
+        self._jobs = {}
+        self._remaining = {}
+        self._pending = []
+        self._first_pending_at = None
+        self._last_pending_at = None
+        self._running = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._listeners = []
+        self._stats = {
+            'jobs': 0,
+            'files_uploaded': 0,
+            'files_failed': 0,
+            'files_unchanged': 0,
+            'bytes_uploaded': 0,
+            'bytes_unchanged': 0,
+            'ingestion_jobs': 0,
+            'ingestion_failures': 0,
+            'coalesced_jobs': 0
+        }
+
+    def submit(self, files):
+        """
+        Queue spooled files (from spool_upload) for upload
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            'job_id': job_id,
+            'status': JOB_UPLOADING,
+            'files': [{'name': f['name'], 'key': f['key'], 'size': f['size'], 'sha256': f['sha256'],
+                       'status': 'pending', 'error': None} for f in files],
+            'ingestion_job_id': None,
+            'message': f"Uploading {len(files)} file(s)",
+            'created_at': now,
+            'updated_at': now
+        }
+        with self._cond:
+            self._prune(now)
+            self._jobs[job_id] = job
+            self._stats['jobs'] += 1
+            self._remaining[job_id] = len(files)
+            self._ensure_thread()
+        self._share([job_id])
+
+        for index, spooled in enumerate(files):
+            self.executor.submit(self._upload, job_id, index, spooled)
+        return job_id
+
+    def _prune(self, now):
+        """Forget finished jobs older than the TTL (caller holds the lock)"""
+        for job_id in [j for j, job in self._jobs.items()
+                       if job['status'] in (JOB_COMPLETE, JOB_FAILED) and now - job['updated_at'] > self.job_ttl]:
+            del self._jobs[job_id]
+
+    def add_listener(self, callback):
+        """Call callback(status) whenever an ingestion job started here finishes"""
+        self._listeners.append(callback)
+
+    def _ensure_thread(self):
+        """Start the coordinator thread if it is not running (caller holds the lock)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='kb-ingestion', daemon=True)
+            self._thread.start()
+
+    def _update(self, job_id, **fields):
+        """Update a job record (caller holds the lock)"""
+        job = self._jobs.get(job_id)
+        if job:
+            job.update(fields)
+            job['updated_at'] = time.time()
+        return job
+
+    def _share(self, job_ids):
+        """Write job records to the status store, if any (without holding the lock)"""
+        if self.status_store is None:
+            return
+        for job_id in job_ids:
+            job = self.get_job(job_id, local_only=True)
+            if job:
+                self.status_store.save('kb_upload', job_id, job)
+
+    def _is_unchanged(self, spooled):
+        """True when S3 already holds this key with the same content hash"""
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket, Key=spooled['key'])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return head.get('Metadata', {}).get(CHECKSUM_METADATA_KEY) == spooled['sha256']
+
+    def _upload(self, job_id, index, spooled):
+        """Stream one spooled file to S3, then hand the job to the coordinator once all files are done"""
+        error = None
+        status = 'uploaded'
+        try:
+            if self._is_unchanged(spooled):
+                status = 'unchanged'
+                print(f"  = Unchanged, skipping s3://{self.bucket}/{spooled['key']}")
+            else:
+                extra_args = {
+                    'Metadata': {CHECKSUM_METADATA_KEY: spooled['sha256']},
+                    # S3 verifies every part against its own checksum
+                    'ChecksumAlgorithm': 'SHA256'
+                }
+                body = open(spooled['path'], 'rb') if spooled['path'] else io.BytesIO(spooled['data'])
+                with body:
+                    self.s3_client.upload_fileobj(body, self.bucket, spooled['key'],
+                                                  ExtraArgs=extra_args, Config=self.transfer_config)
+                print(f"  ✓ Uploaded s3://{self.bucket}/{spooled['key']} ({spooled['size']} bytes)")
+        except Exception as e:
+            error = str(e)
+            status = 'failed'
+            print(f"  ❌ Error uploading {spooled['key']}: {e}")
+        finally:
+            if spooled['path']:
+                try:
+                    os.remove(spooled['path'])
+                except OSError:
+                    pass
+
+        try:
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                job['files'][index]['status'] = status
+                job['files'][index]['error'] = error
+                if status == 'failed':
+                    self._stats['files_failed'] += 1
+                elif status == 'unchanged':
+                    self._stats['files_unchanged'] += 1
+                    self._stats['bytes_unchanged'] += spooled['size']
+                else:
+                    self._stats['files_uploaded'] += 1
+                    self._stats['bytes_uploaded'] += spooled['size']
+                self._remaining[job_id] -= 1
+                if self._remaining[job_id] > 0:
+                    return
+                del self._remaining[job_id]
+
+                uploaded = sum(1 for f in job['files'] if f['status'] == 'uploaded')
+                unchanged = sum(1 for f in job['files'] if f['status'] == 'unchanged')
+                if not uploaded and not unchanged:
+                    self._update(job_id, status=JOB_FAILED, message='All uploads failed')
+                    return
+                if not uploaded:
+                    # Nothing new reached S3, so there is nothing to ingest
+                    self._update(job_id, status=JOB_COMPLETE,
+                                 message=f"{unchanged} file(s) already in the knowledge base")
+                    return
+                self._update(job_id, status=JOB_QUEUED,
+                             message=f"Uploaded {uploaded} of {len(job['files'])} file(s); waiting for knowledge base sync")
+                now = time.time()
+                if not self._pending:
+                    self._first_pending_at = now
+                self._last_pending_at = now
+                self._pending.append(job_id)
+                self._cond.notify_all()
+        finally:
+            self._share([job_id])
+
+    def _ready_to_start(self, now):
+        """Debounce: start once uploads have gone quiet, or the oldest has waited long enough (caller holds the lock)"""
+        if not self._pending or self._running:
+            return False
+        return (now - self._last_pending_at >= self.debounce_seconds
+                or now - self._first_pending_at >= self.max_wait_seconds)
+
+    def _start_ingestion(self):
+        """Start one ingestion job covering every pending upload job"""
+        with self._cond:
+            job_ids = list(self._pending)
+        try:
+            response = self.bedrock_agent.start_ingestion_job(
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=self.data_source_id
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConflictException':
+                # Another ingestion job (e.g. started from the console) is running; retry later
+                print(f"  ⏳ Knowledge base sync already running, retrying in {self.debounce_seconds}s")
+                with self._cond:
+                    self._first_pending_at = self._last_pending_at = time.time()
+                return
+            self._fail_ingestion(job_ids, f"Knowledge base sync failed: {e}")
+            return
+        except Exception as e:
+            self._fail_ingestion(job_ids, f"Knowledge base sync failed: {e}")
+            return
+
+        ingestion_job_id = response['ingestionJob']['ingestionJobId']
+        print(f"🔄 Started knowledge base sync {ingestion_job_id} for {len(job_ids)} upload job(s)")
+        with self._cond:
+            self._pending = [j for j in self._pending if j not in job_ids]
+            self._running = {'ingestion_job_id': ingestion_job_id, 'job_ids': job_ids}
+            self._stats['ingestion_jobs'] += 1
+            self._stats['coalesced_jobs'] += len(job_ids) - 1
+            for job_id in job_ids:
+                self._update(job_id, status=JOB_INGESTING, ingestion_job_id=ingestion_job_id,
+                             message='Syncing knowledge base')
+        self._share(job_ids)
+
+    def _fail_ingestion(self, job_ids, message):
+        """Mark upload jobs failed after their ingestion could not run"""
+        print(f"  ❌ {message}")
+        with self._cond:
+            self._pending = [j for j in self._pending if j not in job_ids]
+            self._stats['ingestion_failures'] += 1
+            for job_id in job_ids:
+                self._update(job_id, status=JOB_FAILED, message=message)
+        self._share(job_ids)
+
+    def _poll_ingestion(self):
+        """Check the running ingestion job and settle its upload jobs when it finishes"""
+        running = self._running
+        try:
+            response = self.bedrock_agent.get_ingestion_job(
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=self.data_source_id,
+                ingestionJobId=running['ingestion_job_id']
+            )
+        except Exception as e:
+            print(f"  ⚠ Error polling knowledge base sync {running['ingestion_job_id']}: {e}")
+            return
+        ingestion = response['ingestionJob']
+        if ingestion['status'] not in INGESTION_DONE_STATUSES:
+            return
+
+        print(f"✅ Knowledge base sync {running['ingestion_job_id']} finished: {ingestion['status']}")
+        with self._cond:
+            self._running = None
+            if ingestion['status'] == 'COMPLETE':
+                status, message = JOB_COMPLETE, 'Documents are available to the chatbot'
+            else:
+                self._stats['ingestion_failures'] += 1
+                reasons = '; '.join(ingestion.get('failureReasons', []))
+                status, message = JOB_FAILED, f"Knowledge base sync {ingestion['status'].lower()}" + (f": {reasons}" if reasons else '')
+            for job_id in running['job_ids']:
+                self._update(job_id, status=status, message=message)
+            self._cond.notify_all()
+        self._share(running['job_ids'])
+
+        # Even a failed job may have ingested some documents, so listeners run either way
+        for listener in list(self._listeners):
+            try:
+                listener(ingestion['status'])
+            except Exception as e:
+                print(f"  ⚠ Ingestion listener error: {e}")
+
+    def _run(self):
+        """Coordinator loop: debounce pending uploads, start ingestion, poll until done"""
+        while True:
+            with self._cond:
+                while not self._ready_to_start(time.time()):
+                    if not self._pending:
+                        self._cond.wait()
+                    else:
+                        deadline = min(self._last_pending_at + self.debounce_seconds,
+                                       self._first_pending_at + self.max_wait_seconds)
+                        self._cond.wait(max(deadline - time.time(), 0.01))
+            self._start_ingestion()
+            while self._running:
+                time.sleep(self.poll_interval)
+                self._poll_ingestion()
+
+    def get_job(self, job_id, local_only=False):
+        """Return a copy of a job record (from the status store when running elsewhere), or None if unknown"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job = dict(job)
+                job['files'] = [dict(f) for f in job['files']]
+                return job
+        if self.status_store is None or local_only:
+            return None
+        return self.status_store.load('kb_upload', job_id)
+
+    def get_stats(self):
+        """Return upload and ingestion counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending_jobs'] = len(self._pending)
+            stats['ingesting'] = self._running['ingestion_job_id'] if self._running else None
+        return stats
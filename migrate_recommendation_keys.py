@@ -0,0 +1,62 @@
+"""
+One-shot migration: resolve every alert's recommendation S3 key
+Adds alert.recommendation_key if needed, lists the recommendation bucket
+once and records the key each alert's recommendation lives under ('' when
+none exists), so the dashboard never has to probe for the filename format.
+
+Usage: python migrate_recommendation_keys.py
+"""
+import os
+import re
+from app_flask import db
+from utils import s3_client
+
+KEY_PATTERN = re.compile(r'^(\d+)(?:_(\d+))?_recommendation\.txt$')
+
+def ensure_column():
+    """Add alert.recommendation_key on databases created before it existed"""
+    column = db.fetch_one("""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'alert' AND COLUMN_NAME = 'recommendation_key'
+    """)
+    if not column:
+        print("Adding alert.recommendation_key column...")
+        db.execute_query("ALTER TABLE alert ADD COLUMN recommendation_key VARCHAR(255) DEFAULT NULL")
+
+def list_recommendation_keys(bucket):
+    """Map alert_id -> S3 key, preferring the new {alert_id}_{patient_id} format"""
+    keys = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket):
+        for obj in page.get('Contents', []):
+            match = KEY_PATTERN.match(obj['Key'])
+            if not match:
+                continue
+            alert_id = int(match.group(1))
+            if match.group(2) or alert_id not in keys:
+                keys[alert_id] = obj['Key']
+    return keys
+
+def main():
+    bucket = os.getenv('RECOMMENDATION_BUCKET_NAME')
+    ensure_column()
+
+    keys = list_recommendation_keys(bucket)
+    print(f"Found {len(keys)} recommendation object(s) in s3://{bucket}")
+
+    alerts = db.fetch_all("SELECT alert_id FROM alert WHERE recommendation_key IS NULL")
+    resolved = 0
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            for alert in alerts:
+                key = keys.get(alert['alert_id'], '')
+                cursor.execute(
+                    "UPDATE alert SET recommendation_key = %s WHERE alert_id = %s AND recommendation_key IS NULL",
+                    (key, alert['alert_id'])
+                )
+                resolved += 1 if key else 0
+
+    print(f"✓ Updated {len(alerts)} alert(s): {resolved} with a recommendation, {len(alerts) - resolved} without")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+Standalone care coordination monitor
+Runs the monitoring loop without the web server, so the dashboard can be
+served by several gunicorn workers (with MONITOR_EMBEDDED=false) while one
+or more monitor processes, on any node, evaluate patients. Shard leases
+keep two monitors from evaluating the same patient.
+
+Usage:
+    python monitor.py
+"""
+import signal
+import sys
+from app_flask import check_new_entries_and_generate_alerts, evaluation_pool, monitor_leases
+
+def stop(signum, frame):
+    """Turn SIGTERM into a normal exit so leases are released"""
+    sys.exit(0)
+
+def main():
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        check_new_entries_and_generate_alerts()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Stopping care coordination monitor...")
+        evaluation_pool.shutdown()
+        monitor_leases.release()
+        print("✓ Monitor stopped")
+
+if __name__ == '__main__':
+    main()
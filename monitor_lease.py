@@ -0,0 +1,103 @@
+"""
+Shard leases for the care coordination monitor
+Patients are split into shards by patient_id modulo the shard count. A
+monitor process only evaluates the shards whose MySQL named lock
+(GET_LOCK) it holds. Named locks belong to the database session, so when a
+monitor process dies or loses its connection its shards are released and
+another monitor takes them over on its next cycle. With a single shard
+this is plain leader election.
+"""
+import threading
+
+def shard_filter(shards, shard_count, column='patient_id'):
+    """SQL condition (starting with AND) and params limiting rows to the given shards"""
+    if shards is None or shard_count <= 1:
+        return "", []
+    return f"AND MOD({column}, %s) IN ({', '.join(['%s'] * len(shards))}) ", [shard_count, *shards]
+
+class ShardLeaseManager:
+    """
+    Hold named locks for monitor shards on a dedicated connection
+    max_shards caps how many shards one process takes, so several monitor
+    processes split the patients between them (None takes every free shard).
+    """
+
+    def __init__(self, connect, shard_count=1, max_shards=None, lock_prefix='care_monitor'):
+        self.connect = connect
+        self.shard_count = max(shard_count, 1)
+        self.max_shards = max_shards or self.shard_count
+        self.lock_prefix = lock_prefix
+        self._conn = None
+        self._owned = set()
+        self._lock = threading.Lock()
+        self._stats = {'acquired': 0, 'lost': 0, 'connection_errors': 0}
+
+    def lock_name(self, shard):
+        """MySQL named lock for a shard (names are server-wide, so prefix with the database)"""
+        return f"{self.lock_prefix}.shard.{shard}"
+
+    def _scalar(self, sql, params):
+        with self._conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        return list(row.values())[0] if isinstance(row, dict) else row[0]
+
+    def _drop_connection(self):
+        """Forget the session; its locks are released by the server when it closes"""
+        if self._owned:
+            print(f"⚠ Monitor lost shard lease(s) {sorted(self._owned)}")
+            self._stats['lost'] += len(self._owned)
+        self._owned = set()
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+
+    def refresh(self):
+        """Confirm held shards and try to take free ones; returns the sorted owned shards"""
+        with self._lock:
+            try:
+                if self._conn is not None:
+                    # Locks live as long as the session does
+                    self._conn.ping(reconnect=False)
+                else:
+                    self._conn = self.connect()
+
+                for shard in range(self.shard_count):
+                    if len(self._owned) >= self.max_shards:
+                        break
+                    if shard in self._owned:
+                        continue
+                    if self._scalar("SELECT GET_LOCK(%s, 0)", (self.lock_name(shard),)) == 1:
+                        self._owned.add(shard)
+                        self._stats['acquired'] += 1
+                        print(f"✓ Monitor acquired shard {shard}/{self.shard_count}")
+            except Exception as e:
+                print(f"❌ Monitor lease error: {e}")
+                self._stats['connection_errors'] += 1
+                self._drop_connection()
+            return sorted(self._owned)
+
+    def release(self):
+        """Release every held shard and close the lease connection"""
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                for shard in sorted(self._owned):
+                    self._scalar("SELECT RELEASE_LOCK(%s)", (self.lock_name(shard),))
+            except Exception as e:
+                print(f"⚠ Error releasing monitor leases: {e}")
+            self._owned = set()
+            self._drop_connection()
+
+    def get_stats(self):
+        """Return owned shards and lease counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['shard_count'] = self.shard_count
+            stats['max_shards'] = self.max_shards
+            stats['owned_shards'] = sorted(self._owned)
+        return stats
@@ -4,7 +4,7 @@ let selectedFacilities = [];
 let currentPatientId = null;
 let currentAlertId = null;
 let currentPatientName = '';
-let alertCheckInterval = null;
+let currentBundle = null;
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', function() {
@@ -171,6 +171,7 @@ function updateAllFacilitiesCheckbox() {
 async function loadAlerts(page = 1) {
     try {
         currentPage = page;
+        syncAlertStream();
         const facilities = selectedFacilities.join(',');
         const response = await fetch(`/api/alerts?facilities=${facilities}&page=${page}&per_page=6`);
         const data = await response.json();
@@ -354,38 +355,32 @@ async function reviewAlert(patientId, alertId, patientName) {
 // Load patient details
 async function loadPatientDetails(patientId, alertId) {
     try {
-        // Load patient info
-        const patientResponse = await fetch(`/api/patient/${patientId}`);
-        const patientData = await patientResponse.json();
-        
-        // Load alert details
-        const alertResponse = await fetch(`/api/alert/${alertId}`);
-        const alertData = await alertResponse.json();
-        
-        // Load recommendation
-        const recResponse = await fetch(`/api/recommendation/${alertId}`);
-        const recData = await recResponse.json();
-        
-        // Load vitals
-        const vitalsResponse = await fetch(`/api/vitals/${patientId}`);
-        const vitalsData = await vitalsResponse.json();
-        
-        // Load medications
-        const medsResponse = await fetch(`/api/medications/${patientId}`);
-        const medsData = await medsResponse.json();
-        
-        // Load labs
-        const labsResponse = await fetch(`/api/labs/${patientId}`);
-        const labsData = await labsResponse.json();
+        // Load patient, alert, recommendation, vitals, medications and labs in one request
+        currentBundle = null;
+        const bundle = await fetchAlertBundle(alertId);
         
         // Display all data
-        displayPatientDetails(patientData.patient, alertData.alert, recData.recommendation, 
-                            vitalsData.vitals, medsData.medications, labsData.labs);
+        displayPatientDetails(bundle.patient, bundle.alert, bundle.recommendation, 
+                            bundle.vitals, bundle.medications, bundle.labs);
     } catch (error) {
         console.error('Error loading patient details:', error);
     }
 }
 
+// Fetch the aggregated alert bundle, reusing the last one for the same alert
+async function fetchAlertBundle(alertId) {
+    if (currentBundle && currentBundle.alertId === alertId) {
+        return currentBundle;
+    }
+    const response = await fetch(`/api/alert/${alertId}/bundle`);
+    const data = await response.json();
+    if (!data.success) {
+        throw new Error(data.message || 'Failed to load alert');
+    }
+    currentBundle = { ...data, alertId: alertId };
+    return currentBundle;
+}
+
 function displayPatientDetails(patient, alert, recommendation, vitals, medications, labs) {
     const container = document.getElementById('residentDetail');
     
@@ -584,18 +579,11 @@ function displayLabs(labs) {
 // Message care team modal
 async function openMessageModal() {
     try {
-        // Get patient and physician emails
-        const patientResponse = await fetch(`/api/patient/${currentPatientId}`);
-        const patientData = await patientResponse.json();
-        const patient = patientData.patient;
-        
-        // Get recommendation
-        const recResponse = await fetch(`/api/recommendation/${currentAlertId}`);
-        const recData = await recResponse.json();
-        
-        // Get alert
-        const alertResponse = await fetch(`/api/alert/${currentAlertId}`);
-        const alertData = await alertResponse.json();
+        // Get patient and physician emails, recommendation and alert (already loaded with the resident view)
+        const bundle = await fetchAlertBundle(currentAlertId);
+        const patient = bundle.patient;
+        const recData = { recommendation: bundle.recommendation };
+        const alertData = { alert: bundle.alert };
         
         // Populate modal
         const recipients = [];
@@ -622,18 +610,74 @@ Thank you`;
         
         // Add send button listener
         document.getElementById('sendEmailBtn').onclick = sendEmail;
-        document.getElementById('attachBtn').onclick = () => alert('Attachment feature coming soon');
+        emailAttachments = [];
+        renderEmailAttachments();
+        document.getElementById('attachRecommendation').checked = false;
+        document.getElementById('attachBtn').onclick = pickEmailAttachments;
         
     } catch (error) {
         console.error('Error opening message modal:', error);
     }
 }
 
+// Files attached in the message modal: { filename, content_type, content_base64 }
+let emailAttachments = [];
+
+function renderEmailAttachments() {
+    const attachBtn = document.getElementById('attachBtn');
+    attachBtn.title = emailAttachments.map(a => a.filename).join(', ');
+    const label = emailAttachments.length ? `Attached (${emailAttachments.length})` : 'Attach';
+    attachBtn.innerHTML = `<i class="bi bi-paperclip"></i> ${label}`;
+}
+
+function readFileAsBase64(file) {
+    return new Promise((resolve, reject) => {
+        const reader = new FileReader();
+        // Strip the "data:<type>;base64," prefix
+        reader.onload = () => resolve(reader.result.split(',')[1]);
+        reader.onerror = () => reject(reader.error);
+        reader.readAsDataURL(file);
+    });
+}
+
+function pickEmailAttachments() {
+    const input = document.createElement('input');
+    input.type = 'file';
+    input.multiple = true;
+    input.accept = '.pdf,.txt,.doc,.docx,.png,.jpg';
+    input.onchange = async () => {
+        for (const file of input.files) {
+            emailAttachments.push({
+                filename: file.name,
+                content_type: file.type || 'application/octet-stream',
+                content_base64: await readFileAsBase64(file)
+            });
+        }
+        renderEmailAttachments();
+    };
+    input.click();
+}
+
+// Poll a queued email until SES accepts or rejects it
+async function waitForEmail(messageId) {
+    for (let attempt = 0; attempt < 60; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(`/api/send-email/${messageId}`);
+        const data = await response.json();
+        if (!data.success) return data;
+        if (data.email.status === 'sent') return { success: true };
+        if (data.email.status === 'failed') return { success: false, message: data.email.error };
+    }
+    return { success: true, pending: true };
+}
+
 async function sendEmail() {
+    const sendBtn = document.getElementById('sendEmailBtn');
     try {
         const recipients = document.getElementById('emailRecipients').value.split(',').map(e => e.trim());
         const message = document.getElementById('emailMessage').value;
         
+        sendBtn.disabled = true;
         const response = await fetch('/api/send-email', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -641,91 +685,38 @@ async function sendEmail() {
                 recipients: recipients,
                 subject: `Clinical Recommendation for ${currentPatientName}`,
                 message: message,
-                patient_name: currentPatientName
+                patient_name: currentPatientName,
+                alert_id: currentAlertId,
+                attach_recommendation: document.getElementById('attachRecommendation').checked,
+                attachments: emailAttachments
             })
         });
         
         const data = await response.json();
         
         if (data.success) {
-            alert('Email sent successfully!');
             bootstrap.Modal.getInstance(document.getElementById('messageCareTeamModal')).hide();
             loadActivities();
+            const result = await waitForEmail(data.message_id);
+            if (result.pending) {
+                alert('Email queued; it will be sent shortly.');
+            } else if (result.success) {
+                alert('Email sent successfully!');
+            } else {
+                alert('Failed to send email: ' + result.message);
+            }
         } else {
             alert('Failed to send email: ' + data.message);
         }
     } catch (error) {
         console.error('Error sending email:', error);
         alert('An error occurred while sending the email');
+    } finally {
+        sendBtn.disabled = false;
     }
 }
 
 
-// Alert checker - checks every minute for new alerts
-function startAlertChecker() {
-    // Check immediately
-    checkForNewAlerts();
-    
-    // Then check every minute (60000 ms)
-    alertCheckInterval = setInterval(checkForNewAlerts, 60000);
-}
-
-async function checkForNewAlerts() {
-    try {
-        const response = await fetch('/api/check-new-alerts');
-        const data = await response.json();
-        
-        if (data.success && data.has_new_alerts) {
-            showNewAlertNotification(data.count);
-        }
-    } catch (error) {
-        console.error('Error checking for new alerts:', error);
-    }
-}
-
-function showNewAlertNotification(count) {
-    // Check if notification already shown
-    if (document.getElementById('newAlertNotification')) {
-        return;
-    }
-    
-    // Create notification popup
-    const notification = document.createElement('div');
-    notification.id = 'newAlertNotification';
-    notification.className = 'alert alert-info alert-dismissible fade show position-fixed';
-    notification.style.cssText = 'top: 80px; right: 20px; z-index: 9999; min-width: 350px; box-shadow: 0 4px 12px rgba(0,0,0,0.15);';
-    notification.innerHTML = `
-        <div class="d-flex align-items-center">
-            <i class="bi bi-bell-fill me-2" style="font-size: 1.5rem;"></i>
-            <div class="flex-grow-1">
-                <strong>New Alert${count > 1 ? 's' : ''} Generated!</strong>
-                <p class="mb-0 small">${count} new alert${count > 1 ? 's have' : ' has'} been generated. Refresh to view.</p>
-            </div>
-        </div>
-        <hr class="my-2">
-        <div class="d-flex gap-2">
-            <button class="btn btn-sm btn-primary flex-grow-1" onclick="refreshPage()">
-                <i class="bi bi-arrow-clockwise me-1"></i> Refresh Now
-            </button>
-            <button type="button" class="btn-close" data-bs-dismiss="alert" aria-label="Close"></button>
-        </div>
-    `;
-    
-    document.body.appendChild(notification);
-    
-    // Auto-dismiss after 30 seconds
-    setTimeout(() => {
-        if (notification.parentElement) {
-            notification.remove();
-        }
-    }, 30000);
-}
-
-function refreshPage() {
-    window.location.reload();
-}
-
-
 // Archive alert
 async function archiveAlert(alertId, patientName) {
     if (!confirm(`Are you sure you want to archive this alert for ${patientName}?`)) {
@@ -862,52 +853,6 @@ function showNotification(message, type = 'info') {
 }
 
 
-// Start alert checker - polls for new alerts every 10 seconds
-function startAlertChecker() {
-    // Check immediately on load
-    checkForNewAlerts();
-    
-    // Then check every 10 seconds
-    alertCheckInterval = setInterval(checkForNewAlerts, 10000);
-}
-
-// Check for new alerts
-async function checkForNewAlerts() {
-    try {
-        const response = await fetch('/api/check-new-alerts');
-        const data = await response.json();
-        
-        if (data.success && data.has_new_alerts) {
-            showAlertNotification(data.count);
-            // Reload alerts to show the new ones
-            loadAlerts(currentPage);
-            loadArchivedAlerts(1);
-        }
-    } catch (error) {
-        console.error('Error checking for new alerts:', error);
-    }
-}
-
-// Show alert notification popup
-function showAlertNotification(count) {
-    const message = count === 1 ? '1 new alert!' : `${count} new alerts!`;
-    
-    // Create notification element
-    const notification = document.createElement('div');
-    notification.className = 'alert alert-warning alert-dismissible fade show position-fixed';
-    notification.style.cssText = 'top: 80px; right: 20px; z-index: 9999; min-width: 300px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);';
-    notification.innerHTML = `
-        <strong><i class="bi bi-exclamation-triangle-fill me-2"></i>New Alert!</strong>
-        <p class="mb-0">${message}</p>
-        <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
-    `;
-    
-    document.body.appendChild(notification);
-    
-    // Play notification sound (optional)
-    playNotificationSound();
-}
-
 // Play notification sound
 function playNotificationSound() {
     // Create a simple beep sound using Web Audio API
@@ -934,52 +879,6 @@ function playNotificationSound() {
 }
 
 
-// Start alert checker - polls for new alerts every 10 seconds
-function startAlertChecker() {
-    // Check immediately on load
-    checkForNewAlerts();
-    
-    // Then check every 10 seconds
-    alertCheckInterval = setInterval(checkForNewAlerts, 10000);
-}
-
-// Check for new alerts
-async function checkForNewAlerts() {
-    try {
-        const response = await fetch('/api/check-new-alerts');
-        const data = await response.json();
-        
-        if (data.success && data.has_new_alerts) {
-            showAlertNotification(data.count);
-            // Reload alerts to show the new ones
-            loadAlerts(currentPage);
-            loadArchivedAlerts(1);
-        }
-    } catch (error) {
-        console.error('Error checking for new alerts:', error);
-    }
-}
-
-// Show alert notification popup
-function showAlertNotification(count) {
-    const message = count === 1 ? '1 new alert!' : `${count} new alerts!`;
-    
-    // Create notification element
-    const notification = document.createElement('div');
-    notification.className = 'alert alert-warning alert-dismissible fade show position-fixed';
-    notification.style.cssText = 'top: 80px; right: 20px; z-index: 9999; min-width: 300px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);';
-    notification.innerHTML = `
-        <strong><i class="bi bi-exclamation-triangle-fill me-2"></i>New Alert!</strong>
-        <p class="mb-0">${message}</p>
-        <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
-    `;
-    
-    document.body.appendChild(notification);
-    
-    // Play notification sound (optional)
-    playNotificationSound();
-}
-
 // Play notification sound
 function playNotificationSound() {
     // Create a simple beep sound using Web Audio API
@@ -1142,35 +1041,6 @@ function showNotification(message, type = 'info') {
 
 
 // ============ ALERT NOTIFICATION SYSTEM ============
-function startAlertChecker() {
-    checkForNewAlerts();
-    setInterval(checkForNewAlerts, 10000);
-}
-
-async function checkForNewAlerts() {
-    try {
-        const response = await fetch('/api/check-new-alerts');
-        const data = await response.json();
-        if (data.success && data.has_new_alerts) {
-            showAlertNotification(data.count);
-            loadAlerts(currentPage);
-            loadArchivedAlerts(1);
-        }
-    } catch (error) {
-        console.error('Error checking alerts:', error);
-    }
-}
-
-function showAlertNotification(count) {
-    const msg = count === 1 ? '1 new alert!' : `${count} new alerts!`;
-    const notif = document.createElement('div');
-    notif.className = 'alert alert-warning alert-dismissible fade show position-fixed';
-    notif.style.cssText = 'top: 80px; right: 20px; z-index: 9999; min-width: 300px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);';
-    notif.innerHTML = `<strong><i class="bi bi-exclamation-triangle-fill me-2"></i>New Alert!</strong><p class="mb-0">${msg}</p><button type="button" class="btn-close" data-bs-dismiss="alert"></button>`;
-    document.body.appendChild(notif);
-    playNotificationSound();
-}
-
 function playNotificationSound() {
     try {
         const ctx = new (window.AudioContext || window.webkitAudioContext)();
@@ -1288,17 +1158,67 @@ function showNotification(message, type = 'info') {
 }
 
 
-// Simple alert checker - checks every 60 seconds
+// Alert notifications are pushed over Server-Sent Events; polling is only
+// used when the browser has no EventSource support
 let lastAlertCount = 0;
+let alertStream = null;
+let alertStreamFacilities = null;
+let lastAlertEventId = null;
+let pendingNewAlerts = 0;
+let newAlertTimer = null;
 
 function startAlertChecker() {
-    // Check every 60 seconds (same as backend evaluation cycle)
-    setInterval(checkForNewAlerts, 60000);
+    if (!window.EventSource) {
+        // Check every 60 seconds (same as backend evaluation cycle)
+        setInterval(checkForNewAlerts, 60000);
+        return;
+    }
+    syncAlertStream();
+}
+
+// (Re)connect the alert stream when the selected facilities change
+function syncAlertStream() {
+    if (!window.EventSource) {
+        return;
+    }
+    const facilities = selectedFacilities.join(',');
+    if (alertStream && alertStreamFacilities === facilities) {
+        return;
+    }
+    if (alertStream) {
+        alertStream.close();
+        alertStream = null;
+    }
+    alertStreamFacilities = facilities;
+    if (!facilities) {
+        // No facilities selected - nothing to listen for
+        return;
+    }
+    
+    let url = `/api/alerts/stream?facilities=${facilities}`;
+    if (lastAlertEventId) {
+        url += `&last_event_id=${encodeURIComponent(lastAlertEventId)}`;
+    }
+    // EventSource reconnects on its own and resends Last-Event-ID
+    alertStream = new EventSource(url);
+    alertStream.addEventListener('alert', function(event) {
+        lastAlertEventId = event.lastEventId;
+        pendingNewAlerts++;
+        
+        // Coalesce bursts from one monitoring cycle into a single popup and reload
+        clearTimeout(newAlertTimer);
+        newAlertTimer = setTimeout(() => {
+            showNewAlertPopup(pendingNewAlerts);
+            pendingNewAlerts = 0;
+            loadAlerts(currentPage);
+            loadArchivedAlerts(1);
+        }, 1000);
+    });
 }
 
 async function checkForNewAlerts() {
     try {
-        const response = await fetch('/api/alerts?facilities=' + selectedFacilities.join(',') + '&page=1&per_page=100');
+        const response = await fetch('/api/alerts?facilities=' + selectedFacilities.join(',') + '&page=1&per_page=1');
         const data = await response.json();
         
         if (data.success) {
@@ -2316,8 +2236,15 @@ async function uploadDocuments() {
         const response = await fetch('/api/chatbot/upload', {method: 'POST', body: formData});
         const data = await response.json();
         if (data.success) {
-            alert(data.message);
             fileInput.value = '';
+            // Upload and sync continue in the background; follow the job until it settles
+            const job = await waitForUploadJob(data.job_id, uploadBtn);
+            if (job && job.status === 'complete') {
+                const uploaded = job.files.filter(f => f.status === 'uploaded' || f.status === 'unchanged').length;
+                alert(`Uploaded ${uploaded} of ${job.files.length} file(s) and synced knowledge base`);
+            } else if (job) {
+                alert('Upload failed: ' + job.message);
+            }
         } else {
             alert('Upload failed: ' + data.message);
         }
@@ -2329,6 +2256,30 @@ async function uploadDocuments() {
     }
 }
 
+const UPLOAD_STATUS_LABELS = {
+    uploading: 'Uploading...',
+    queued: 'Waiting to sync...',
+    ingesting: 'Syncing knowledge base...'
+};
+
+// Poll an upload job until it is complete or failed, showing progress on the button
+async function waitForUploadJob(jobId, uploadBtn) {
+    while (true) {
+        const response = await fetch(`/api/chatbot/upload/${jobId}`);
+        const data = await response.json();
+        if (!data.success) {
+            alert('Upload status unavailable: ' + data.message);
+            return null;
+        }
+        const job = data.job;
+        if (job.status === 'complete' || job.status === 'failed') {
+            return job;
+        }
+        uploadBtn.innerHTML = `<span class="spinner-border spinner-border-sm me-1"></span>${UPLOAD_STATUS_LABELS[job.status] || 'Processing...'}`;
+        await new Promise(resolve => setTimeout(resolve, 3000));
+    }
+}
+
 async function sendMessage() {
     const input = document.getElementById('chatInput');
     const question = input.value.trim();
@@ -2338,6 +2289,16 @@ async function sendMessage() {
     input.value = '';
     const typingId = addTypingIndicator();
     
+    // Stream the answer when the browser supports reading response bodies
+    if (window.ReadableStream && window.TextDecoder) {
+        try {
+            await streamAnswer(question, typingId);
+            return;
+        } catch (error) {
+            console.error('Streaming answer failed, falling back:', error);
+        }
+    }
+    
     try {
         const response = await fetch('/api/chatbot/query', {
             method: 'POST',
@@ -2358,6 +2319,74 @@ async function sendMessage() {
     }
 }
 
+// Render an answer as it streams from /api/chatbot/query/stream (Server-Sent Events over fetch)
+async function streamAnswer(question, typingId) {
+    const response = await fetch('/api/chatbot/query/stream', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({question: question})
+    });
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!response.ok || !response.body || !contentType.startsWith('text/event-stream')) {
+        throw new Error('Streaming unavailable');
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const messagesContainer = document.getElementById('chatMessages');
+    let textDiv = null;
+    let buffer = '';
+    
+    const showText = (text) => {
+        if (!textDiv) {
+            removeTypingIndicator(typingId);
+            addMessageToChat('', 'bot');
+            textDiv = messagesContainer.lastElementChild.firstElementChild;
+        }
+        textDiv.textContent = text;
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    };
+    
+    let answer = '';
+    try {
+        while (true) {
+            const {done, value} = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, {stream: true});
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                let data = '';
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                if (!data) continue;
+                const payload = JSON.parse(data);
+                
+                if (event === 'token') {
+                    answer += payload.text;
+                    showText(answer);
+                } else if (event === 'done') {
+                    showText(payload.answer);
+                } else if (event === 'error') {
+                    removeTypingIndicator(typingId);
+                    addMessageToChat('Error: ' + payload.message, 'bot');
+                }
+            }
+        }
+    } catch (error) {
+        // The request already reached the server, so report instead of retrying
+        removeTypingIndicator(typingId);
+        addMessageToChat('Network error: ' + error.message, 'bot');
+    }
+    removeTypingIndicator(typingId);
+}
+
 function addMessageToChat(message, type) {
     const messagesContainer = document.getElementById('chatMessages');
     const welcome = messagesContainer.querySelector('.text-center');
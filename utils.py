@@ -1,106 +1,255 @@
 """
 Utility functions for S3, SES, and database operations
 """
-import boto3
 import os
+import json
+import time
+import uuid
 from datetime import datetime
 from dotenv import load_dotenv
+from write_behind import WriteBehindQueue
+from cache import make_cache
+from aws_clients import get_client
+from email_dispatch import EmailDispatcher
 
 load_dotenv()
 
 # AWS clients
-s3_client = boto3.client('s3', region_name=os.getenv('AWS_REGION'))
-ses_client = boto3.client('ses', region_name=os.getenv('AWS_REGION'))
+s3_client = get_client('s3')
+ses_client = get_client('ses')
+
+# Admin activity log
+# Activities are queued on a write-behind queue and flushed by a background
+# thread. Every flush writes its lines as a new immutable segment object,
+# activity/{admin_id}/{inverted_ms}-{id}.json, so concurrent writers never
+# read-modify-write the same object. Inverting the timestamp makes S3 list
+# the newest segment first, and readers merge segments newest first until
+# they have ACTIVITY_TAIL_SIZE lines. Once an admin has more than
+# ACTIVITY_MAX_SEGMENTS segments, the older half is folded into a single
+# activity/{admin_id}/compacted-{newest source}.json object (which lists
+# after every regular segment) and the sources are deleted. Compacted
+# objects keep each source's lines under its key, so a reader that sees a
+# source and its compacted copy at the same time skips the duplicate.
+ACTIVITY_PREFIX = 'activity'
+ACTIVITY_TAIL_SIZE = 10
+ACTIVITY_TIMESTAMP_CEILING = 10 ** 13
+ACTIVITY_COMPACTED = 'compacted-'
+ACTIVITY_MAX_SEGMENTS = max(int(os.getenv('ACTIVITY_MAX_SEGMENTS', '20')), 2)
+
+def activity_segment_prefix(admin_id):
+    """S3 prefix holding an admin's activity segments"""
+    return f"{ACTIVITY_PREFIX}/{admin_id}/"
+
+def activity_segment_key(admin_id):
+    """Key for a new segment; sorts before every older segment"""
+    inverted = ACTIVITY_TIMESTAMP_CEILING - int(time.time() * 1000)
+    return f"{activity_segment_prefix(admin_id)}{inverted:013d}-{uuid.uuid4().hex[:8]}.json"
+
+def list_activity_segments(bucket, admin_id):
+    """Segment keys for an admin, newest first (compacted segments last)"""
+    keys = []
+    kwargs = {'Bucket': bucket, 'Prefix': activity_segment_prefix(admin_id)}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        keys.extend(item['Key'] for item in response.get('Contents', []))
+        if not response.get('IsTruncated'):
+            return keys
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+def read_activity_segment(bucket, key):
+    """Return a segment's (source key, lines) entries, newest first; [] if it was compacted away"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return []
+    segment = json.loads(response['Body'].read().decode('utf-8'))
+    if 'segments' in segment:
+        return [(source, lines) for source, lines in segment['segments']]
+    return [(key, segment.get('lines', []))]
+
+def read_activity_tail(bucket, admin_id):
+    """Return the latest activity lines (oldest first), merged from the newest segments"""
+    chunks = []
+    count = 0
+    seen = set()
+    for key in list_activity_segments(bucket, admin_id):
+        if count >= ACTIVITY_TAIL_SIZE:
+            break
+        for source, lines in read_activity_segment(bucket, key):
+            if source not in seen:
+                seen.add(source)
+                chunks.append(lines)
+                count += len(lines)
+    
+    if count < ACTIVITY_TAIL_SIZE:
+        # Older history may still be in the legacy single-file log
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=f"{admin_id}.txt")
+            content = response['Body'].read().decode('utf-8')
+            chunks.append([line for line in content.strip().split('\n') if line])
+        except s3_client.exceptions.NoSuchKey:
+            pass
+    
+    lines = [line for chunk in reversed(chunks) for line in chunk]
+    return lines[-ACTIVITY_TAIL_SIZE:]
+
+def compact_activity_segments(bucket, admin_id):
+    """Fold the older half of an admin's segments into one compacted segment once there are too many"""
+    keys = list_activity_segments(bucket, admin_id)
+    if len(keys) <= ACTIVITY_MAX_SEGMENTS:
+        return
+    sources = keys[ACTIVITY_MAX_SEGMENTS // 2:]
+    entries = []
+    seen = set()
+    for key in sources:
+        for source, lines in read_activity_segment(bucket, key):
+            if source not in seen:
+                seen.add(source)
+                entries.append([source, lines])
+    
+    newest = sources[0][len(activity_segment_prefix(admin_id)):]
+    if not newest.startswith(ACTIVITY_COMPACTED):
+        newest = ACTIVITY_COMPACTED + newest
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=activity_segment_prefix(admin_id) + newest,
+        Body=json.dumps({'segments': entries}).encode('utf-8')
+    )
+    # The compacted copy is in place before any source disappears
+    for key in sources:
+        if key != activity_segment_prefix(admin_id) + newest:
+            s3_client.delete_object(Bucket=bucket, Key=key)
+    print(f"✓ Compacted {len(sources)} activity segments for admin {admin_id}")
+
+def write_activity_segments(items):
+    """Write-behind handler: one new immutable segment per admin for a batch of queued activities"""
+    bucket = os.getenv('ADMIN_ACTIVITY_BUCKET_NAME')
+    lines_by_admin = {}
+    for item in items:
+        lines_by_admin.setdefault(item['admin_id'], []).append(item['line'])
+    
+    for admin_id, lines in lines_by_admin.items():
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=activity_segment_key(admin_id),
+            Body=json.dumps({'lines': lines}).encode('utf-8')
+        )
+    
+    # Compaction failures must not make the queue re-send lines already written
+    for admin_id in lines_by_admin:
+        try:
+            compact_activity_segments(bucket, admin_id)
+        except Exception as e:
+            print(f"⚠ Could not compact activity segments for admin {admin_id}: {e}")
+
+activity_queue = WriteBehindQueue(
+    'activity-log',
+    write_activity_segments,
+    batch_size=int(os.getenv('ACTIVITY_BATCH_SIZE', '50')),
+    flush_interval=float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '2')),
+    max_items=int(os.getenv('ACTIVITY_QUEUE_MAX', '10000')),
+    spool_path=os.getenv('ACTIVITY_SPOOL_PATH') or None
+)
 
 def get_admin_activities(admin_id):
-    """Fetch admin activity history from S3"""
+    """Fetch the last 10 admin activities (newest first) from the newest S3 segments"""
     try:
         bucket = os.getenv('ADMIN_ACTIVITY_BUCKET_NAME')
-        key = f"{admin_id}.txt"
         
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-        content = response['Body'].read().decode('utf-8')
-        
-        # Parse activities (each line is an activity)
-        activities = []
-        for line in content.strip().split('\n'):
-            if line:
-                activities.append(line)
+        # Include lines still queued in this process
+        pending = [item['line'] for item in activity_queue.snapshot() if item['admin_id'] == admin_id]
+        activities = read_activity_tail(bucket, admin_id) + pending
         
         # Return last 10 activities in reverse order (newest first)
-        return list(reversed(activities[-10:]))
-    except s3_client.exceptions.NoSuchKey:
-        return []
+        return list(reversed(activities[-ACTIVITY_TAIL_SIZE:]))
     except Exception as e:
         print(f"Error fetching activities: {e}")
         return []
 
 def log_admin_activity(admin_id, activity):
-    """Log admin activity to S3"""
+    """Queue an admin activity for the append-only S3 activity log"""
     try:
-        bucket = os.getenv('ADMIN_ACTIVITY_BUCKET_NAME')
-        key = f"{admin_id}.txt"
-        
         timestamp = datetime.now().strftime('%Y-%m-%d %I:%M %p')
-        activity_line = f"{activity} - {timestamp}\n"
-        
-        # Try to get existing content
-        try:
-            response = s3_client.get_object(Bucket=bucket, Key=key)
-            existing_content = response['Body'].read().decode('utf-8')
-        except s3_client.exceptions.NoSuchKey:
-            existing_content = ""
-        
-        # Append new activity
-        new_content = existing_content + activity_line
-        
-        s3_client.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=new_content.encode('utf-8')
-        )
-        
+        activity_line = f"{activity} - {timestamp}"
+        activity_queue.put({'admin_id': admin_id, 'line': activity_line})
         return True
     except Exception as e:
         print(f"Error logging activity: {e}")
         return False
 
-def get_recommendation_from_s3(alert_id, patient_id=None):
-    """Fetch recommendation text from S3 - tries new format first, falls back to old format"""
+# Recommendation cache
+# Recommendations never change once written, so they are cached for a long
+# TTL and stored at write time. Missing recommendations are cached briefly
+# (as an empty string) because the monitor saves them shortly after the alert.
+recommendation_cache = make_cache(
+    os.getenv('RECOMMENDATION_CACHE_BACKEND', 'memory'),
+    ttl=int(os.getenv('RECOMMENDATION_CACHE_TTL', '604800')),
+    max_entries=int(os.getenv('RECOMMENDATION_CACHE_MAX_ENTRIES', '2000')),
+    path=os.getenv('RECOMMENDATION_CACHE_PATH', 'cache/recommendation_cache.sqlite3')
+)
+RECOMMENDATION_NEGATIVE_TTL = int(os.getenv('RECOMMENDATION_NEGATIVE_TTL', '30'))
+MISSING_RECOMMENDATION = ''
+
+def recommendation_key(alert_id, patient_id):
+    """S3 key a recommendation is saved under"""
+    return f"{alert_id}_{patient_id}_recommendation.txt"
+
+def recommendation_cache_key(alert_id):
+    """Cache key for an alert's recommendation"""
+    return f"recommendation:{alert_id}"
+
+def fetch_recommendation_object(bucket, key):
+    """GET one recommendation object; returns None if it does not exist"""
+    print(f"  Fetching from S3: s3://{bucket}/{key}")
     try:
-        bucket = os.getenv('RECOMMENDATION_BUCKET_NAME')
-        
-        # Try new format with patient_id if provided
-        if patient_id:
-            key = f"{alert_id}_{patient_id}_recommendation.txt"
-            print(f"  Fetching from S3: s3://{bucket}/{key}")
-            try:
-                response = s3_client.get_object(Bucket=bucket, Key=key)
-                content = response['Body'].read().decode('utf-8')
-                print(f"  ✓ Successfully fetched recommendation ({len(content)} bytes)")
-                return content
-            except s3_client.exceptions.NoSuchKey:
-                print(f"  ⚠ New format not found, trying old format...")
-        
-        # Fall back to old format (for backward compatibility)
-        key = f"{alert_id}_recommendation.txt"
-        print(f"  Fetching from S3: s3://{bucket}/{key}")
         response = s3_client.get_object(Bucket=bucket, Key=key)
-        content = response['Body'].read().decode('utf-8')
-        print(f"  ✓ Successfully fetched recommendation ({len(content)} bytes)")
-        return content
     except s3_client.exceptions.NoSuchKey:
-        print(f"  ❌ File not found: s3://{bucket}/{key}")
+        print(f"  ⚠ File not found: s3://{bucket}/{key}")
         return None
+    content = response['Body'].read().decode('utf-8')
+    print(f"  ✓ Successfully fetched recommendation ({len(content)} bytes)")
+    return content
+
+def get_recommendation_from_s3(alert_id, patient_id=None, key=None):
+    """
+    Fetch recommendation text through the recommendation cache
+    key is alert.recommendation_key: the exact S3 key, '' when it is known
+    that no recommendation exists, or None for alerts the key migration has
+    not resolved yet (the new then old filename formats are tried).
+    """
+    try:
+        cache_key = recommendation_cache_key(alert_id)
+        if recommendation_cache:
+            cached = recommendation_cache.get(cache_key)
+            if cached is not None:
+                return cached or None
+        
+        bucket = os.getenv('RECOMMENDATION_BUCKET_NAME')
+        content = None
+        if key:
+            content = fetch_recommendation_object(bucket, key)
+        elif key is None:
+            # Unresolved key: try new format with patient_id, then old format
+            if patient_id:
+                content = fetch_recommendation_object(bucket, recommendation_key(alert_id, patient_id))
+            if content is None:
+                content = fetch_recommendation_object(bucket, f"{alert_id}_recommendation.txt")
+        
+        if recommendation_cache:
+            if content is None:
+                recommendation_cache.set(cache_key, MISSING_RECOMMENDATION, ttl=RECOMMENDATION_NEGATIVE_TTL)
+            else:
+                recommendation_cache.set(cache_key, content)
+        return content
     except Exception as e:
         print(f"  ❌ Error fetching recommendation: {e}")
         return None
 
 def save_recommendation_to_s3(alert_id, recommendation_text, patient_id):
-    """Save recommendation text to S3 with patient_id in filename"""
+    """Save recommendation text to S3 with patient_id in filename; returns the key or None"""
     try:
         bucket = os.getenv('RECOMMENDATION_BUCKET_NAME')
-        key = f"{alert_id}_{patient_id}_recommendation.txt"
+        key = recommendation_key(alert_id, patient_id)
         
         print(f"  Saving to S3: s3://{bucket}/{key}")
         s3_client.put_object(
@@ -110,28 +259,28 @@ def save_recommendation_to_s3(alert_id, recommendation_text, patient_id):
         )
         print(f"  ✓ Successfully saved recommendation ({len(recommendation_text)} bytes)")
         
-        return True
+        # Populate the cache so the first dashboard read needs no S3 call
+        if recommendation_cache:
+            recommendation_cache.set(recommendation_cache_key(alert_id), recommendation_text)
+        
+        return key
     except Exception as e:
         print(f"  ❌ Error saving recommendation: {e}")
-        return False
+        return None
 
-def send_email_ses(to_emails, subject, body, attachments=None):
-    """Send email via AWS SES"""
-    try:
-        sender = os.getenv('SES_SENDER_EMAIL')
-        
-        # For simplicity, sending text email without attachments
-        # Full attachment support would require MIME multipart
-        response = ses_client.send_email(
-            Source=sender,
-            Destination={'ToAddresses': to_emails},
-            Message={
-                'Subject': {'Data': subject, 'Charset': 'UTF-8'},
-                'Body': {'Text': {'Data': body, 'Charset': 'UTF-8'}}
-            }
-        )
-        
-        return True, response['MessageId']
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False, str(e)
+# Care team email
+# Messages go out as raw MIME through a queued, rate-limited dispatcher.
+# SES_MAX_SEND_RATE pins the send rate; unset, the account's MaxSendRate
+# from get_send_quota is used. Either way it is split evenly across the
+# WEB_CONCURRENCY web worker processes (gunicorn's own setting). Point AWS_ENDPOINT_URL_SES at a local SES
+# stand-in to exercise it without sending real mail.
+email_dispatcher = EmailDispatcher(
+    ses_client,
+    os.getenv('SES_SENDER_EMAIL'),
+    max_send_rate=float(os.getenv('SES_MAX_SEND_RATE')) if os.getenv('SES_MAX_SEND_RATE') else None,
+    workers=int(os.getenv('EMAIL_WORKERS', '2')),
+    max_retries=int(os.getenv('EMAIL_MAX_RETRIES', '5')),
+    backoff_base=float(os.getenv('EMAIL_BACKOFF_BASE', '1')),
+    backoff_max=float(os.getenv('EMAIL_BACKOFF_MAX', '30')),
+    processes=int(os.getenv('WEB_CONCURRENCY', '1'))
+)
@@ -0,0 +1,175 @@
+"""
+Write-behind queue for side effects that should not block a request
+Items are handed to a batch handler on a background thread, retried with
+exponential backoff, and optionally spooled to a local file so they
+survive a crash or restart (delivery is at-least-once)
+"""
+import atexit
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+class WriteBehindQueue:
+    """
+    Background batching queue
+    handler(items) is called with up to batch_size items and must raise on
+    failure. Items must be JSON-serializable when a spool_path is given.
+    """
+
+    def __init__(self, name, handler, batch_size=50, flush_interval=2.0, max_items=10000,
+                 max_retries=5, backoff_base=0.5, backoff_max=30.0, spool_path=None):
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.spool_path = spool_path
+
+        self._items = deque()
+        self._in_flight = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._closing = False
+        self._thread = None
+        self._stats = {
+            'enqueued': 0,
+            'delivered': 0,
+            'dropped': 0,
+            'retries': 0,
+            'failed_batches': 0,
+            'batches': 0,
+            'replayed': 0
+        }
+
+        if self.spool_path:
+            self._replay_spool()
+        atexit.register(self.close)
+
+    def _replay_spool(self):
+        """Load items left in the spool file by a previous process"""
+        if not os.path.exists(self.spool_path):
+            os.makedirs(os.path.dirname(os.path.abspath(self.spool_path)), exist_ok=True)
+            return
+        with open(self.spool_path, 'r', encoding='utf-8') as spool:
+            for line in spool:
+                line = line.strip()
+                if line:
+                    try:
+                        self._items.append(json.loads(line))
+                    except ValueError:
+                        continue
+        self._stats['replayed'] = len(self._items)
+        if self._items:
+            print(f"↻ {self.name}: replaying {len(self._items)} spooled item(s)")
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        """Start the background worker if it is not running (caller may hold the lock)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, item):
+        """Queue an item; returns False if it was dropped because the queue is full"""
+        with self._lock:
+            if len(self._items) >= self.max_items:
+                self._stats['dropped'] += 1
+                print(f"⚠ {self.name}: queue full ({self.max_items} items), dropping item")
+                return False
+            self._items.append(item)
+            self._stats['enqueued'] += 1
+            if self.spool_path:
+                with open(self.spool_path, 'a', encoding='utf-8') as spool:
+                    spool.write(json.dumps(item, default=str) + '\n')
+            if len(self._items) >= self.batch_size:
+                self._wakeup.set()
+            self._ensure_thread()
+        return True
+
+    def snapshot(self):
+        """Items not yet delivered, including the batch currently being written"""
+        with self._lock:
+            return list(self._in_flight) + list(self._items)
+
+    def _deliver(self, batch):
+        """Run the handler with retries; returns True on success"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.handler(batch)
+                return True
+            except Exception as e:
+                # At shutdown spooled items are safe on disk, so don't hold up exit
+                if attempt == self.max_retries or (self._closing and self.spool_path):
+                    print(f"❌ {self.name}: giving up on batch of {len(batch)} after {attempt + 1} attempt(s): {e}")
+                    return False
+                delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+                delay *= random.uniform(0.5, 1.0)
+                with self._lock:
+                    self._stats['retries'] += 1
+                print(f"⚠ {self.name}: write failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        return False
+
+    def flush(self):
+        """Deliver everything currently queued"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._items:
+                        break
+                    count = min(self.batch_size, len(self._items))
+                    self._in_flight = [self._items.popleft() for _ in range(count)]
+                    batch = list(self._in_flight)
+
+                delivered = self._deliver(batch)
+                with self._lock:
+                    self._in_flight = []
+                    self._stats['batches'] += 1
+                    if delivered:
+                        self._stats['delivered'] += len(batch)
+                    else:
+                        self._stats['failed_batches'] += 1
+                        if self.spool_path:
+                            # Keep undelivered items spooled for the next process
+                            self._items.extendleft(reversed(batch))
+                            break
+                    if self.spool_path and not self._items:
+                        open(self.spool_path, 'w', encoding='utf-8').close()
+
+    def _run(self):
+        """Background delivery loop"""
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ {self.name}: flush error: {e}")
+
+    def close(self):
+        """Flush remaining items and stop the background thread"""
+        if self._stopped:
+            return
+        self._closing = True
+        try:
+            self.flush()
+        finally:
+            self._stopped = True
+            self._wakeup.set()
+
+    def get_stats(self):
+        """Return queue depth and delivery counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = len(self._items)
+            stats['in_flight'] = len(self._in_flight)
+            stats['spooled'] = bool(self.spool_path)
+        return stats